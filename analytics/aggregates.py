@@ -0,0 +1,124 @@
+"""
+Page aggregates over a filtered sales frame
+
+Pure functions (no Streamlit) so that each dashboard section can be cached on
+exactly the inputs it uses: the sidebar filters plus its own parameters.
+"""
+
+
+import pandas as pd
+from typing import Dict, Tuple
+from analytics.charts import MAX_TREEMAP_LEAVES, top_n_other
+from analytics.instrument import instrumented
+
+
+DISCOUNT_BINS = (0, 0.05, 0.10, 0.15, 0.20, 0.25, 1.0)
+DISCOUNT_LABELS = ("0-5%", "5-10%", "10-15%", "15-20%", "20-25%", "25%+")
+
+
+@instrumented()
+def kpis(f: pd.DataFrame) -> Dict[str, float]:
+    """Total net sales, orders, distinct customers and average order value"""
+    total_sales = f['net_sales'].sum()
+    orders = f['order_id'].nunique()
+    return {
+        'total_sales': total_sales,
+        'orders': orders,
+        'customers': f['customer_id'].nunique(),
+        'aov': total_sales / orders if orders else 0,
+    }
+
+
+@instrumented()
+def trend(f: pd.DataFrame, period: str) -> pd.DataFrame:
+    """Net sales and orders per period ('month', 'quarter' or 'year')"""
+    return (
+        f.groupby(period)
+         .agg(net_sales=('net_sales', 'sum'), orders=('order_id', 'nunique'))
+         .reset_index()
+         .sort_values(by=period)
+    )
+
+
+@instrumented()
+def top_products(f: pd.DataFrame, measure: str, n: int = 10) -> pd.DataFrame:
+    """Top n products by a summed measure ('net_sales' or 'quantity')"""
+    return (
+        f.groupby('product_name')
+         .agg(**{measure: (measure, 'sum')})
+         .reset_index()
+         .sort_values(by=measure, ascending=False)
+         .head(n)
+    )
+
+
+@instrumented()
+def brand_category(f: pd.DataFrame, max_leaves: int = MAX_TREEMAP_LEAVES) -> pd.DataFrame:
+    """Net sales per brand × category, capped at max_leaves categories per brand"""
+    brand_cat = (
+        f.groupby(['brand_name', 'category_name'])
+         .agg(net_sales=('net_sales', 'sum'))
+         .reset_index()
+    )
+    return top_n_other(brand_cat, 'category_name', 'net_sales', n=max_leaves, by='brand_name')
+
+
+@instrumented()
+def discount_effect(f: pd.DataFrame, bins: Tuple[float, ...] = DISCOUNT_BINS,
+                    labels: Tuple[str, ...] = DISCOUNT_LABELS) -> pd.DataFrame:
+    """Quantity and net sales per discount range ([lo, hi) bins)"""
+    discount_range = pd.cut(f['discount'], bins=list(bins), labels=list(labels),
+                            include_lowest=True, right=False)
+    return (
+        f.groupby(discount_range)
+         .agg(total_qty=('quantity', 'sum'), total_sales=('net_sales', 'sum'))
+         .rename_axis('discount_range')
+         .reset_index()
+    )
+
+
+@instrumented()
+def repeat_rates(f: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Repeat-purchase rate per city and per state.
+
+    Returns:
+        (repeat_city, repeat_state) with repeat_rate (share of customers with
+        more than one order) and customers (distinct customers)
+    """
+    cust_orders = (
+        f.groupby('customer_id', as_index=False)
+         .agg(order_count=('order_id', 'nunique'),
+              customer_city=('customer_city', 'first'),
+              customer_state=('customer_state', 'first'))
+    )
+    cust_orders['is_repeat'] = cust_orders['order_count'] > 1
+    repeat_city = cust_orders.groupby('customer_city', as_index=False) \
+                             .agg(repeat_rate=('is_repeat', 'mean'),
+                                  customers=('customer_id', 'nunique'))
+    repeat_state = cust_orders.groupby('customer_state', as_index=False) \
+                              .agg(repeat_rate=('is_repeat', 'mean'),
+                                   customers=('customer_id', 'nunique'))
+    return repeat_city, repeat_state
+
+
+@instrumented()
+def store_performance(f: pd.DataFrame) -> pd.DataFrame:
+    """Net sales and orders per store, best first"""
+    return (
+        f.groupby('store_name', as_index=False)
+         .agg(net_sales=('net_sales', 'sum'), orders=('order_id', 'nunique'))
+         .sort_values('net_sales', ascending=False)
+    )
+
+
+@instrumented()
+def staff_ranking(f: pd.DataFrame, staffs: pd.DataFrame, n: int = 10) -> pd.DataFrame:
+    """Top n staff by net sales, with their order counts"""
+    return (
+        f.merge(staffs[['staff_id', 'staff_fullname']], on='staff_id', how='left')
+         .groupby('staff_fullname', as_index=False)
+         .agg(net_sales=('net_sales', 'sum'), orders=('order_id', 'nunique'))
+         .sort_values('net_sales', ascending=False)
+         .head(n)
+    )
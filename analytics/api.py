@@ -0,0 +1,166 @@
+"""
+Headless HTTP/JSON API over the dashboard aggregates
+
+Serves the numbers the Streamlit pages show (KPIs, trends, top products,
+store/staff ranking, repeat rates, ...) to other tools. Filters mirror the
+sidebar:
+
+    start, end              ISO dates (default: full range)
+    store, brand, category  repeatable, e.g. ?brand=Trek&brand=Electra
+
+Endpoint parameters are validated: period and measure against CHOICES, n
+against RANGES (1-100); anything else is a 400.
+
+Every response carries X-Warehouse-Version and an ETag; clients that send
+If-None-Match get 304 until the warehouse is reloaded. /metrics serves the
+analytics.instrument timings in Prometheus format when BIKESTORE_INSTRUMENT=1.
+
+Run locally:
+    python -m analytics.api --db data_cube/bikestore.duckdb --port 8000
+"""
+
+
+import argparse
+import hashlib
+import json
+import numpy as np
+import pandas as pd
+from datetime import date
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+from analytics import instrument
+from analytics.sales import freeze_filters
+from analytics.service import AggregateService
+
+
+DB_PATH = "data_cube/bikestore.duckdb"
+
+# endpoint -> (aggregate name, {query parameter: (type, default)})
+ENDPOINTS = {
+    'kpis':           ('kpis', {}),
+    'trend':          ('trend', {'period': (str, 'month')}),
+    'top-products':   ('top_products', {'measure': (str, 'net_sales'), 'n': (int, 10)}),
+    'brand-category': ('brand_category', {}),
+    'discount':       ('discount_effect', {}),
+    'stores':         ('store_performance', {}),
+    'staff':          ('staff_ranking', {'n': (int, 10)}),
+    'repeat-rates':   ('repeat_rates', {}),
+}
+
+# Allowed values for string parameters that end up as column names
+CHOICES = {
+    'period': ('month', 'quarter', 'year'),
+    'measure': ('net_sales', 'quantity'),
+}
+# Inclusive bounds for integer parameters (every distinct value is its own cached result)
+RANGES = {
+    'n': (1, 100),
+}
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def _jsonable(result):
+    """Aggregate result (frame, dict or tuple of frames) as plain JSON types"""
+    if isinstance(result, pd.DataFrame):
+        return json.loads(result.to_json(orient='records', date_format='iso'))
+    if isinstance(result, tuple):
+        return [_jsonable(r) for r in result]
+    if isinstance(result, dict):
+        return {k: v.item() if isinstance(v, np.generic) else v for k, v in result.items()}
+    return result
+
+
+def _parse_filters(request: Request, wh) -> tuple:
+    q = request.query_params
+    try:
+        start = date.fromisoformat(q['start']) if 'start' in q else wh.min_date.date()
+        end = date.fromisoformat(q['end']) if 'end' in q else wh.max_date.date()
+    except ValueError as e:
+        raise BadRequest(f"invalid date: {e}")
+    return freeze_filters((start, end), q.getlist('store'), q.getlist('brand'), q.getlist('category'))
+
+
+def _parse_params(request: Request, spec: dict) -> dict:
+    params = {}
+    for name, (typ, default) in spec.items():
+        raw = request.query_params.get(name)
+        try:
+            value = default if raw is None else typ(raw)
+        except ValueError:
+            raise BadRequest(f"invalid {name}: {raw!r}")
+        if name in CHOICES and value not in CHOICES[name]:
+            raise BadRequest(f"{name} must be one of {', '.join(CHOICES[name])}")
+        if name in RANGES and not RANGES[name][0] <= value <= RANGES[name][1]:
+            raise BadRequest(f"{name} must be between {RANGES[name][0]} and {RANGES[name][1]}")
+        params[name] = value
+    return params
+
+
+def _etag(version: str, endpoint: str, filters: tuple, params: dict) -> str:
+    key = json.dumps([version, endpoint, filters, sorted(params.items())], default=str)
+    return '"' + hashlib.blake2b(key.encode(), digest_size=12).hexdigest() + '"'
+
+
+def create_app(db_path: str = DB_PATH) -> Starlette:
+    """Starlette app serving ENDPOINTS from one shared AggregateService"""
+    service = AggregateService(db_path)
+
+    async def handle(request: Request) -> Response:
+        endpoint = request.path_params['endpoint']
+        if endpoint not in ENDPOINTS:
+            return JSONResponse({'error': f"unknown endpoint {endpoint!r}"}, status_code=404)
+        name, spec = ENDPOINTS[endpoint]
+
+        # Loading the warehouse and aggregating are blocking; keep them off the event loop
+        version, wh = await run_in_threadpool(service.warehouse)
+        try:
+            filters = _parse_filters(request, wh)
+            params = _parse_params(request, spec)
+        except BadRequest as e:
+            return JSONResponse({'error': str(e)}, status_code=400)
+
+        def headers_for(version: str) -> dict:
+            etag = _etag(version, endpoint, filters, params)
+            return {'ETag': etag, 'X-Warehouse-Version': version, 'Cache-Control': 'no-cache'}
+
+        headers = headers_for(version)
+        if request.headers.get('if-none-match') == headers['ETag']:
+            return Response(status_code=304, headers=headers)
+
+        # The ETL may reload between the two calls: tag the body with the version it was computed on
+        version, result = await run_in_threadpool(service.get, name, filters, **params)
+        return JSONResponse(_jsonable(result), headers=headers_for(version))
+
+    async def health(request: Request) -> Response:
+        version, _ = await run_in_threadpool(service.warehouse)
+        return JSONResponse({'status': 'ok', **service.stats()}, headers={'X-Warehouse-Version': version})
+
+    async def metrics(request: Request) -> Response:
+        return PlainTextResponse(instrument.prometheus_text(), media_type='text/plain; version=0.0.4')
+
+    return Starlette(routes=[
+        Route('/health', health),
+        Route('/metrics', metrics),
+        Route('/{endpoint}', handle),
+    ])
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Bikestore aggregate API")
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.db), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
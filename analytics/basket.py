@@ -0,0 +1,259 @@
+"""
+Market-basket co-occurrence per month
+
+fact_sales is at order-line grain, so each month's orders form a sparse binary
+order x product matrix X. X.T @ X is the product x product co-occurrence
+matrix: the diagonal counts orders per product and every off-diagonal entry
+counts orders containing both products, with no Python loop over pairs. From
+those counts:
+
+    support(A, B)    = orders(A and B) / orders
+    confidence(A->B) = orders(A and B) / orders(A)
+    lift(A, B)       = confidence(A->B) / (orders(B) / orders)
+
+The batch job writes the monthly counts and metrics to their own DuckDB file
+(data_cube/basket.duckdb, outside the warehouse so its version is unchanged):
+
+    python -m analytics.basket --db data_cube/bikestore.duckdb
+
+Every order belongs to exactly one month, so order and pair counts add up
+across months: bought_together() answers any month range for any product by
+summing the stored counts and recomputing the metrics.
+"""
+
+
+import argparse
+import logging
+import os
+import time
+from datetime import date, datetime
+from typing import Dict
+import duckdb as dd
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from analytics.warehouse import fetch_pandas, warehouse_version
+
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = "data_cube/bikestore.duckdb"
+DEFAULT_OUT = "data_cube/basket.duckdb"
+# Pairs bought together in fewer orders than this in a month are not stored
+MIN_PAIR_ORDERS = 1
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS basket_months (month DATE, orders BIGINT);
+    CREATE TABLE IF NOT EXISTS basket_products (month DATE, product_id BIGINT, orders BIGINT);
+    CREATE TABLE IF NOT EXISTS basket_pairs (
+        month DATE, product_id BIGINT, other_product_id BIGINT, orders BIGINT,
+        support DOUBLE, confidence DOUBLE, lift DOUBLE
+    );
+    CREATE TABLE IF NOT EXISTS basket_items (product_id BIGINT, product_name VARCHAR);
+    CREATE TABLE IF NOT EXISTS basket_runs (
+        version VARCHAR, run_at TIMESTAMP, seconds DOUBLE, months INTEGER, pairs BIGINT
+    );
+"""
+
+ORDER_PRODUCTS_SQL = """
+    SELECT DISTINCT date_trunc('month', order_date)::DATE AS month, order_id, product_id
+    FROM fact_sales
+    WHERE order_id IS NOT NULL AND product_id IS NOT NULL AND order_date IS NOT NULL
+"""
+
+
+def cooccurrence(order_ids: np.ndarray, product_ids: np.ndarray, min_orders: int = MIN_PAIR_ORDERS):
+    """
+    Product counts and pair metrics for one set of order lines.
+
+    Args:
+        order_ids: Order of each line
+        product_ids: Product of each line
+        min_orders: Smallest pair count kept
+    Returns:
+        (orders, products frame [product_id, orders],
+         pairs frame [product_id, other_product_id, orders, support, confidence, lift]),
+        with every pair in both directions
+    """
+    orders, order_idx = np.unique(order_ids, return_inverse=True)
+    products, product_idx = np.unique(product_ids, return_inverse=True)
+    x = sparse.csr_matrix(
+        (np.ones(len(order_idx), dtype=np.int32), (order_idx, product_idx)),
+        shape=(len(orders), len(products)),
+    )
+    # ซื้อสินค้าเดียวกันหลายบรรทัดในออเดอร์เดียว = 1
+    x.sum_duplicates()
+    x.data[:] = 1
+
+    n = len(orders)
+    product_orders = np.asarray(x.sum(axis=0)).ravel()
+    co = (x.T @ x).tocoo()
+    keep = (co.row != co.col) & (co.data >= min_orders)
+    a, b, both = co.row[keep], co.col[keep], co.data[keep].astype(np.int64)
+
+    confidence = both / product_orders[a]
+    pairs = pd.DataFrame({
+        'product_id': products[a],
+        'other_product_id': products[b],
+        'orders': both,
+        'support': both / n,
+        'confidence': confidence,
+        'lift': confidence / (product_orders[b] / n),
+    })
+    return n, pd.DataFrame({'product_id': products, 'orders': product_orders.astype(np.int64)}), pairs
+
+
+def run_batch(db_path: str = DB_PATH, out_path: str = DEFAULT_OUT, min_orders: int = MIN_PAIR_ORDERS,
+              force: bool = False) -> Dict:
+    """
+    Materialise monthly co-occurrence for the current warehouse version.
+
+    Args:
+        db_path: Warehouse to read order lines from
+        out_path: Basket database
+        min_orders: Smallest monthly pair count stored
+        force: Recompute even if this warehouse version was already processed
+    Returns:
+        Run summary {version, months, pairs, seconds, skipped}
+    """
+    started = time.perf_counter()
+    version = warehouse_version(db_path)
+    directory = os.path.dirname(out_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    out = dd.connect(out_path)
+    try:
+        out.execute(SCHEMA)
+        if not force and out.execute("SELECT count(*) FROM basket_runs WHERE version = ?", [version]).fetchone()[0]:
+            logger.info(f"Basket tables for warehouse version {version} are up to date")
+            return {'version': version, 'months': 0, 'pairs': 0, 'seconds': 0.0, 'skipped': True}
+
+        conn = dd.connect(db_path)
+        try:
+            lines = fetch_pandas(conn, ORDER_PRODUCTS_SQL)
+            items = fetch_pandas(conn, "SELECT product_id, product_name FROM dim_products")
+        finally:
+            conn.close()
+
+        months, products, pairs = [], [], []
+        for month, g in lines.groupby('month', sort=True):
+            n, p, pr = cooccurrence(g['order_id'].to_numpy(), g['product_id'].to_numpy(), min_orders)
+            months.append((month, n))
+            products.append(p.assign(month=month))
+            pairs.append(pr.assign(month=month))
+        month_frame = pd.DataFrame(months, columns=['month', 'orders'])
+        product_frame = pd.concat(products, ignore_index=True) if products else pd.DataFrame(
+            columns=['product_id', 'orders', 'month'])
+        pair_frame = pd.concat(pairs, ignore_index=True) if pairs else pd.DataFrame(
+            columns=['product_id', 'other_product_id', 'orders', 'support', 'confidence', 'lift', 'month'])
+
+        out.execute("BEGIN TRANSACTION")
+        try:
+            for table in ('basket_months', 'basket_products', 'basket_pairs', 'basket_items'):
+                out.execute(f"DELETE FROM {table}")
+            out.register('month_frame', month_frame)
+            out.register('product_frame', product_frame)
+            out.register('pair_frame', pair_frame)
+            out.register('items', items)
+            out.execute("INSERT INTO basket_months SELECT month, orders FROM month_frame")
+            out.execute("INSERT INTO basket_products SELECT month, product_id, orders FROM product_frame")
+            # เรียงตาม product_id เพื่อให้ zonemap ตัดบล็อกได้ตอนค้นหาสินค้าเดียว
+            out.execute("""
+                INSERT INTO basket_pairs
+                SELECT month, product_id, other_product_id, orders, support, confidence, lift
+                FROM pair_frame ORDER BY product_id, month
+            """)
+            out.execute("INSERT INTO basket_items SELECT product_id, product_name FROM items")
+            seconds = time.perf_counter() - started
+            out.execute("INSERT INTO basket_runs VALUES (?, ?, ?, ?, ?)",
+                        [version, datetime.now(), seconds, len(month_frame), len(pair_frame)])
+            out.execute("COMMIT")
+        except Exception:
+            out.execute("ROLLBACK")
+            raise
+    finally:
+        out.close()
+    logger.info(f"Materialised {len(pair_frame)} product pairs over {len(month_frame)} months")
+    return {'version': version, 'months': len(month_frame), 'pairs': len(pair_frame),
+            'seconds': round(seconds, 3), 'skipped': False}
+
+
+def basket_items(out_path: str = DEFAULT_OUT) -> pd.DataFrame:
+    """Products that appear in at least one stored pair, by name"""
+    if not os.path.exists(out_path):
+        return pd.DataFrame()
+    conn = dd.connect(out_path)
+    try:
+        return fetch_pandas(conn, """
+            SELECT i.product_id, i.product_name
+            FROM basket_items i
+            WHERE i.product_id IN (SELECT DISTINCT product_id FROM basket_pairs)
+            ORDER BY i.product_name
+        """)
+    finally:
+        conn.close()
+
+
+def bought_together(product_id: int, start: date, end: date, out_path: str = DEFAULT_OUT,
+                    n: int = 10, min_orders: int = 2) -> pd.DataFrame:
+    """
+    Products most often bought with product_id in the months start..end.
+
+    Counts are summed over the months touched by the range and the metrics
+    recomputed, so the result is exact for whole months.
+
+    Returns:
+        [other_product_id, product_name, orders, support, confidence, lift],
+        highest lift first
+    """
+    conn = dd.connect(out_path)
+    try:
+        return fetch_pandas(conn, f"""
+            WITH bounds AS (
+                SELECT date_trunc('month', ?::DATE)::DATE AS lo, date_trunc('month', ?::DATE)::DATE AS hi
+            ),
+            totals AS (
+                SELECT SUM(orders)::DOUBLE AS orders FROM basket_months, bounds WHERE month BETWEEN lo AND hi
+            ),
+            product_orders AS (
+                SELECT product_id, SUM(orders)::DOUBLE AS orders
+                FROM basket_products, bounds WHERE month BETWEEN lo AND hi
+                GROUP BY product_id
+            ),
+            pairs AS (
+                SELECT other_product_id, SUM(orders)::BIGINT AS orders
+                FROM basket_pairs, bounds
+                WHERE product_id = ? AND month BETWEEN lo AND hi
+                GROUP BY other_product_id
+                HAVING SUM(orders) >= ?
+            )
+            SELECT
+                p.other_product_id, i.product_name, p.orders,
+                p.orders / t.orders                               AS support,
+                p.orders / a.orders                               AS confidence,
+                (p.orders / a.orders) / (b.orders / t.orders)     AS lift
+            FROM pairs p
+            CROSS JOIN totals t
+            JOIN product_orders a ON a.product_id = ?
+            JOIN product_orders b ON b.product_id = p.other_product_id
+            LEFT JOIN basket_items i ON i.product_id = p.other_product_id
+            ORDER BY lift DESC, p.orders DESC, i.product_name
+            LIMIT {int(n)}
+        """, [start, end, product_id, min_orders, product_id])
+    finally:
+        conn.close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Materialise monthly product co-occurrence (support, confidence, lift)")
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--out', default=DEFAULT_OUT)
+    parser.add_argument('--min-orders', type=int, default=MIN_PAIR_ORDERS)
+    parser.add_argument('--force', action='store_true', help="Recompute even if the warehouse is unchanged")
+    args = parser.parse_args()
+    print(run_batch(args.db, args.out, args.min_orders, args.force))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Bitmap indexes for multi-select dimension filters
+"""
+
+
+import numpy as np
+import pandas as pd
+import polars as pl
+from typing import Dict, Iterable, List, Optional
+
+
+class BitmapIndex:
+    """
+    Posting lists of row positions for every distinct value of the indexed columns.
+
+    Each value maps to the sorted positions of the rows that carry it (the array
+    container of a roaring bitmap). A filter resolves as OR of the selected values
+    within a column and AND across columns, so reruns never compare strings over
+    the whole frame. The index is immutable and safe to share between sessions.
+    """
+
+    def __init__(self, df, columns: List[str]):
+        self.n_rows = len(df)
+        self.columns = list(columns)
+        self._postings: Dict[str, Dict[object, np.ndarray]] = {}
+        for col in self.columns:
+            self._postings[col] = self._build_postings(df[col])
+
+    @staticmethod
+    def _factorize(series):
+        """Sorted codes (-1 for missing) and distinct values for a pandas or Polars column"""
+        if isinstance(series, pl.Series):
+            uniques = series.drop_nulls().unique().sort().to_list()
+            codes = (series.rank("dense").cast(pl.Int64) - 1).fill_null(-1).to_numpy()
+            return codes, uniques
+        return pd.factorize(series, sort=True)
+
+    def _build_postings(self, series) -> Dict[object, np.ndarray]:
+        """
+        Group row positions by value with one stable argsort over the factorized codes.
+
+        Args:
+            series: Column to index (pandas or Polars)
+        Returns:
+            Dict of value -> read-only array of row positions
+        """
+        codes, uniques = self._factorize(series)
+        pos_dtype = np.int32 if self.n_rows < np.iinfo(np.int32).max else np.int64
+        order = np.argsort(codes, kind="stable").astype(pos_dtype)
+        order.flags.writeable = False
+
+        # Missing values get code -1 and sort first; skip past them
+        n_missing = int((codes < 0).sum())
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        bounds = np.concatenate(([0], np.cumsum(counts))) + n_missing
+        return {
+            value: order[bounds[i]:bounds[i + 1]]
+            for i, value in enumerate(uniques)
+        }
+
+    def values(self, column: str) -> List[object]:
+        """Sorted distinct values of an indexed column (for filter options)"""
+        return list(self._postings[column].keys())
+
+    def rows(self, column: str, values: Iterable) -> np.ndarray:
+        """
+        Boolean mask of rows whose column matches any of the values (bitmap OR).
+
+        Args:
+            column: Indexed column name
+            values: Selected values; unknown values match nothing
+        Returns:
+            Boolean numpy array of length n_rows
+        """
+        hit = np.zeros(self.n_rows, dtype=bool)
+        postings = self._postings[column]
+        for value in values:
+            positions = postings.get(value)
+            if positions is not None:
+                hit[positions] = True
+        return hit
+
+    def select(self, filters: Dict[str, Optional[Iterable]]) -> np.ndarray:
+        """
+        Resolve a set of multi-select filters into a row mask.
+
+        Args:
+            filters: Dict of column -> selected values. Empty or None means no filter
+        Returns:
+            Boolean numpy array of length n_rows (bitmap AND across columns)
+        """
+        mask = np.ones(self.n_rows, dtype=bool)
+        for column, values in filters.items():
+            if values is None or len(values) == 0:
+                continue
+            mask &= self.rows(column, values)
+        return mask
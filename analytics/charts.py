@@ -0,0 +1,266 @@
+"""
+Server-side data reduction for Plotly figures
+
+Bounds the payload sent to the browser regardless of how many rows an
+aggregate returns: line series are downsampled with LTTB, long bar and pie
+series keep their top N items plus one "other" item, and large marker-only
+scatters switch to WebGL.
+
+Figures can also be described by a chart spec (Plotly Express function name,
+its keyword arguments and the layout/trace updates) so that the built,
+reduced and serialised figure can be cached on (spec, aggregate hash).
+"""
+
+
+import hashlib
+import json
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+from typing import Any, Dict, Optional
+from analytics.instrument import timed
+
+
+MAX_LINE_POINTS = 2000      # points per line trace after LTTB
+MAX_BAR_CATEGORIES = 50     # bars per trace, including the "other" bar
+MAX_PIE_SLICES = 12         # slices per pie, including the "other" slice
+MAX_TREEMAP_LEAVES = 200    # leaves per treemap parent, including "other"
+WEBGL_THRESHOLD = 1000      # marker-only scatter points before switching to scattergl
+OTHER_LABEL = "อื่นๆ"
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Args:
+        x: Numeric x positions (monotonic)
+        y: Values
+        n_out: Number of points to keep
+    Returns:
+        Sorted indices of the points to keep (always includes first and last)
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo = hi
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = y[next_lo:next_hi].mean()
+        # Twice the triangle area between the last kept point, each candidate and the next bucket's mean
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def top_n_other(df: pd.DataFrame, label: str, value: str, n: int,
+                by: Optional[str] = None, other_label: str = OTHER_LABEL) -> pd.DataFrame:
+    """
+    Keep the n - 1 largest rows (per `by` group) and collapse the rest into one "other" row.
+
+    Args:
+        df: Aggregated frame with one row per label
+        label: Category column
+        value: Additive measure column
+        n: Maximum rows per group, including the "other" row
+        by: Optional parent column (e.g. treemap parent level)
+        other_label: Label for the collapsed row
+    Returns:
+        Frame with at most n rows per group; other columns of the collapsed rows are dropped
+    """
+    if by is None:
+        if len(df) <= n:
+            return df
+        ranked = df.sort_values(value, ascending=False)
+        head, rest = ranked.iloc[:n - 1], ranked.iloc[n - 1:]
+        other = pd.DataFrame({label: [other_label], value: [rest[value].sum()]})
+        return pd.concat([head, other], ignore_index=True)
+
+    rank = df.groupby(by)[value].rank(method="first", ascending=False)
+    group_size = df.groupby(by)[value].transform("size")
+    keep = (group_size <= n) | (rank < n)
+    if keep.all():
+        return df
+    other = (
+        df.loc[~keep]
+        .groupby(by, as_index=False)[value].sum()
+        .assign(**{label: other_label})
+    )
+    return pd.concat([df.loc[keep], other], ignore_index=True)
+
+
+def _positions(values) -> np.ndarray:
+    """Numeric positions for LTTB: numbers and dates as-is, categories by order"""
+    arr = np.asarray(values)
+    if np.issubdtype(arr.dtype, np.number):
+        return arr.astype(float)
+    if np.issubdtype(arr.dtype, np.datetime64):
+        return arr.astype("datetime64[ns]").astype(np.int64).astype(float)
+    return np.arange(len(arr), dtype=float)
+
+
+def _per_point(value, n: int) -> bool:
+    """True when a trace attribute holds one entry per point"""
+    return value is not None and not isinstance(value, str) and np.ndim(value) >= 1 and len(value) == n
+
+
+def _take(trace, idx: np.ndarray, n: int):
+    """Subset every per-point array of a trace to idx"""
+    for attr in ("x", "y", "text", "hovertext", "customdata", "ids"):
+        if _per_point(trace[attr], n):
+            trace[attr] = np.asarray(trace[attr])[idx]
+    for attr in ("color", "size", "symbol"):
+        if _per_point(trace.marker[attr], n):
+            trace.marker[attr] = np.asarray(trace.marker[attr])[idx]
+
+
+def _collapse(trace, labels_attr: str, values_attr: str, max_items: int, keep_order: bool):
+    """Top max_items - 1 items of a bar/pie trace plus one summed "other" item"""
+    values = np.nan_to_num(np.asarray(trace[values_attr], dtype=float))
+    n = len(values)
+    top = np.argsort(-values, kind="stable")[:max_items - 1]
+    if keep_order:
+        top = np.sort(top)
+    rest = np.setdiff1d(np.arange(n), top)
+
+    def collapsed(arr):
+        # Numbers (values, text, continuous colours) are summed; labels become OTHER_LABEL
+        arr = np.asarray(arr)
+        if np.issubdtype(arr.dtype, np.number):
+            return np.append(arr[top].astype(float), np.nan_to_num(arr[rest].astype(float)).sum())
+        return np.append(arr[top].astype(object), OTHER_LABEL)
+
+    for attr in (labels_attr, values_attr, "text", "hovertext", "ids"):
+        if _per_point(trace[attr], n):
+            trace[attr] = collapsed(trace[attr])
+    marker_attr = "colors" if trace.type == "pie" else "color"
+    if _per_point(trace.marker[marker_attr], n):
+        trace.marker[marker_attr] = collapsed(trace.marker[marker_attr])
+    if trace.type == "pie" and _per_point(trace.pull, n):
+        trace.pull = np.append(np.asarray(trace.pull)[top], 0)
+
+
+def _n_points(trace) -> int:
+    return len(trace.y) if trace.y is not None else 0
+
+
+def _is_line(trace) -> bool:
+    # Plotly Express already emits scattergl for long series, so both types count
+    return trace.type in ("scatter", "scattergl") and "lines" in (trace.mode or "lines")
+
+
+def _is_marker_scatter(trace) -> bool:
+    return trace.type == "scatter" and not _is_line(trace)
+
+
+def reduce_figure(fig: go.Figure) -> go.Figure:
+    """
+    Apply the reduction rules to every trace of a figure.
+
+    Args:
+        fig: Plotly figure (modified in place when no trace type changes)
+    Returns:
+        The reduced figure; a new figure when scatter traces were switched to WebGL
+    """
+    webgl = False
+    for trace in fig.data:
+        if _is_line(trace):
+            n = _n_points(trace)
+            if n > MAX_LINE_POINTS:
+                _take(trace, lttb(_positions(trace.x), trace.y, MAX_LINE_POINTS), n)
+        elif _is_marker_scatter(trace):
+            webgl = webgl or _n_points(trace) > WEBGL_THRESHOLD
+        elif trace.type == "bar":
+            labels_attr, values_attr = ("y", "x") if trace.orientation == "h" else ("x", "y")
+            if trace[values_attr] is not None and len(trace[values_attr]) > MAX_BAR_CATEGORIES:
+                _collapse(trace, labels_attr, values_attr, MAX_BAR_CATEGORIES, keep_order=True)
+        elif trace.type == "pie":
+            if trace["values"] is not None and len(trace["values"]) > MAX_PIE_SLICES:
+                _collapse(trace, "labels", "values", MAX_PIE_SLICES, keep_order=False)
+
+    if not webgl:
+        return fig
+    traces = []
+    for trace in fig.data:
+        if _is_marker_scatter(trace) and _n_points(trace) > WEBGL_THRESHOLD:
+            props = trace.to_plotly_json()
+            props.pop("type", None)
+            traces.append(go.Scattergl(props, skip_invalid=True))
+        else:
+            traces.append(trace)
+    return go.Figure(data=traces, layout=fig.layout)
+
+
+def frame_hash(df: pd.DataFrame) -> str:
+    """
+    Content hash of an aggregate frame (columns, dtypes, index and values).
+
+    Args:
+        df: Aggregate feeding a chart
+    Returns:
+        Hex digest that changes whenever the chart input changes
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps([[str(c), str(t)] for c, t in df.dtypes.items()]).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def chart_spec(kind: str, layout: Optional[Dict[str, Any]] = None,
+               traces: Optional[Dict[str, Any]] = None, **px_kwargs) -> str:
+    """
+    Canonical JSON description of a chart, used as the data-independent half of the cache key.
+
+    Args:
+        kind: Plotly Express function name ('bar', 'line', 'pie', 'treemap', ...)
+        layout: Keyword arguments for fig.update_layout
+        traces: Keyword arguments for fig.update_traces
+        **px_kwargs: Keyword arguments for the Plotly Express call (without the frame)
+    Returns:
+        JSON string with sorted keys
+    """
+    return json.dumps(
+        {"kind": kind, "px": px_kwargs, "layout": layout or {}, "traces": traces or {}},
+        sort_keys=True, default=str, ensure_ascii=False,
+    )
+
+
+def build_figure(spec: str, df: pd.DataFrame) -> go.Figure:
+    """
+    Build and reduce the figure described by a chart spec.
+
+    Args:
+        spec: Output of chart_spec
+        df: Aggregate frame passed to Plotly Express
+    Returns:
+        Reduced figure
+    """
+    spec = json.loads(spec)
+    with timed(f"figure.{spec['kind']}"):
+        fig = getattr(px, spec["kind"])(df, **spec["px"])
+        if spec["traces"]:
+            fig.update_traces(**spec["traces"])
+        if spec["layout"]:
+            fig.update_layout(**spec["layout"])
+    with timed("figure.reduce"):
+        return reduce_figure(fig)
+
+
+def figure_json(spec: str, df: pd.DataFrame) -> str:
+    """Serialised figure for a chart spec, ready to be sent to the browser"""
+    fig = build_figure(spec, df)
+    with timed("figure.serialize"):
+        return pio.to_json(fig, validate=False)
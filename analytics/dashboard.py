@@ -0,0 +1,237 @@
+"""
+Streamlit-side caching for the shared sales data layer
+"""
+
+
+import json
+import os
+import pandas as pd
+import streamlit as st
+from analytics import aggregates, basket, forecast, instrument, inventory, segments, sketches
+from analytics.charts import chart_spec, figure_json, frame_hash, reduce_figure
+from analytics.executor import QueryExecutor
+from analytics.profiling import QueryProfiler
+from analytics.sales import SalesWarehouse, freeze_filters
+from analytics.warehouse import warehouse_version
+
+
+DB_PATH = "data_cube/bikestore.duckdb"
+FORECAST_PATH = forecast.DEFAULT_OUT
+BASKET_PATH = basket.DEFAULT_OUT
+SEGMENTS_PATH = segments.DEFAULT_OUT
+SKETCH_PATH = sketches.DEFAULT_PATH
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _load_warehouse(db_path: str, version: str) -> SalesWarehouse:
+    instrument.cache_miss('warehouse')
+    return SalesWarehouse(db_path)
+
+
+def get_warehouse(db_path: str = DB_PATH) -> SalesWarehouse:
+    """
+    Loaded, enriched and indexed warehouse for the current warehouse version.
+
+    One instance per server process is shared by every page and session; a new
+    ETL load changes the version and replaces it.
+    """
+    instrument.cache_call('warehouse')
+    return _load_warehouse(db_path, warehouse_version(db_path))
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _distinct_sketches(db_path: str, version: str) -> dict:
+    instrument.cache_miss('sketches')
+    return sketches.load_or_build(get_warehouse(db_path).sales, version, SKETCH_PATH)
+
+
+def distinct_sketches(db_path: str = DB_PATH, rollup: str = 'sidebar') -> sketches.SketchRollup:
+    """
+    One HyperLogLog rollup of distinct customers/orders (analytics.sketches.ROLLUPS),
+    read from or persisted to SKETCH_PATH once per warehouse version and shared
+    by every session.
+    """
+    instrument.cache_call('sketches')
+    return _distinct_sketches(db_path, warehouse_version(db_path))[rollup]
+
+
+@st.cache_data(show_spinner=False, max_entries=512)
+def _aggregate(db_path: str, version: str, name: str, filters: tuple, params: tuple):
+    instrument.cache_miss('aggregate')
+    wh = _load_warehouse(db_path, version)
+    return getattr(aggregates, name)(wh.filter(*filters), **dict(params))
+
+
+def aggregate(name: str, filters: tuple, db_path: str = DB_PATH, **params):
+    """
+    Cached analytics.aggregates.<name> over the filtered sales frame.
+
+    Keyed on the warehouse version, the frozen filters (freeze_filters) and the
+    section's own parameters only, so a widget change recomputes just the
+    aggregates that take it as a parameter.
+    """
+    instrument.cache_call('aggregate')
+    return _aggregate(db_path, warehouse_version(db_path), name, filters, tuple(sorted(params.items())))
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _inventory_coverage(db_path: str, version: str) -> pd.DataFrame:
+    instrument.cache_miss('inventory')
+    return inventory.load_coverage(db_path)
+
+
+def inventory_coverage(db_path: str = DB_PATH) -> pd.DataFrame:
+    """Materialised inventory coverage (analytics.inventory), read once per warehouse version"""
+    instrument.cache_call('inventory')
+    return _inventory_coverage(db_path, warehouse_version(db_path))
+
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def _forecasts(path: str, version: str) -> pd.DataFrame:
+    instrument.cache_miss('forecast')
+    return forecast.load_forecasts(path)
+
+
+def forecasts(path: str = FORECAST_PATH) -> pd.DataFrame:
+    """Precomputed monthly forecasts (analytics.forecast), read once per forecast run"""
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    instrument.cache_call('forecast')
+    return _forecasts(path, warehouse_version(path))
+
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def _basket_items(path: str, version: str) -> pd.DataFrame:
+    instrument.cache_miss('basket')
+    return basket.basket_items(path)
+
+
+def basket_items(path: str = BASKET_PATH) -> pd.DataFrame:
+    """Products with stored co-occurrence (analytics.basket), empty when the job has not run"""
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    instrument.cache_call('basket')
+    return _basket_items(path, warehouse_version(path))
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _bought_together(path: str, version: str, product_id: int, start, end, n: int) -> pd.DataFrame:
+    instrument.cache_miss('basket')
+    return basket.bought_together(product_id, start, end, path, n=n)
+
+
+def bought_together(product_id: int, start, end, n: int = 10, path: str = BASKET_PATH) -> pd.DataFrame:
+    """Products most often bought with product_id between start and end (whole months)"""
+    instrument.cache_call('basket')
+    return _bought_together(path, warehouse_version(path), product_id, start, end, n)
+
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def _customer_segments(db_path: str, path: str, version: str) -> pd.DataFrame:
+    instrument.cache_miss('segments')
+    return segments.load_segments(db_path, path)
+
+
+def customer_segments(db_path: str = DB_PATH, path: str = SEGMENTS_PATH) -> pd.DataFrame:
+    """Customer -> behavioural segment with features (analytics.segments), empty when the job has not run"""
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    instrument.cache_call('segments')
+    return _customer_segments(db_path, path, f"{warehouse_version(db_path)}/{warehouse_version(path)}")
+
+
+@st.cache_resource(show_spinner=False)
+def get_executor(db_path: str = DB_PATH) -> QueryExecutor:
+    """
+    One QueryExecutor (thread pool) per database for the server process; it holds no connection between batches.
+
+    Profiles every query into the slow-query log when BIKESTORE_PROFILE=1.
+    """
+    return QueryExecutor(db_path, profiler=QueryProfiler.from_env())
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _warehouse_tables(db_path: str, version: str) -> frozenset:
+    return frozenset(get_executor(db_path).run("SELECT table_name FROM duckdb_tables()")['table_name'])
+
+
+def warehouse_tables(db_path: str = DB_PATH) -> frozenset:
+    """Names of the warehouse's tables, so pages can skip sections whose derived table is missing"""
+    return _warehouse_tables(db_path, warehouse_version(db_path))
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _run_queries(db_path: str, version: str, queries: tuple) -> dict:
+    instrument.cache_miss('queries')
+    return get_executor(db_path).run_many({name: (sql, list(params)) for name, sql, params in queries})
+
+
+def run_queries(queries: dict, db_path: str = DB_PATH) -> dict:
+    """
+    Run a page's independent SQL aggregates (analytics.queries) concurrently.
+
+    The whole batch is cached on the warehouse version and the queries with
+    their parameters.
+    """
+    frozen = tuple((name, sql, tuple(params)) for name, (sql, params) in queries.items())
+    instrument.cache_call('queries')
+    return _run_queries(db_path, warehouse_version(db_path), frozen)
+
+
+@st.cache_data(show_spinner=False, max_entries=512)
+def _cached_figure_json(spec: str, data_hash: str, _df: pd.DataFrame) -> str:
+    # _df is excluded from Streamlit's argument hashing; data_hash stands in for it
+    instrument.cache_miss('figure')
+    return figure_json(spec, _df)
+
+
+def cached_figure(kind: str, df: pd.DataFrame, layout=None, traces=None, **px_kwargs) -> str:
+    """
+    Figure JSON for px.<kind>(df, **px_kwargs) with layout/trace updates applied.
+
+    Cached on (chart spec, aggregate content hash), so reruns triggered by widgets
+    that do not change the aggregate skip Plotly Express entirely.
+    """
+    spec = chart_spec(kind, layout=layout, traces=traces, **px_kwargs)
+    instrument.cache_call('figure')
+    return _cached_figure_json(spec, frame_hash(df), df)
+
+
+def plotly_chart(fig, **kwargs):
+    """
+    st.plotly_chart with the server-side reduction stage (analytics.charts) applied first.
+
+    Accepts a figure or the JSON returned by cached_figure (already reduced).
+    """
+    with instrument.timed('chart.send'):
+        if isinstance(fig, str):
+            return st.plotly_chart(json.loads(fig), **kwargs)
+        return st.plotly_chart(reduce_figure(fig), **kwargs)
+
+
+def dev_panel():
+    """
+    Developer-only sidebar panel with section timings and cache hit rates.
+
+    Shown only when instrumentation is on (BIKESTORE_INSTRUMENT=1); call it at
+    the end of a page so the timings include that run. When
+    BIKESTORE_METRICS_FILE is set, the same numbers are written there in
+    Prometheus text format on every run.
+    """
+    if not instrument.enabled():
+        return
+    snap = instrument.snapshot()
+    with st.sidebar.expander("🛠️ Dev: timings", expanded=False):
+        sections = pd.DataFrame.from_dict(snap['sections'], orient='index')
+        if not sections.empty:
+            sections = (sections[['count', 'total_s', 'mean_s', 'max_s', 'last_s']] * [1, 1000, 1000, 1000, 1000])
+            sections.columns = ['count', 'total_ms', 'mean_ms', 'max_ms', 'last_ms']
+            st.dataframe(sections.sort_values('total_ms', ascending=False).round(1), use_container_width=True)
+        caches = pd.DataFrame.from_dict(snap['caches'], orient='index')
+        if not caches.empty:
+            st.dataframe(caches, use_container_width=True)
+        if st.button("Reset timings", key="dev_reset_timings"):
+            instrument.reset()
+    metrics_file = os.environ.get(instrument.METRICS_FILE_ENV_VAR)
+    if metrics_file:
+        instrument.write_textfile(metrics_file)
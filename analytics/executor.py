@@ -0,0 +1,92 @@
+"""
+Concurrent execution of independent warehouse queries
+
+A page's aggregates do not depend on each other, so running them one after
+another makes page latency the sum of the queries. QueryExecutor runs a set of
+queries on a thread pool, each on its own cursor of one DuckDB connection
+(DuckDB executes cursors in parallel and releases the GIL while it does), and
+gathers the results, so latency approaches the slowest query.
+
+The connection lives for one batch only. Holding it across reruns would keep
+DuckDB's file lock, so the ETL could not reload the warehouse while the
+dashboard runs.
+
+Given an analytics.profiling.QueryProfiler, each cursor runs with DuckDB's
+profiler on and every query is recorded in the slow-query log.
+"""
+
+
+import duckdb as dd
+import pandas as pd
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+from analytics.instrument import timed
+from analytics.profiling import QueryProfiler, enable_on, read_profile
+from analytics.warehouse import fetch_pandas
+
+
+class QueryExecutor:
+    """
+    Thread pool for concurrent read queries, one short-lived connection per batch.
+
+    Args:
+        db_path: Path to the DuckDB database file
+        max_workers: Queries run at the same time
+        profiler: Optional QueryProfiler recording every query
+    """
+
+    def __init__(self, db_path: str, max_workers: int = 4, profiler: Optional[QueryProfiler] = None):
+        self.db_path = db_path
+        self.profiler = profiler
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="duckdb-query")
+
+    def _run(self, conn, sql: str, params: Optional[List], name: str = "query") -> pd.DataFrame:
+        # A cursor is an independent connection to the same database instance
+        cursor = conn.cursor()
+        try:
+            if self.profiler is None:
+                with timed(f"query.{name}"):
+                    return fetch_pandas(cursor, sql, params)
+            enable_on(cursor)
+            started = time.perf_counter()
+            with timed(f"query.{name}"):
+                result = fetch_pandas(cursor, sql, params)
+            self.profiler.record(name, sql, params, time.perf_counter() - started, read_profile(cursor))
+            return result
+        finally:
+            cursor.close()
+
+    def run(self, sql: str, params: Optional[List] = None) -> pd.DataFrame:
+        """Run a single query on a fresh connection"""
+        conn = dd.connect(self.db_path)
+        try:
+            return self._run(conn, sql, params)
+        finally:
+            conn.close()
+
+    def run_many(self, queries: Dict[str, Tuple[str, List]]) -> Dict[str, pd.DataFrame]:
+        """
+        Run independent queries concurrently.
+
+        Args:
+            queries: name -> (sql, params)
+        Returns:
+            name -> result frame, in the order of queries
+        Raises:
+            The error of the first failing query, in the order of queries
+        """
+        conn = dd.connect(self.db_path)
+        try:
+            futures = {name: self._pool.submit(self._run, conn, sql, params, name)
+                       for name, (sql, params) in queries.items()}
+            # รอทุกคิวรีเสร็จก่อนปิด connection แม้คิวรีแรกจะล้มเหลว
+            wait(futures.values())
+        finally:
+            conn.close()
+        return {name: future.result() for name, future in futures.items()}
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        if self.profiler is not None:
+            self.profiler.flush()
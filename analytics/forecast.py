@@ -0,0 +1,315 @@
+"""
+Batch monthly sales forecasting
+
+Fits one model per monthly net-sales series (every store, every category and
+the company total) as a batch job, outside the request path:
+
+    python -m analytics.forecast --db data_cube/bikestore.duckdb
+
+Models are statsmodels ETS (additive, damped trend, yearly seasonality once
+there are two years of history) or SARIMAX, fitted across a process pool.
+Results go to their own DuckDB file (data_cube/forecasts.duckdb) so writing
+them never changes the warehouse version:
+
+    forecasts        level, key, month, actual | yhat, yhat_lower, yhat_upper
+    forecast_series  one row per series: history hash, model, AIC, fitted_at
+    forecast_runs    one row per warehouse version processed
+
+A run for a warehouse version that was already processed with the same model
+and horizon does nothing, and within a run only series whose history (or
+model/horizon) changed are refitted. The dashboards read the stored table via
+analytics.dashboard.forecasts.
+"""
+
+
+import argparse
+import hashlib
+import logging
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+import duckdb as dd
+import numpy as np
+import pandas as pd
+from analytics.queries import SALES_SQL
+from analytics.warehouse import fetch_pandas, warehouse_version
+
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = "data_cube/bikestore.duckdb"
+DEFAULT_OUT = "data_cube/forecasts.duckdb"
+MODELS = ('ets', 'sarimax')
+HORIZON = 6
+SEASONAL_PERIODS = 12
+# Prediction interval coverage
+INTERVAL = 0.8
+
+# level -> column of the enriched sales rows (None = company total)
+LEVELS = {'total': None, 'store': 'store_name', 'category': 'category_name'}
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS forecasts (
+        level VARCHAR, key VARCHAR, month DATE,
+        actual DOUBLE, yhat DOUBLE, yhat_lower DOUBLE, yhat_upper DOUBLE
+    );
+    CREATE TABLE IF NOT EXISTS forecast_series (
+        level VARCHAR, key VARCHAR, history_hash VARCHAR, model VARCHAR,
+        aic DOUBLE, n_obs INTEGER, last_month DATE, fitted_at TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS forecast_runs (
+        version VARCHAR, model VARCHAR, horizon INTEGER, run_at TIMESTAMP,
+        seconds DOUBLE, series INTEGER, refitted INTEGER
+    );
+"""
+
+
+def monthly_series(db_path: str) -> pd.DataFrame:
+    """
+    Monthly net sales per level/key, with empty months filled with 0 up to the
+    last month of the warehouse.
+
+    Returns:
+        Long frame (level, key, month, net_sales) sorted by level, key, month
+    """
+    selects = []
+    for level, column in LEVELS.items():
+        key = f"{column}" if column else "'All'"
+        where = f"WHERE {column} IS NOT NULL" if column else ""
+        selects.append(f"""
+            SELECT '{level}' AS level, {key} AS key,
+                   date_trunc('month', order_date)::DATE AS month, SUM(net_sales) AS net_sales
+            FROM s {where}
+            GROUP BY 1, 2, 3
+        """)
+    conn = dd.connect(db_path)
+    try:
+        raw = fetch_pandas(conn, f"WITH s AS ({SALES_SQL}) " + " UNION ALL ".join(selects))
+    finally:
+        conn.close()
+    if raw.empty:
+        return raw
+
+    raw['month'] = pd.to_datetime(raw['month'])
+    last = raw['month'].max()
+    filled = []
+    for (level, key), g in raw.groupby(['level', 'key'], sort=True):
+        months = pd.date_range(g['month'].min(), last, freq='MS')
+        s = g.set_index('month')['net_sales'].reindex(months, fill_value=0.0)
+        filled.append(pd.DataFrame({'level': level, 'key': key, 'month': months, 'net_sales': s.to_numpy()}))
+    return pd.concat(filled, ignore_index=True)
+
+
+def history_hash(start: pd.Timestamp, values: np.ndarray, model: str, horizon: int) -> str:
+    """Changes whenever the history, the model or the horizon changes"""
+    h = hashlib.blake2b(digest_size=12)
+    h.update(f"{model}|{horizon}|{start:%Y-%m}|".encode())
+    h.update(np.round(np.asarray(values, dtype=np.float64), 2).tobytes())
+    return h.hexdigest()
+
+
+def _naive(values: np.ndarray, horizon: int):
+    # Seasonal naive with a full year of history, otherwise the recent mean
+    if len(values) >= SEASONAL_PERIODS:
+        yhat = np.resize(values[-SEASONAL_PERIODS:], horizon)
+    else:
+        yhat = np.full(horizon, values[-3:].mean() if len(values) else 0.0)
+    spread = values.std() if len(values) > 1 else 0.0
+    return yhat, yhat - spread, yhat + spread
+
+
+def fit_series(level: str, key: str, start: pd.Timestamp, values: np.ndarray,
+               horizon: int = HORIZON, model: str = 'ets') -> Dict:
+    """
+    Fit one series and forecast `horizon` months (runs in a worker process).
+
+    Falls back to a seasonal-naive forecast when the series is too short or
+    the model does not converge.
+    """
+    from statsmodels.tsa.exponential_smoothing.ets import ETSModel
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+    values = np.asarray(values, dtype=np.float64)
+    index = pd.date_range(start, periods=len(values), freq='MS')
+    y = pd.Series(values, index=index)
+    seasonal = len(values) >= 2 * SEASONAL_PERIODS
+    alpha = 1 - INTERVAL
+    used, aic = model, None
+    try:
+        if len(values) < 8 or not np.any(values):
+            raise ValueError("too short to fit")
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            if model == 'sarimax':
+                res = SARIMAX(
+                    y, order=(1, 1, 1),
+                    seasonal_order=(1, 1, 0, SEASONAL_PERIODS) if seasonal else (0, 0, 0, 0),
+                    enforce_stationarity=False, enforce_invertibility=False,
+                ).fit(disp=False)
+                fc = res.get_forecast(horizon)
+                ci = fc.conf_int(alpha=alpha)
+                yhat, lower, upper = fc.predicted_mean.to_numpy(), ci.iloc[:, 0].to_numpy(), ci.iloc[:, 1].to_numpy()
+            else:
+                res = ETSModel(
+                    y, error='add', trend='add', damped_trend=True,
+                    seasonal='add' if seasonal else None,
+                    seasonal_periods=SEASONAL_PERIODS if seasonal else None,
+                ).fit(disp=False)
+                frame = res.get_prediction(start=len(values), end=len(values) + horizon - 1).summary_frame(alpha=alpha)
+                yhat, lower, upper = frame['mean'].to_numpy(), frame['pi_lower'].to_numpy(), frame['pi_upper'].to_numpy()
+        aic = float(res.aic)
+        if not np.all(np.isfinite(yhat)):
+            raise ValueError("non-finite forecast")
+    except Exception:
+        used = 'naive'
+        yhat, lower, upper = _naive(values, horizon)
+
+    months = pd.date_range(index[-1] + pd.offsets.MonthBegin(1), periods=horizon, freq='MS')
+    return {
+        'level': level, 'key': key, 'model': used, 'aic': aic, 'n_obs': len(values),
+        'last_month': index[-1], 'months': months,
+        # ยอดขายติดลบไม่มีความหมาย
+        'yhat': np.clip(yhat, 0, None), 'yhat_lower': np.clip(lower, 0, None), 'yhat_upper': np.clip(upper, 0, None),
+    }
+
+
+def _fit_task(task: tuple) -> Dict:
+    return fit_series(*task)
+
+
+def _connect_out(out_path: str) -> dd.DuckDBPyConnection:
+    directory = os.path.dirname(out_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = dd.connect(out_path)
+    conn.execute(SCHEMA)
+    return conn
+
+
+def run_batch(db_path: str = DB_PATH, out_path: str = DEFAULT_OUT, model: str = 'ets',
+              horizon: int = HORIZON, max_workers: Optional[int] = None, force: bool = False) -> Dict:
+    """
+    Forecast every series of the current warehouse version.
+
+    Args:
+        db_path: Warehouse to read history from
+        out_path: Forecast database
+        model: 'ets' or 'sarimax'
+        horizon: Months to forecast
+        max_workers: Worker processes (default: one per CPU)
+        force: Refit every series even if nothing changed
+    Returns:
+        Run summary {version, series, refitted, seconds, skipped}
+    """
+    if model not in MODELS:
+        raise ValueError(f"model must be one of {MODELS}")
+    started = time.perf_counter()
+    version = warehouse_version(db_path)
+    conn = _connect_out(out_path)
+    try:
+        done = conn.execute(
+            "SELECT count(*) FROM forecast_runs WHERE version = ? AND model = ? AND horizon = ?",
+            [version, model, horizon],
+        ).fetchone()[0]
+        if done and not force:
+            logger.info(f"Forecasts for warehouse version {version} are up to date")
+            return {'version': version, 'series': 0, 'refitted': 0, 'seconds': 0.0, 'skipped': True}
+
+        history = monthly_series(db_path)
+        stored = dict(((level, key), h) for level, key, h in
+                      conn.execute("SELECT level, key, history_hash FROM forecast_series").fetchall())
+
+        series, tasks = {}, []
+        for (level, key), g in history.groupby(['level', 'key'], sort=True):
+            values = g['net_sales'].to_numpy()
+            start = g['month'].iloc[0]
+            h = history_hash(start, values, model, horizon)
+            series[(level, key)] = (h, g)
+            if force or stored.get((level, key)) != h:
+                tasks.append((level, key, start, values, horizon, model))
+
+        if len(tasks) > 1 and (max_workers or os.cpu_count() or 1) > 1:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                results = list(pool.map(_fit_task, tasks))
+        else:
+            results = [_fit_task(task) for task in tasks]
+        logger.info(f"Fitted {len(results)} of {len(series)} series ({model}, {horizon} months)")
+
+        rows, meta = [], []
+        fitted_at = datetime.now()
+        for r in results:
+            h, g = series[(r['level'], r['key'])]
+            rows.append(pd.DataFrame({'level': r['level'], 'key': r['key'], 'month': g['month'].to_numpy(),
+                                      'actual': g['net_sales'].to_numpy()}))
+            rows.append(pd.DataFrame({'level': r['level'], 'key': r['key'], 'month': r['months'],
+                                      'yhat': r['yhat'], 'yhat_lower': r['yhat_lower'],
+                                      'yhat_upper': r['yhat_upper']}))
+            meta.append((r['level'], r['key'], h, r['model'], r['aic'], r['n_obs'], r['last_month'], fitted_at))
+        columns = ['level', 'key', 'month', 'actual', 'yhat', 'yhat_lower', 'yhat_upper']
+        new_rows = pd.concat(rows, ignore_index=True).reindex(columns=columns) if rows else pd.DataFrame(columns=columns)
+        refit_keys = pd.DataFrame([(r['level'], r['key']) for r in results], columns=['level', 'key'])
+        current_keys = pd.DataFrame(list(series), columns=['level', 'key'])
+
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            conn.register('refit_keys', refit_keys)
+            conn.register('current_keys', current_keys)
+            conn.register('new_rows', new_rows)
+            for table in ('forecasts', 'forecast_series'):
+                # ลบซีรีส์ที่ fit ใหม่ และซีรีส์ที่ไม่มีใน warehouse แล้ว
+                conn.execute(f"""
+                    DELETE FROM {table} t
+                    WHERE EXISTS (SELECT 1 FROM refit_keys k WHERE k.level = t.level AND k.key = t.key)
+                       OR NOT EXISTS (SELECT 1 FROM current_keys k WHERE k.level = t.level AND k.key = t.key)
+                """)
+            conn.execute(f"INSERT INTO forecasts SELECT {', '.join(columns)} FROM new_rows")
+            if meta:
+                conn.executemany("INSERT INTO forecast_series VALUES (?, ?, ?, ?, ?, ?, ?, ?)", meta)
+            seconds = time.perf_counter() - started
+            conn.execute("INSERT INTO forecast_runs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         [version, model, horizon, fitted_at, seconds, len(series), len(results)])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    return {'version': version, 'series': len(series), 'refitted': len(results),
+            'seconds': round(seconds, 3), 'skipped': False}
+
+
+def load_forecasts(out_path: str = DEFAULT_OUT) -> pd.DataFrame:
+    """Stored actuals and forecasts with each series' model, empty when none exist"""
+    if not os.path.exists(out_path):
+        return pd.DataFrame()
+    conn = dd.connect(out_path)
+    try:
+        return fetch_pandas(conn, """
+            SELECT f.*, s.model, s.fitted_at
+            FROM forecasts f
+            JOIN forecast_series s ON s.level = f.level AND s.key = f.key
+            ORDER BY f.level, f.key, f.month
+        """)
+    finally:
+        conn.close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Fit monthly sales forecasts for every store and category")
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--out', default=DEFAULT_OUT)
+    parser.add_argument('--model', choices=MODELS, default='ets')
+    parser.add_argument('--horizon', type=int, default=HORIZON)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--force', action='store_true', help="Refit every series")
+    args = parser.parse_args()
+    summary = run_batch(args.db, args.out, args.model, args.horizon, args.workers, args.force)
+    print(summary)
+
+
+if __name__ == '__main__':
+    main()
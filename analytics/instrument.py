@@ -0,0 +1,198 @@
+"""
+Hot-path timing and cache counters for the dashboards
+
+Off unless BIKESTORE_INSTRUMENT=1 is set in the environment (or enable() is
+called). When off, timed() hands back one shared no-op context manager and
+instrumented functions make a single flag check before calling through, so the
+hooks can stay in the hot paths permanently.
+
+Sections are dotted names ("warehouse.load", "aggregates.kpis", "figure.bar").
+They nest, so a parent's total includes its children. Caches count calls and
+misses; the miss is recorded from inside the cached function body, which only
+runs when the cache is cold.
+
+snapshot() returns everything as a dict, prometheus_text() renders it in the
+Prometheus text exposition format and write_textfile() writes that atomically
+for node_exporter's textfile collector.
+"""
+
+
+import functools
+import logging
+import os
+import threading
+import time
+from contextlib import nullcontext
+from typing import Callable, Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+ENV_VAR = "BIKESTORE_INSTRUMENT"
+METRICS_FILE_ENV_VAR = "BIKESTORE_METRICS_FILE"
+METRIC_PREFIX = "bikestore"
+
+_enabled = os.environ.get(ENV_VAR, "") not in ("", "0")
+_lock = threading.Lock()
+# section -> [count, total seconds, max seconds, last seconds]
+_sections: Dict[str, list] = {}
+# cache -> [calls, misses]
+_caches: Dict[str, list] = {}
+_NULL = nullcontext()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(on: bool = True):
+    global _enabled
+    _enabled = on
+
+
+def record(section: str, seconds: float):
+    with _lock:
+        stats = _sections.get(section)
+        if stats is None:
+            _sections[section] = [1, seconds, seconds, seconds]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+            stats[3] = seconds
+
+
+class _Timer:
+    __slots__ = ("section", "started")
+
+    def __init__(self, section: str):
+        self.section = section
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.section, time.perf_counter() - self.started)
+        return False
+
+
+def timed(section: str):
+    """Context manager timing one section (a shared no-op when disabled)"""
+    return _Timer(section) if _enabled else _NULL
+
+
+def instrumented(section: Optional[str] = None) -> Callable:
+    """
+    Decorator timing every call of a function.
+
+    Args:
+        section: Section name (default: "<module>.<function>", e.g. "aggregates.kpis")
+    """
+    def decorate(func):
+        name = section or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - started)
+
+        return wrapper
+    return decorate
+
+
+def _count(cache: str, slot: int):
+    if not _enabled:
+        return
+    with _lock:
+        _caches.setdefault(cache, [0, 0])[slot] += 1
+
+
+def cache_call(cache: str):
+    """Count one lookup of a cache (call before the cached function)"""
+    _count(cache, 0)
+
+
+def cache_miss(cache: str):
+    """Count one miss of a cache (call inside the cached function body)"""
+    _count(cache, 1)
+
+
+def reset():
+    with _lock:
+        _sections.clear()
+        _caches.clear()
+
+
+def snapshot() -> Dict[str, Dict]:
+    """
+    Current timings and cache counters.
+
+    Returns:
+        {"sections": {name: {count, total_s, mean_s, max_s, last_s}},
+         "caches": {name: {calls, misses, hits, hit_rate}}}
+    """
+    with _lock:
+        sections = {name: list(stats) for name, stats in _sections.items()}
+        caches = {name: list(stats) for name, stats in _caches.items()}
+    return {
+        "sections": {
+            name: {"count": count, "total_s": total, "mean_s": total / count, "max_s": peak, "last_s": last}
+            for name, (count, total, peak, last) in sorted(sections.items())
+        },
+        "caches": {
+            name: {"calls": calls, "misses": misses, "hits": max(calls - misses, 0),
+                   "hit_rate": max(calls - misses, 0) / calls if calls else None}
+            for name, (calls, misses) in sorted(caches.items())
+        },
+    }
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def prometheus_text(prefix: str = METRIC_PREFIX) -> str:
+    """Timings and cache counters in the Prometheus text exposition format"""
+    snap = snapshot()
+    sections, caches = snap["sections"], snap["caches"]
+    lines = [
+        f"# HELP {prefix}_section_seconds Time spent in instrumented dashboard sections",
+        f"# TYPE {prefix}_section_seconds summary",
+    ]
+    for name, s in sections.items():
+        lines.append(f'{prefix}_section_seconds_sum{{section="{_label(name)}"}} {s["total_s"]:.6f}')
+        lines.append(f'{prefix}_section_seconds_count{{section="{_label(name)}"}} {s["count"]}')
+    lines += [
+        f"# HELP {prefix}_section_seconds_max Slowest call of each section since start or reset",
+        f"# TYPE {prefix}_section_seconds_max gauge",
+    ]
+    lines += [f'{prefix}_section_seconds_max{{section="{_label(name)}"}} {s["max_s"]:.6f}'
+              for name, s in sections.items()]
+    lines += [
+        f"# HELP {prefix}_cache_requests_total Lookups of each cache",
+        f"# TYPE {prefix}_cache_requests_total counter",
+    ]
+    lines += [f'{prefix}_cache_requests_total{{cache="{_label(name)}"}} {c["calls"]}' for name, c in caches.items()]
+    lines += [
+        f"# HELP {prefix}_cache_misses_total Lookups of each cache that had to compute",
+        f"# TYPE {prefix}_cache_misses_total counter",
+    ]
+    lines += [f'{prefix}_cache_misses_total{{cache="{_label(name)}"}} {c["misses"]}' for name, c in caches.items()]
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path: str, prefix: str = METRIC_PREFIX):
+    """Write prometheus_text() to path atomically (node_exporter textfile collector)"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as fh:
+        fh.write(prometheus_text(prefix))
+    os.replace(tmp, path)
@@ -0,0 +1,83 @@
+"""
+Inventory coverage for the dashboards
+
+The ETL materialises inventory_coverage after every load
+(DataLoader.build_inventory_coverage): days-of-cover, sell-through, stock-out
+risk and a reorder quantity per store x product, computed in one set-based
+pass over fact_inventory and fact_sales. This module reads it with the names
+the pages show and summarises it with vectorised pandas operations only.
+"""
+
+
+import duckdb as dd
+import pandas as pd
+from analytics.instrument import instrumented
+from analytics.warehouse import fetch_pandas
+
+
+RISK_LEVELS = ('out of stock', 'high', 'medium', 'low', 'no demand')
+RISK_COLORS = {
+    'out of stock': '#b91c1c',
+    'high': '#f97316',
+    'medium': '#facc15',
+    'low': '#22c55e',
+    'no demand': '#9ca3af',
+}
+
+COVERAGE_SQL = """
+    SELECT
+        c.*,
+        st.store_name, p.product_name, b.brand_name, cat.category_name
+    FROM inventory_coverage c
+    LEFT JOIN dim_stores     st  ON c.store_id    = st.store_id
+    LEFT JOIN dim_products   p   ON c.product_id  = p.product_id
+    LEFT JOIN dim_brands     b   ON p.brand_id    = b.brand_id
+    LEFT JOIN dim_categories cat ON p.category_id = cat.category_id
+"""
+
+
+@instrumented('inventory.load')
+def load_coverage(db_path: str) -> pd.DataFrame:
+    """
+    Materialised coverage rows with store/product/brand/category names.
+
+    Returns:
+        Coverage frame with stock_out_risk as an ordered categorical, or an
+        empty frame when the warehouse predates the inventory stage
+    """
+    conn = dd.connect(db_path)
+    try:
+        exists = conn.execute(
+            "SELECT count(*) FROM duckdb_tables() WHERE table_name = 'inventory_coverage'"
+        ).fetchone()[0]
+        if not exists:
+            return pd.DataFrame()
+        cov = fetch_pandas(conn, COVERAGE_SQL)
+    finally:
+        conn.close()
+    cov['stock_out_risk'] = pd.Categorical(cov['stock_out_risk'], categories=RISK_LEVELS, ordered=True)
+    return cov
+
+
+def risk_by_store(cov: pd.DataFrame) -> pd.DataFrame:
+    """Store-products per store and risk level (long form, every level present)"""
+    return (
+        cov.groupby(['store_name', 'stock_out_risk'], observed=False)
+           .size()
+           .rename('items')
+           .reset_index()
+    )
+
+
+def sell_through_by(cov: pd.DataFrame, by: str) -> pd.DataFrame:
+    """Unit-weighted sell-through: units sold / (units sold + on hand) per group"""
+    g = cov.groupby(by, as_index=False)[['units_sold', 'quantity_on_hand']].sum()
+    g['sell_through'] = g['units_sold'] / (g['units_sold'] + g['quantity_on_hand']).where(lambda s: s > 0)
+    return g.sort_values('sell_through', ascending=False)
+
+
+def reorder_list(cov: pd.DataFrame, n: int = 50) -> pd.DataFrame:
+    """Store-products that need stock, most urgent first (risk, then days of cover)"""
+    need = cov[cov['reorder_qty'] > 0]
+    return need.sort_values(['stock_out_risk', 'days_of_cover', 'reorder_qty'],
+                            ascending=[True, True, False], na_position='last').head(n)
@@ -0,0 +1,240 @@
+"""
+Opt-in DuckDB profiling and slow-query log for dashboard queries
+
+With BIKESTORE_PROFILE=1, every query run through analytics.executor.QueryExecutor
+is executed with DuckDB's profiler on (no extra EXPLAIN ANALYZE run: the same
+execution is profiled) and recorded in a separate DuckDB file, by default
+data_cube/query_log.duckdb. The log lives outside the warehouse on purpose:
+writing to bikestore.duckdb would change warehouse_version and invalidate every
+dashboard cache.
+
+    query_log   one row per query: name, sql hash, wall/DuckDB latency, rows
+                scanned/returned, peak buffer memory, filter parameters, and
+                for queries slower than BIKESTORE_SLOW_QUERY_MS (default 200)
+                the SQL and the JSON plan; slow queries are also logged as
+                warnings with a plan summary
+    query_stats view: count, p50/p95/max latency and rows scanned per query
+
+Records are buffered in memory and written in batches (immediately after a
+slow query), so profiling adds one small insert per batch, not per query.
+"""
+
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+import duckdb as dd
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+ENV_VAR = "BIKESTORE_PROFILE"
+SLOW_QUERY_MS_ENV_VAR = "BIKESTORE_SLOW_QUERY_MS"
+LOG_PATH_ENV_VAR = "BIKESTORE_QUERY_LOG"
+DEFAULT_LOG_PATH = "data_cube/query_log.duckdb"
+DEFAULT_SLOW_QUERY_MS = 200.0
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS query_log (
+        logged_at          TIMESTAMP,
+        name               VARCHAR,
+        sql_hash           VARCHAR,
+        wall_ms            DOUBLE,
+        duckdb_ms          DOUBLE,
+        cpu_ms             DOUBLE,
+        rows_scanned       BIGINT,
+        rows_returned      BIGINT,
+        peak_buffer_bytes  BIGINT,
+        params             VARCHAR,
+        slow               BOOLEAN,
+        sql                VARCHAR,
+        plan               VARCHAR
+    );
+    CREATE OR REPLACE VIEW query_stats AS
+    SELECT
+        name,
+        sql_hash,
+        count(*)                                  AS runs,
+        quantile_cont(wall_ms, 0.5)               AS p50_ms,
+        quantile_cont(wall_ms, 0.95)              AS p95_ms,
+        max(wall_ms)                              AS max_ms,
+        avg(rows_scanned)::BIGINT                 AS avg_rows_scanned,
+        max(peak_buffer_bytes)                    AS peak_buffer_bytes,
+        count(*) FILTER (WHERE slow)              AS slow_runs,
+        max(logged_at)                            AS last_run
+    FROM query_log
+    GROUP BY name, sql_hash
+    ORDER BY p95_ms DESC;
+"""
+
+COLUMNS = ["logged_at", "name", "sql_hash", "wall_ms", "duckdb_ms", "cpu_ms", "rows_scanned",
+           "rows_returned", "peak_buffer_bytes", "params", "slow", "sql", "plan"]
+
+
+def profiling_enabled() -> bool:
+    return os.environ.get(ENV_VAR, "") not in ("", "0")
+
+
+def sql_hash(sql: str) -> str:
+    """Stable id for a query shape (whitespace-insensitive; parameters are not part of it)"""
+    return hashlib.blake2b(" ".join(sql.split()).encode(), digest_size=8).hexdigest()
+
+
+def plan_text(profile: Dict, max_depth: int = 12) -> str:
+    """
+    Indented operator tree from a DuckDB JSON profile.
+
+    Each line: operator, rows out, rows scanned and operator time in ms.
+    """
+    lines = []
+
+    def walk(node: Dict, depth: int):
+        if depth > max_depth:
+            return
+        name = node.get("operator_name") or node.get("operator_type")
+        if name:
+            lines.append(
+                f"{'  ' * depth}{name.strip()}  rows={node.get('operator_cardinality', 0)}"
+                f"  scanned={node.get('operator_rows_scanned', 0)}"
+                f"  {node.get('operator_timing', 0) * 1000:.2f} ms"
+            )
+            depth += 1
+        for child in node.get("children", []):
+            walk(child, depth)
+
+    walk(profile, 0)
+    return "\n".join(lines)
+
+
+def enable_on(cursor: dd.DuckDBPyConnection):
+    """Turn DuckDB's profiler on for one cursor without writing output anywhere"""
+    cursor.execute("SET enable_profiling = 'no_output'")
+    cursor.execute("SET profiling_mode = 'standard'")
+
+
+def read_profile(cursor: dd.DuckDBPyConnection) -> Optional[Dict]:
+    """JSON profile of the last query run on the cursor"""
+    try:
+        return json.loads(cursor.get_profiling_information(format="json"))
+    except (dd.Error, ValueError):
+        return None
+
+
+class QueryProfiler:
+    """
+    Collects profiles of dashboard queries into the query log.
+
+    Args:
+        log_path: DuckDB file holding query_log/query_stats
+        slow_query_ms: Queries at or above this wall time keep their SQL and plan
+        flush_every: Buffered records written per batch
+    """
+
+    def __init__(self, log_path: str = DEFAULT_LOG_PATH, slow_query_ms: float = DEFAULT_SLOW_QUERY_MS,
+                 flush_every: int = 50):
+        self.log_path = log_path
+        self.slow_query_ms = slow_query_ms
+        self.flush_every = flush_every
+        self._buffer: List[Dict] = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["QueryProfiler"]:
+        """Profiler configured from the environment, or None when profiling is off"""
+        if not profiling_enabled():
+            return None
+        return cls(
+            log_path=os.environ.get(LOG_PATH_ENV_VAR, DEFAULT_LOG_PATH),
+            slow_query_ms=float(os.environ.get(SLOW_QUERY_MS_ENV_VAR, DEFAULT_SLOW_QUERY_MS)),
+        )
+
+    def record(self, name: str, sql: str, params: Optional[Sequence], wall_seconds: float,
+               profile: Optional[Dict]):
+        """Add one executed query; slow ones are logged and flushed straight away"""
+        profile = profile or {}
+        wall_ms = wall_seconds * 1000
+        slow = wall_ms >= self.slow_query_ms
+        entry = {
+            "logged_at": datetime.now(),
+            "name": name,
+            "sql_hash": sql_hash(sql),
+            "wall_ms": wall_ms,
+            "duckdb_ms": profile.get("latency", 0) * 1000 if profile else None,
+            "cpu_ms": profile.get("cpu_time", 0) * 1000 if profile else None,
+            "rows_scanned": profile.get("cumulative_rows_scanned"),
+            "rows_returned": profile.get("rows_returned"),
+            "peak_buffer_bytes": profile.get("system_peak_buffer_memory"),
+            "params": json.dumps(list(params or []), default=str, ensure_ascii=False),
+            "slow": slow,
+            "sql": sql if slow else None,
+            "plan": json.dumps(profile) if slow and profile else None,
+        }
+        if slow:
+            logger.warning(
+                f"Slow query {name} ({wall_ms:.0f} ms, {entry['rows_scanned']} rows scanned) "
+                f"params={entry['params']}\n{plan_text(profile)}"
+            )
+        with self._lock:
+            self._buffer.append(entry)
+            due = slow or len(self._buffer) >= self.flush_every
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write buffered records to the query log"""
+        with self._lock:
+            entries, self._buffer = self._buffer, []
+        if not entries:
+            return
+        frame = pd.DataFrame(entries, columns=COLUMNS)
+        with self._write_lock:
+            directory = os.path.dirname(self.log_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = dd.connect(self.log_path)
+            try:
+                conn.execute(SCHEMA)
+                conn.register("entries", frame)
+                conn.execute(f"INSERT INTO query_log SELECT {', '.join(COLUMNS)} FROM entries")
+            finally:
+                conn.close()
+
+
+def _read(log_path: str, sql: str) -> pd.DataFrame:
+    if not os.path.exists(log_path):
+        return pd.DataFrame()
+    conn = dd.connect(log_path)
+    try:
+        conn.execute(SCHEMA)
+        return conn.execute(sql).df()
+    finally:
+        conn.close()
+
+
+def query_stats(log_path: str = DEFAULT_LOG_PATH) -> pd.DataFrame:
+    """Per-query count, p50/p95/max latency and rows scanned"""
+    return _read(log_path, "SELECT * FROM query_stats")
+
+
+def slow_queries(log_path: str = DEFAULT_LOG_PATH, limit: int = 50) -> pd.DataFrame:
+    """Most recent slow queries with their parameters, SQL and plan"""
+    return _read(log_path, f"""
+        SELECT logged_at, name, wall_ms, duckdb_ms, rows_scanned, rows_returned, params, sql, plan
+        FROM query_log WHERE slow ORDER BY logged_at DESC LIMIT {int(limit)}
+    """)
+
+
+def clear_log(log_path: str = DEFAULT_LOG_PATH):
+    if os.path.exists(log_path):
+        conn = dd.connect(log_path)
+        try:
+            conn.execute(SCHEMA)
+            conn.execute("DELETE FROM query_log")
+        finally:
+            conn.close()
@@ -0,0 +1,228 @@
+"""
+SQL versions of the page aggregates
+
+Each builder returns (sql, params) over the same enriched sales rows that
+analytics.sales.enrich_sales produces, filtered like the sidebar. They are
+independent of each other, so a page can hand a whole set to
+analytics.executor.QueryExecutor and run them concurrently in DuckDB.
+"""
+
+
+from datetime import timedelta
+from typing import Dict, List, Tuple
+from analytics.aggregates import DISCOUNT_BINS, DISCOUNT_LABELS
+
+
+Query = Tuple[str, List]
+
+SALES_SQL = """
+    SELECT
+        s.order_id, s.customer_id, s.store_id, s.staff_id, s.product_id,
+        s.order_date, s.quantity, s.list_price, s.discount,
+        s.quantity * s.list_price * (1 - s.discount)        AS net_sales,
+        year(s.order_date)                                  AS year,
+        year(s.order_date) || 'Q' || quarter(s.order_date)  AS quarter,
+        strftime(s.order_date, '%Y-%m')                     AS month,
+        p.product_name, c.category_name, b.brand_name, st.store_name,
+        cu.customer_city, cu.customer_state
+    FROM fact_sales s
+    LEFT JOIN dim_products   p  ON s.product_id  = p.product_id
+    LEFT JOIN dim_categories c  ON p.category_id = c.category_id
+    LEFT JOIN dim_brands     b  ON p.brand_id    = b.brand_id
+    LEFT JOIN dim_stores     st ON s.store_id    = st.store_id
+    LEFT JOIN dim_customers  cu ON s.customer_id = cu.customer_id
+"""
+
+# Order grain (fact_orders, built by the ETL): one row per order
+ORDERS_SQL = """
+    SELECT
+        o.order_id, o.customer_id, o.store_id, o.staff_id, o.order_date,
+        o.net_amount                                        AS net_sales,
+        o.line_count, o.units,
+        year(o.order_date)                                  AS year,
+        year(o.order_date) || 'Q' || quarter(o.order_date)  AS quarter,
+        strftime(o.order_date, '%Y-%m')                     AS month,
+        st.store_name
+    FROM fact_orders o
+    LEFT JOIN dim_stores st ON o.store_id = st.store_id
+"""
+
+PERIODS = ('month', 'quarter', 'year')
+MEASURES = ('net_sales', 'quantity')
+# SUM over BIGINT is HUGEINT in DuckDB, which pandas can only hold as objects
+MEASURE_TYPES = {'net_sales': 'DOUBLE', 'quantity': 'BIGINT'}
+
+
+def filtered_sales(filters: tuple) -> Query:
+    """
+    Sub-query of enriched sales rows matching the sidebar filters.
+
+    Args:
+        filters: Output of analytics.sales.freeze_filters
+    Returns:
+        (sql, params) usable as a FROM clause
+    """
+    f_date, f_store, f_brand, f_category = filters
+    conditions = ["order_date >= ?", "order_date < ?"]
+    params = [f_date[0], f_date[1] + timedelta(days=1)]
+    for column, values in (('store_name', f_store), ('brand_name', f_brand), ('category_name', f_category)):
+        if values:
+            conditions.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+    sql = f"(SELECT * FROM ({SALES_SQL}) WHERE {' AND '.join(conditions)}) AS f"
+    return sql, params
+
+
+def order_grain(filters: tuple, orders_table: bool) -> bool:
+    """
+    Whether order-level metrics can come from fact_orders: the table exists and
+    no brand/category filter is set (those select order lines, not orders).
+    """
+    _, _, f_brand, f_category = filters
+    return orders_table and not f_brand and not f_category
+
+
+def filtered_orders(filters: tuple) -> Query:
+    """Sub-query of fact_orders rows matching the date and store filters"""
+    f_date, f_store, _, _ = filters
+    conditions = ["order_date >= ?", "order_date < ?"]
+    params = [f_date[0], f_date[1] + timedelta(days=1)]
+    if f_store:
+        conditions.append(f"store_name IN ({', '.join('?' * len(f_store))})")
+        params.extend(f_store)
+    sql = f"(SELECT * FROM ({ORDERS_SQL}) WHERE {' AND '.join(conditions)}) AS f"
+    return sql, params
+
+
+def kpis(filters: tuple, orders_table: bool = False, distinct: bool = True) -> Query:
+    """
+    Total net sales, orders and distinct customers.
+
+    distinct=False leaves the distinct counts NULL (orders still come from
+    fact_orders when order_grain applies) for callers that answer them from
+    the HyperLogLog rollup (analytics.sketches) instead.
+    """
+    # หนึ่งแถวต่อออเดอร์: นับแถวแทน COUNT(DISTINCT order_id) บนบรรทัดสินค้า
+    if order_grain(filters, orders_table):
+        src, params = filtered_orders(filters)
+        orders = "COUNT(*)"
+    else:
+        src, params = filtered_sales(filters)
+        orders = "COUNT(DISTINCT order_id)" if distinct else "NULL::BIGINT"
+    customers = "COUNT(DISTINCT customer_id)" if distinct else "NULL::BIGINT"
+    return f"""
+        SELECT
+            COALESCE(SUM(net_sales), 0)  AS total_sales,
+            {orders}                     AS orders,
+            {customers}                  AS customers
+        FROM {src}
+    """, params
+
+
+def trend(filters: tuple, period: str, orders_table: bool = False) -> Query:
+    if period not in PERIODS:
+        raise ValueError(f"period must be one of {PERIODS}")
+    if order_grain(filters, orders_table):
+        src, params = filtered_orders(filters)
+        orders = "COUNT(*)"
+    else:
+        src, params = filtered_sales(filters)
+        orders = "COUNT(DISTINCT order_id)"
+    return f"""
+        SELECT {period}, SUM(net_sales) AS net_sales, {orders} AS orders
+        FROM {src}
+        GROUP BY {period}
+        ORDER BY {period}
+    """, params
+
+
+def top_products(filters: tuple, measure: str, n: int = 10) -> Query:
+    if measure not in MEASURES:
+        raise ValueError(f"measure must be one of {MEASURES}")
+    src, params = filtered_sales(filters)
+    return f"""
+        SELECT product_name, SUM({measure})::{MEASURE_TYPES[measure]} AS {measure}
+        FROM {src}
+        WHERE product_name IS NOT NULL
+        GROUP BY product_name
+        ORDER BY {measure} DESC, product_name
+        LIMIT {int(n)}
+    """, params
+
+
+def brand_category(filters: tuple) -> Query:
+    src, params = filtered_sales(filters)
+    return f"""
+        SELECT brand_name, category_name, SUM(net_sales) AS net_sales
+        FROM {src}
+        WHERE brand_name IS NOT NULL AND category_name IS NOT NULL
+        GROUP BY brand_name, category_name
+        ORDER BY brand_name, category_name
+    """, params
+
+
+def discount_effect(filters: tuple) -> Query:
+    # Same [lo, hi) buckets as aggregates.discount_effect; empty buckets are omitted
+    src, params = filtered_sales(filters)
+    buckets = "\n".join(
+        f"WHEN discount >= {lo} AND discount < {hi} THEN {i}"
+        for i, (lo, hi) in enumerate(zip(DISCOUNT_BINS[:-1], DISCOUNT_BINS[1:]))
+    )
+    labels = ", ".join(f"'{label}'" for label in DISCOUNT_LABELS)
+    return f"""
+        SELECT [{labels}][bucket + 1] AS discount_range, total_qty, total_sales
+        FROM (
+            SELECT CASE {buckets} END AS bucket,
+                   SUM(quantity)::BIGINT AS total_qty, SUM(net_sales) AS total_sales
+            FROM {src}
+            GROUP BY bucket
+        )
+        WHERE bucket IS NOT NULL
+        ORDER BY bucket
+    """, params
+
+
+def daily_anomalies(filters: tuple) -> Query:
+    """
+    Daily net sales, trend and anomaly flags from the materialised
+    sales_decomposition (built by the ETL), summed over the selected stores.
+
+    Only the date and store filters apply: the decomposition is per store.
+    """
+    f_date, f_store, _, _ = filters
+    conditions = ["d.date >= ?", "d.date <= ?"]
+    params = [f_date[0], f_date[1]]
+    if f_store:
+        conditions.append(f"st.store_name IN ({', '.join('?' * len(f_store))})")
+        params.extend(f_store)
+    return f"""
+        SELECT
+            d.date,
+            SUM(d.net_sales) AS net_sales,
+            SUM(d.trend + d.seasonal) AS expected,
+            bool_or(d.is_anomaly) AS is_anomaly,
+            string_agg(CASE WHEN d.is_anomaly THEN st.store_name || ' (' || d.direction || ')' END, ', ') AS anomaly_stores
+        FROM sales_decomposition d
+        LEFT JOIN dim_stores st ON d.store_id = st.store_id
+        WHERE {' AND '.join(conditions)}
+        GROUP BY d.date
+        ORDER BY d.date
+    """, params
+
+
+def sale_page(filters: tuple, period: str = 'month', orders_table: bool = False,
+              distinct: bool = True) -> Dict[str, Query]:
+    """
+    Every independent aggregate the Sale dashboard needs, by name.
+
+    orders_table: the warehouse has fact_orders (see order_grain)
+    distinct: compute the KPI distinct counts exactly (see kpis)
+    """
+    return {
+        'kpis': kpis(filters, orders_table, distinct),
+        'trend': trend(filters, period, orders_table),
+        'top_revenue': top_products(filters, 'net_sales'),
+        'top_quantity': top_products(filters, 'quantity'),
+        'brand_category': brand_category(filters),
+        'discount': discount_effect(filters),
+    }
@@ -0,0 +1,209 @@
+"""
+Shared sales data layer for the dashboard pages
+
+Loading, enrichment and formatting helpers that every page used to carry its
+own copy of. Nothing here depends on Streamlit; caching lives in
+analytics.dashboard.
+"""
+
+
+import duckdb as dd
+import numpy as np
+import pandas as pd
+from typing import Iterable, Optional, Tuple
+from analytics.bitmap import BitmapIndex
+from analytics.instrument import instrumented, timed
+from analytics.warehouse import fetch_pandas
+
+
+TABLES = [
+    "dim_customers", "dim_date", "dim_staffs", "dim_products",
+    "dim_brands", "dim_categories", "dim_stores", "fact_sales",
+]
+
+# Dimensions the sidebar filters (and later slicers) resolve through the bitmap index
+INDEXED_DIMENSIONS = ['store_name', 'brand_name', 'category_name', 'customer_state', 'customer_city']
+
+
+@instrumented('warehouse.load')
+def load_tables(db_path: str) -> Tuple[pd.DataFrame, ...]:
+    """
+    Read every warehouse table the dashboards use.
+
+    Returns:
+        (dim_customers, dim_date, dim_staffs, dim_products,
+         dim_brands, dim_categories, dim_stores, fact_sales)
+    """
+    conn = dd.connect(db_path)
+    try:
+        return tuple(fetch_pandas(conn, f"SELECT * FROM {table}") for table in TABLES)
+    finally:
+        conn.close()
+
+
+@instrumented('warehouse.load_orders')
+def load_orders(db_path: str) -> Optional[pd.DataFrame]:
+    """fact_orders (one row per order), or None when the warehouse predates it"""
+    conn = dd.connect(db_path)
+    try:
+        exists = conn.execute(
+            "SELECT count(*) FROM duckdb_tables() WHERE table_name = 'fact_orders'"
+        ).fetchone()[0]
+        return fetch_pandas(conn, "SELECT * FROM fact_orders") if exists else None
+    finally:
+        conn.close()
+
+
+def baht(x):
+    try:
+        return f"฿{x:,.0f}"
+    except Exception:
+        return "-"
+
+
+def pct(x):
+    try:
+        return f"{x*100:.1f}%"
+    except Exception:
+        return "-"
+
+
+def add_period_cols(df):
+    df = df.copy()
+    df['order_date'] = pd.to_datetime(df['order_date'])
+    df['year']   = df['order_date'].dt.year
+    df['quarter']= df['order_date'].dt.to_period('Q').astype(str)
+    df['month']  = df['order_date'].dt.to_period('M').astype(str)
+    df['date']   = df['order_date'].dt.date
+    return df
+
+
+def compute_net_sales(df):
+    df = df.copy()
+    # net_sales = quantity * list_price * (1 - discount)
+    df['net_sales'] = df['quantity'] * df['list_price'] * (1 - df['discount'])
+    return df
+
+
+def growth_rate(series: pd.Series):
+    if len(series) < 2:
+        return 0.0
+    prev, curr = series.iloc[-2], series.iloc[-1]
+    if prev == 0:
+        return np.nan
+    return (curr - prev) / prev
+
+
+@instrumented('warehouse.enrich')
+def enrich_sales(fact_sales, products, categories, brands, stores, customers) -> pd.DataFrame:
+    """
+    Add net sales, period columns and the product/category/brand/store/customer
+    attributes the pages filter and group on.
+    """
+    sales = compute_net_sales(fact_sales)
+    sales = add_period_cols(sales)
+
+    products_lite = products[['product_id','product_name','category_id','brand_id']]
+    sales = sales.merge(products_lite, on='product_id', how='left')
+    sales = sales.merge(categories[['category_id','category_name']], on='category_id', how='left')
+    sales = sales.merge(brands[['brand_id','brand_name']], on='brand_id', how='left')
+    sales = sales.merge(stores[['store_id','store_name']], on='store_id', how='left')
+    sales = sales.merge(customers[['customer_id','customer_city','customer_state']], on='customer_id', how='left')
+    return sales
+
+
+def freeze_filters(f_date, f_store=(), f_brand=(), f_category=()) -> tuple:
+    """Sidebar selections as a hashable, order-independent cache key"""
+    return (
+        tuple(f_date),
+        tuple(sorted(f_store or ())),
+        tuple(sorted(f_brand or ())),
+        tuple(sorted(f_category or ())),
+    )
+
+
+class SalesWarehouse:
+    """
+    One loaded and enriched copy of the warehouse.
+
+    Instances are shared read-only between pages and sessions; pages take
+    filtered copies through filter() and never mutate the frames held here.
+    """
+
+    def __init__(self, db_path: str):
+        (
+            self.dim_customers, self.dim_date, self.dim_staffs, self.dim_products,
+            self.dim_brands, self.dim_categories, self.dim_stores, self.fact_sales
+        ) = load_tables(db_path)
+
+        self.customers  = self.dim_customers
+        self.products   = self.dim_products
+        self.brands     = self.dim_brands
+        self.categories = self.dim_categories
+        self.stores     = self.dim_stores
+        self.staffs     = self.dim_staffs
+
+        self.sales = enrich_sales(
+            self.fact_sales, self.products, self.categories,
+            self.brands, self.stores, self.customers
+        )
+        with timed('warehouse.index'):
+            self.index = BitmapIndex(self.sales, INDEXED_DIMENSIONS)
+        self.min_date = self.sales['order_date'].min()
+        self.max_date = self.sales['order_date'].max()
+
+        # Order grain: net sales per order under the same name as the line frame
+        self.orders = load_orders(db_path)
+        if self.orders is not None:
+            self.orders = add_period_cols(self.orders.rename(columns={'net_amount': 'net_sales'})) \
+                .merge(self.stores[['store_id', 'store_name']], on='store_id', how='left')
+
+    @instrumented('warehouse.mask')
+    def mask(self, f_date, f_store: Optional[Iterable] = None, f_brand: Optional[Iterable] = None,
+             f_category: Optional[Iterable] = None) -> np.ndarray:
+        """
+        Row mask for the sidebar filters.
+
+        Args:
+            f_date: (start, end) dates, inclusive
+            f_store, f_brand, f_category: Selected values; empty means all
+        Returns:
+            Boolean numpy array over self.sales
+        """
+        # Compare datetime64 directly instead of building a Python date per row
+        start = pd.Timestamp(f_date[0]).to_datetime64()
+        end = (pd.Timestamp(f_date[1]) + pd.Timedelta(days=1)).to_datetime64()
+        order_date = self.sales['order_date'].to_numpy()
+        mask = (order_date >= start) & (order_date < end)
+        # มิติ (สาขา/แบรนด์/หมวดหมู่) ใช้ bitmap index: OR ภายในมิติ, AND ข้ามมิติ
+        mask &= self.index.select({
+            'store_name': f_store,
+            'brand_name': f_brand,
+            'category_name': f_category,
+        })
+        return mask
+
+    @instrumented('warehouse.filter')
+    def filter(self, f_date, f_store=None, f_brand=None, f_category=None) -> pd.DataFrame:
+        """Filtered copy of the enriched sales frame (safe for pages to modify)"""
+        return self.sales.loc[self.mask(f_date, f_store, f_brand, f_category)].copy()
+
+    @instrumented('warehouse.filter_orders')
+    def filter_orders(self, f_date, f_store=None, f_brand=None, f_category=None) -> Optional[pd.DataFrame]:
+        """
+        Filtered copy of the order-grain frame, for counting orders with size()
+        instead of nunique over lines.
+
+        Returns:
+            None when there is no fact_orders or a brand/category filter is set
+            (those select order lines, so order metrics need the line frame)
+        """
+        if self.orders is None or f_brand or f_category:
+            return None
+        start = pd.Timestamp(f_date[0]).to_datetime64()
+        end = (pd.Timestamp(f_date[1]) + pd.Timedelta(days=1)).to_datetime64()
+        order_date = self.orders['order_date'].to_numpy()
+        mask = (order_date >= start) & (order_date < end)
+        if f_store:
+            mask &= self.orders['store_name'].isin(f_store).to_numpy()
+        return self.orders.loc[mask].copy()
@@ -0,0 +1,321 @@
+"""
+Behavioural customer segments
+
+Features for every customer in dim_customers come from one SQL aggregation
+over fact_sales: recency, frequency, monetary value, average order value,
+share of spend per category and discount sensitivity (gross-weighted average
+discount). Skewed counts and amounts are log-scaled, everything is z-scored
+and clustered with k-means (k-means++ start, vectorised Lloyd iterations) in
+NumPy.
+
+The job is incremental:
+
+    python -m analytics.segments            # assign new customers to the stored centroids
+    python -m analytics.segments --refit    # refit the centroids and reassign everyone
+
+The model (scaling and centroids) and the assignments live in their own DuckDB
+file (data_cube/segments.duckdb) so the warehouse version is unchanged.
+Customers without orders get segment 0 ("no purchases") until an incremental
+run sees their first order; clusters are numbered from 1 by average spend,
+highest first.
+"""
+
+
+import argparse
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import duckdb as dd
+import numpy as np
+import pandas as pd
+from analytics.warehouse import fetch_pandas
+
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = "data_cube/bikestore.duckdb"
+DEFAULT_OUT = "data_cube/segments.duckdb"
+N_SEGMENTS = 5
+NO_PURCHASES = 0
+# Log-scaled before standardising
+LOG_FEATURES = ('frequency', 'monetary', 'avg_order_value')
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS segment_models (
+        model_id INTEGER, fitted_at TIMESTAMP, k INTEGER, customers INTEGER, inertia DOUBLE
+    );
+    CREATE TABLE IF NOT EXISTS segment_centroids (
+        model_id INTEGER, segment INTEGER, feature VARCHAR, mean DOUBLE, std DOUBLE, centroid DOUBLE
+    );
+    CREATE TABLE IF NOT EXISTS customer_segments (
+        customer_id BIGINT, segment INTEGER, model_id INTEGER, assigned_at TIMESTAMP, distance DOUBLE
+    );
+"""
+
+
+def customer_features(db_path: str) -> pd.DataFrame:
+    """
+    One row per customer in dim_customers (customers without orders included).
+
+    Returns:
+        customer_id, recency_days, frequency, monetary, avg_order_value,
+        discount_rate, share_<category_id> per category
+    """
+    conn = dd.connect(db_path)
+    try:
+        category_ids = [row[0] for row in conn.execute(
+            "SELECT category_id FROM dim_categories ORDER BY category_id").fetchall()]
+        shares = ",\n".join(
+            f"COALESCE(SUM(net) FILTER (WHERE p.category_id = {int(c)}) / NULLIF(SUM(net), 0), 0) AS share_{int(c)}"
+            for c in category_ids
+        )
+        return fetch_pandas(conn, f"""
+            WITH lines AS (
+                SELECT s.customer_id, s.order_id, s.order_date, s.product_id, s.discount,
+                       s.quantity * s.list_price                    AS gross,
+                       s.quantity * s.list_price * (1 - s.discount) AS net
+                FROM fact_sales s
+            ),
+            as_of AS (SELECT max(order_date) AS as_of FROM fact_sales)
+            SELECT
+                c.customer_id,
+                date_diff('day', max(l.order_date), any_value(a.as_of))      AS recency_days,
+                count(DISTINCT l.order_id)                                   AS frequency,
+                COALESCE(SUM(l.net), 0)::DOUBLE                              AS monetary,
+                COALESCE(SUM(l.net) / NULLIF(count(DISTINCT l.order_id), 0), 0)::DOUBLE AS avg_order_value,
+                COALESCE(SUM(l.gross * l.discount) / NULLIF(SUM(l.gross), 0), 0)::DOUBLE AS discount_rate
+                {',' if shares else ''}
+                {shares}
+            FROM dim_customers c
+            LEFT JOIN lines l ON l.customer_id = c.customer_id
+            LEFT JOIN dim_products p ON l.product_id = p.product_id
+            CROSS JOIN as_of a
+            GROUP BY c.customer_id
+            ORDER BY c.customer_id
+        """)
+    finally:
+        conn.close()
+
+
+def feature_matrix(features: pd.DataFrame) -> Tuple[np.ndarray, List[str]]:
+    """Raw clustering matrix (log-scaled where skewed) and its column names"""
+    columns = [c for c in features.columns if c != 'customer_id']
+    x = features[columns].to_numpy(dtype=np.float64)
+    for i, name in enumerate(columns):
+        if name in LOG_FEATURES:
+            x[:, i] = np.log1p(x[:, i])
+    return x, columns
+
+
+def _sq_distances(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    d = (x * x).sum(axis=1)[:, None] - 2 * x @ centroids.T + (centroids * centroids).sum(axis=1)[None, :]
+    return np.maximum(d, 0)
+
+
+def assign(x: np.ndarray, centroids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Nearest centroid and Euclidean distance to it for every row"""
+    d = _sq_distances(x, centroids)
+    labels = d.argmin(axis=1)
+    return labels, np.sqrt(d[np.arange(len(x)), labels])
+
+
+def kmeans(x: np.ndarray, k: int, n_init: int = 4, max_iter: int = 100, tol: float = 1e-6,
+           seed: int = 0) -> Tuple[np.ndarray, np.ndarray, float]:
+    """
+    k-means with k-means++ seeding; the best of n_init runs by inertia.
+
+    Returns:
+        (centroids, labels, inertia)
+    """
+    rng = np.random.default_rng(seed)
+    k = min(k, len(x))
+    best = None
+    for _ in range(n_init):
+        centroids = x[[rng.integers(len(x))]]
+        for _ in range(1, k):
+            d = _sq_distances(x, centroids).min(axis=1)
+            p = d / d.sum() if d.sum() > 0 else None
+            centroids = np.vstack([centroids, x[rng.choice(len(x), p=p)]])
+
+        for _ in range(max_iter):
+            d = _sq_distances(x, centroids)
+            labels = d.argmin(axis=1)
+            counts = np.bincount(labels, minlength=k)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, x)
+            moved = sums / np.maximum(counts, 1)[:, None]
+            # คลัสเตอร์ว่าง: ย้ายไปจุดที่ไกลจากศูนย์ของตัวเองที่สุด
+            for empty in np.flatnonzero(counts == 0):
+                far = d[np.arange(len(x)), labels].argmax()
+                moved[empty] = x[far]
+                d[far] = 0
+            shift = np.abs(moved - centroids).max()
+            centroids = moved
+            if shift <= tol:
+                break
+
+        labels, dist = assign(x, centroids)
+        inertia = float((dist ** 2).sum())
+        if best is None or inertia < best[2]:
+            best = (centroids, labels, inertia)
+    return best
+
+
+def _connect_out(out_path: str) -> dd.DuckDBPyConnection:
+    directory = os.path.dirname(out_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = dd.connect(out_path)
+    conn.execute(SCHEMA)
+    return conn
+
+
+def _write_model(conn, model_id: int, columns: List[str], mean: np.ndarray, std: np.ndarray,
+                 centroids: np.ndarray, customers: int, inertia: float):
+    rows = [(model_id, segment + 1, name, float(mean[j]), float(std[j]), float(centroids[segment, j]))
+            for segment in range(len(centroids)) for j, name in enumerate(columns)]
+    conn.execute("INSERT INTO segment_models VALUES (?, ?, ?, ?, ?)",
+                 [model_id, datetime.now(), len(centroids), customers, inertia])
+    conn.executemany("INSERT INTO segment_centroids VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+
+def _read_model(conn) -> Optional[Tuple[int, List[str], np.ndarray, np.ndarray, np.ndarray]]:
+    row = conn.execute("SELECT max(model_id) FROM segment_models").fetchone()
+    if row[0] is None:
+        return None
+    model = conn.execute(
+        "SELECT segment, feature, mean, std, centroid FROM segment_centroids WHERE model_id = ?", [row[0]]
+    ).df()
+    columns = list(dict.fromkeys(model['feature']))
+    wide = model.pivot(index='segment', columns='feature', values='centroid')[columns].sort_index()
+    first = model[model['segment'] == model['segment'].min()].set_index('feature').loc[columns]
+    return row[0], columns, first['mean'].to_numpy(), first['std'].to_numpy(), wide.to_numpy()
+
+
+def run_job(db_path: str = DB_PATH, out_path: str = DEFAULT_OUT, k: int = N_SEGMENTS,
+            refit: bool = False, seed: int = 0) -> Dict:
+    """
+    Assign segments to customers.
+
+    Without a stored model, or with refit=True, k-means is fitted on every
+    customer with orders and everyone is (re)assigned. Otherwise customers
+    without an assignment, and "no purchases" customers who have since
+    ordered, are placed on the stored centroids.
+
+    Returns:
+        {model_id, refit, assigned, customers}
+    """
+    features = customer_features(db_path)
+    conn = _connect_out(out_path)
+    try:
+        model = None if refit else _read_model(conn)
+        if model is not None:
+            model_id, columns, mean, std, centroids = model
+            if columns != feature_matrix(features.head(0))[1]:
+                logger.info("Feature set changed since the last fit; refitting")
+                model = None
+
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            if model is None:
+                x, columns = feature_matrix(features)
+                buyers = features['frequency'].to_numpy() > 0
+                mean, std = x[buyers].mean(axis=0), x[buyers].std(axis=0)
+                std[std == 0] = 1.0
+                centroids, labels, inertia = kmeans((x[buyers] - mean) / std, k, seed=seed)
+                # เรียงกลุ่มตามยอดซื้อเฉลี่ย มากไปน้อย → กลุ่ม 1 = มูลค่าสูงสุด
+                spend = features.loc[buyers, 'monetary'].groupby(labels).mean()
+                order = spend.sort_values(ascending=False).index.to_numpy()
+                centroids = centroids[order]
+                model_id = (conn.execute("SELECT max(model_id) FROM segment_models").fetchone()[0] or 0) + 1
+                _write_model(conn, model_id, columns, mean, std, centroids, int(buyers.sum()), inertia)
+                conn.execute("DELETE FROM customer_segments")
+                todo = features
+            else:
+                # ลูกค้าใหม่ + ลูกค้าที่เคยอยู่กลุ่ม "ยังไม่เคยซื้อ" แต่ตอนนี้มีออเดอร์แล้ว
+                stored = conn.execute("SELECT customer_id, segment FROM customer_segments").df()
+                first_orders = features['customer_id'].isin(
+                    stored.loc[stored['segment'] == NO_PURCHASES, 'customer_id']) & (features['frequency'] > 0)
+                todo = features[~features['customer_id'].isin(stored['customer_id']) | first_orders]
+                conn.execute("DELETE FROM customer_segments WHERE segment = ? AND customer_id IN (SELECT unnest(?))",
+                             [NO_PURCHASES, todo['customer_id'].tolist()])
+
+            x, _ = feature_matrix(todo)
+            labels, dist = assign((x - mean) / std, centroids)
+            buyers = todo['frequency'].to_numpy() > 0
+            assigned = pd.DataFrame({
+                'customer_id': todo['customer_id'].to_numpy(),
+                'segment': np.where(buyers, labels + 1, NO_PURCHASES),
+                'model_id': model_id,
+                'assigned_at': datetime.now(),
+                'distance': np.where(buyers, dist, np.nan),
+            })
+            conn.register('assigned', assigned)
+            conn.execute("INSERT INTO customer_segments SELECT * FROM assigned")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    logger.info(f"Assigned {len(assigned)} customers with model {model_id} ({'refit' if model is None else 'incremental'})")
+    return {'model_id': model_id, 'refit': model is None, 'assigned': len(assigned), 'customers': len(features)}
+
+
+def segment_label(segment: int) -> str:
+    return "ยังไม่เคยซื้อ" if segment == NO_PURCHASES else f"กลุ่ม {segment}"
+
+
+def load_segments(db_path: str = DB_PATH, out_path: str = DEFAULT_OUT) -> pd.DataFrame:
+    """
+    Customer -> segment with the customer's current features, empty when the
+    job has not run.
+
+    Returns:
+        customer_id, segment, segment_name and the feature columns
+    """
+    if not os.path.exists(out_path):
+        return pd.DataFrame()
+    conn = dd.connect(out_path)
+    try:
+        segments = conn.execute("SELECT customer_id, segment FROM customer_segments").df()
+    finally:
+        conn.close()
+    segments['segment_name'] = segments['segment'].map(segment_label)
+    return segments.merge(customer_features(db_path), on='customer_id', how='left')
+
+
+def segment_profiles(segments: pd.DataFrame, categories: pd.DataFrame) -> pd.DataFrame:
+    """Size, average features and dominant category per segment"""
+    shares = [c for c in segments.columns if c.startswith('share_')]
+    profile = segments.groupby(['segment', 'segment_name']).agg(
+        customers=('customer_id', 'size'),
+        recency_days=('recency_days', 'mean'),
+        frequency=('frequency', 'mean'),
+        monetary=('monetary', 'mean'),
+        avg_order_value=('avg_order_value', 'mean'),
+        discount_rate=('discount_rate', 'mean'),
+        **{c: (c, 'mean') for c in shares},
+    ).reset_index()
+    if shares:
+        names = categories.set_index('category_id')['category_name']
+        top = profile[shares].idxmax(axis=1).str.removeprefix('share_').astype(int)
+        profile['top_category'] = np.where(profile['frequency'] > 0, top.map(names), None)
+    return profile.drop(columns=shares).sort_values('segment')
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Assign behavioural segments to customers")
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--out', default=DEFAULT_OUT)
+    parser.add_argument('--k', type=int, default=N_SEGMENTS, help="Segments when fitting")
+    parser.add_argument('--refit', action='store_true', help="Refit the centroids and reassign every customer")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print(run_job(args.db, args.out, args.k, args.refit, args.seed))
+
+
+if __name__ == '__main__':
+    main()
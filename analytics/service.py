@@ -0,0 +1,83 @@
+"""
+Process-wide aggregate service for non-Streamlit callers
+
+Holds one loaded SalesWarehouse per warehouse version (the pooled connection:
+the warehouse is read once per ETL load and shared by every request) and an
+LRU cache of aggregate results keyed on (version, aggregate, filters, params).
+"""
+
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from analytics import aggregates, instrument
+from analytics.sales import SalesWarehouse
+from analytics.warehouse import warehouse_version
+
+
+# Aggregates that need a dimension table besides the filtered sales frame
+_DIMENSION_ARGS = {
+    'staff_ranking': ('staffs',),
+}
+
+
+class AggregateService:
+    """
+    Thread-safe access to cached dashboard aggregates.
+
+    Args:
+        db_path: Path to bikestore.duckdb
+        max_entries: Result cache size (least recently used results are evicted)
+    """
+
+    def __init__(self, db_path: str, max_entries: int = 512):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._warehouse: Optional[SalesWarehouse] = None
+        self._version: Optional[str] = None
+        self._results: "OrderedDict[tuple, Any]" = OrderedDict()
+
+    def warehouse(self) -> Tuple[str, SalesWarehouse]:
+        """Current (version, warehouse), reloading once after each ETL load"""
+        version = warehouse_version(self.db_path)
+        with self._lock:
+            if version != self._version:
+                self._warehouse = SalesWarehouse(self.db_path)
+                self._version = version
+                self._results.clear()
+            return self._version, self._warehouse
+
+    def get(self, name: str, filters: tuple, **params) -> Tuple[str, Any]:
+        """
+        Cached aggregates.<name> over the filtered sales frame.
+
+        Args:
+            name: Aggregate function name in analytics.aggregates
+            filters: Output of analytics.sales.freeze_filters
+            **params: Aggregate parameters (must be hashable)
+        Returns:
+            (warehouse version, result)
+        """
+        version, wh = self.warehouse()
+        key = (version, name, filters, tuple(sorted(params.items())))
+        instrument.cache_call('service')
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return version, self._results[key]
+
+        instrument.cache_miss('service')
+        func = getattr(aggregates, name)
+        dims = [getattr(wh, attr) for attr in _DIMENSION_ARGS.get(name, ())]
+        result = func(wh.filter(*filters), *dims, **params)
+
+        with self._lock:
+            self._results[key] = result
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        return version, result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'version': self._version, 'cached_results': len(self._results)}
@@ -0,0 +1,258 @@
+"""
+Mergeable approximate distinct counts (HyperLogLog) for the dashboards
+
+Distinct customers and orders cannot be added across pre-aggregated cells, but
+HyperLogLog sketches can be merged: the union of two sketches is the
+element-wise max of their registers. A SketchRollup keeps sketches per cell of
+month x a few dimensions, and a distinct count for any combination of filters
+on those dimensions is a max over the matching cells' registers plus one
+estimate, with no scan of the sales rows. Two rollups are kept (ROLLUPS):
+
+    sidebar   customers and orders per month x store x brand x category
+    state     customers per month x customer state (the state treemap)
+
+Each is kept to the dimensions its filters or breakdown use: every extra
+dimension multiplies the cells towards row grain, and merging thousands of
+2 KB sketches costs more than counting the filtered rows exactly. Pages that
+already hold the filtered rows should count them instead.
+
+Precision 11 (2048 one-byte registers per sketch) gives a standard error of
+about 2.3%. Cells are whole months, so a date range that cuts through a month,
+or a filter on a dimension the rollup lacks, cannot be answered from it;
+answers() tells the pages when to fall back to an exact count, as they also do
+when the user asks for exact counts.
+
+The rollups are persisted per warehouse version in data_cube/sketches.duckdb
+(outside the warehouse, so writing them does not change the version).
+"""
+
+
+import logging
+import os
+from datetime import datetime
+from typing import Dict, Optional
+import duckdb as dd
+import numpy as np
+import pandas as pd
+from analytics.instrument import instrumented
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = "data_cube/sketches.duckdb"
+PRECISION = 11
+# Dimension of each sidebar filter, in analytics.sales.freeze_filters order (after the date range)
+FILTER_DIMENSIONS = ('store_name', 'brand_name', 'category_name')
+# rollup name -> (dimensions, {sketch name: id column counted})
+ROLLUPS = {
+    'sidebar': (FILTER_DIMENSIONS, {'customers': 'customer_id', 'orders': 'order_id'}),
+    'state': (('customer_state',), {'customers': 'customer_id'}),
+}
+
+SCHEMA = """
+    CREATE OR REPLACE TABLE sketch_meta (
+        version VARCHAR, rollup VARCHAR, precision INTEGER, cells INTEGER, built_at TIMESTAMP
+    );
+"""
+
+
+def _bit_length(x: np.ndarray) -> np.ndarray:
+    """Bit length of uint64 values (exact: each 32-bit half fits a float64 mantissa)"""
+    hi = (x >> np.uint64(32)).astype(np.float64)
+    lo = (x & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(hi > 0, 32 + np.frexp(hi)[1], np.frexp(lo)[1])
+
+
+def registers(cells: np.ndarray, values: np.ndarray, n_cells: int, p: int = PRECISION) -> np.ndarray:
+    """
+    HyperLogLog registers of values, one sketch per cell.
+
+    Args:
+        cells: Cell index (0..n_cells-1) of each value
+        values: Values to count (hashed to 64 bits)
+        n_cells: Number of sketches
+        p: Precision; 2**p registers per sketch
+    Returns:
+        uint8 array (n_cells, 2**p)
+    """
+    hashes = pd.util.hash_array(np.asarray(values))
+    index = (hashes >> np.uint64(64 - p)).astype(np.intp)
+    rest = hashes & np.uint64((1 << (64 - p)) - 1)
+    # ตำแหน่งบิต 1 ตัวแรกจากซ้ายของบิตที่เหลือ (64 - p บิต)
+    rank = ((64 - p) - _bit_length(rest) + 1).astype(np.uint8)
+    regs = np.zeros((n_cells, 1 << p), dtype=np.uint8)
+    np.maximum.at(regs, (np.asarray(cells, dtype=np.intp), index), rank)
+    return regs
+
+
+def estimate(regs: np.ndarray) -> np.ndarray:
+    """Cardinality estimate of each sketch (last axis = registers), with linear counting for small sets"""
+    regs = np.asarray(regs)
+    m = regs.shape[-1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.power(2.0, -regs.astype(np.float64)).sum(axis=-1)
+    zeros = (regs == 0).sum(axis=-1)
+    linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+
+class SketchRollup:
+    """
+    Distinct-count sketches per month x dimensions cell.
+
+    Args:
+        cells: One row per cell: month ('YYYY-MM') and the rollup's dimensions
+        sketches: {'customers': (cells, 2**p) registers, ...}
+        min_date, max_date: First and last order date in the warehouse
+    """
+
+    def __init__(self, cells: pd.DataFrame, sketches: dict, min_date, max_date):
+        self.cells = cells.reset_index(drop=True)
+        self.dimensions = tuple(c for c in self.cells.columns if c != 'month')
+        self.sketches = sketches
+        self.min_date = pd.Timestamp(min_date).normalize()
+        self.max_date = pd.Timestamp(max_date).normalize()
+        self.precision = int(np.log2(next(iter(sketches.values())).shape[1]))
+
+    @classmethod
+    @instrumented('sketches.build')
+    def build(cls, sales: pd.DataFrame, dimensions=FILTER_DIMENSIONS, columns: Optional[Dict[str, str]] = None,
+              p: int = PRECISION) -> "SketchRollup":
+        """
+        Sketch the enriched sales frame (analytics.sales.SalesWarehouse.sales).
+
+        Args:
+            dimensions: Cell dimensions besides the month
+            columns: {sketch name: id column counted} (default: the sidebar rollup's)
+        """
+        columns = columns or ROLLUPS['sidebar'][1]
+        keys = ['month', *dimensions]
+        # NaN ในมิติให้เป็นกลุ่มของตัวเอง (ไม่หลุดจาก rollup)
+        grouped = sales.groupby(keys, dropna=False, sort=True)
+        codes = grouped.ngroup().to_numpy()
+        cells = grouped.size().reset_index()[keys]
+        n = len(cells)
+        sketches = {name: registers(codes, sales[column].to_numpy(), n, p) for name, column in columns.items()}
+        return cls(cells, sketches, sales['order_date'].min(), sales['order_date'].max())
+
+    def covers(self, f_date) -> bool:
+        """Whether the date range selects whole months of data (otherwise scan exactly)"""
+        start = max(pd.Timestamp(f_date[0]), self.min_date)
+        end = min(pd.Timestamp(f_date[1]), self.max_date)
+        if start > end:
+            return True
+        starts_month = start.day == 1 or start == self.min_date
+        ends_month = (end + pd.Timedelta(days=1)).day == 1 or end == self.max_date
+        return starts_month and ends_month
+
+    def answers(self, filters: tuple) -> bool:
+        """Whether the rollup can count for these filters: whole months and only filters on its dimensions"""
+        f_date, *selected = filters
+        unsupported = [d for d, values in zip(FILTER_DIMENSIONS, selected) if values and d not in self.dimensions]
+        return not unsupported and self.covers(f_date)
+
+    def _mask(self, filters: tuple) -> np.ndarray:
+        f_date, *selected = filters
+        month = self.cells['month'].to_numpy()
+        mask = (month >= f"{pd.Timestamp(f_date[0]):%Y-%m}") & (month <= f"{pd.Timestamp(f_date[1]):%Y-%m}")
+        for column, values in zip(FILTER_DIMENSIONS, selected):
+            if values:
+                mask &= self.cells[column].isin(values).to_numpy()
+        return mask
+
+    @instrumented('sketches.distinct')
+    def distinct(self, sketch: str, filters: tuple, by: Optional[str] = None):
+        """
+        Approximate distinct customers or orders for the sidebar filters.
+
+        Args:
+            sketch: 'customers' or 'orders'
+            filters: Output of analytics.sales.freeze_filters (check answers() first)
+            by: Optional dimension of this rollup to break the count down by
+        Returns:
+            int, or a DataFrame [by, sketch] when by is given
+        """
+        regs = self.sketches[sketch]
+        mask = self._mask(filters)
+        if by is None:
+            return int(round(float(estimate(regs[mask].max(axis=0)))) if mask.any() else 0)
+        selected = self.cells.loc[mask, by]
+        if selected.empty:
+            return pd.DataFrame({by: [], sketch: []})
+        # รวม sketch ตามกลุ่มในครั้งเดียว: เรียงตามกลุ่มแล้ว max.reduceat
+        labels = selected.astype(str).to_numpy()
+        order = np.argsort(labels, kind='stable')
+        rows = np.flatnonzero(mask)[order]
+        labels, groups = labels[order], selected.to_numpy()[order]
+        starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+        merged = np.maximum.reduceat(regs[rows], starts, axis=0)
+        return pd.DataFrame({by: groups[starts], sketch: np.rint(estimate(merged)).astype(int)})
+
+    def frame(self) -> pd.DataFrame:
+        """Cells with each sketch's registers as bytes, for persisting"""
+        return self.cells.assign(**{name: [row.tobytes() for row in regs] for name, regs in self.sketches.items()})
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame, names, min_date, max_date) -> "SketchRollup":
+        """Inverse of frame(): names are the sketch columns"""
+        sketches = {name: np.vstack([np.frombuffer(blob, dtype=np.uint8) for blob in frame[name]])
+                    for name in names}
+        return cls(frame.drop(columns=list(names)), sketches, min_date, max_date)
+
+
+def save(rollups: Dict[str, SketchRollup], path: str, version: str):
+    """Persist the rollups for one warehouse version (one table per rollup)"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = dd.connect(path)
+    try:
+        conn.execute("BEGIN TRANSACTION")
+        conn.execute(SCHEMA)
+        for name, rollup in rollups.items():
+            frame = rollup.frame()
+            conn.register('frame', frame)
+            conn.execute(f"CREATE OR REPLACE TABLE sketch_{name} AS SELECT * FROM frame")
+            conn.unregister('frame')
+            conn.execute("INSERT INTO sketch_meta VALUES (?, ?, ?, ?, ?)",
+                         [version, name, rollup.precision, len(frame), datetime.now()])
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def load(path: str, version: str, min_date, max_date) -> Optional[Dict[str, SketchRollup]]:
+    """The persisted rollups, or None when they are missing, locked or from another warehouse version"""
+    if not os.path.exists(path):
+        return None
+    try:
+        conn = dd.connect(path)
+    except (dd.IOException, dd.ConnectionException) as e:
+        # ล็อกโดยโปรเซสอื่น (กำลัง save) → สร้างใหม่จาก sales แทนการล่มทั้งหน้า
+        logger.warning(f"Could not open distinct-count sketches at {path}: {e}")
+        return None
+    try:
+        stored = {row[0] for row in conn.execute(
+            "SELECT rollup FROM sketch_meta WHERE version = ?", [version]).fetchall()}
+        if stored != set(ROLLUPS):
+            return None
+        frames = {name: conn.execute(f"SELECT * FROM sketch_{name}").df() for name in ROLLUPS}
+    except (dd.CatalogException, dd.BinderException):
+        return None
+    finally:
+        conn.close()
+    return {name: SketchRollup.from_frame(frame, ROLLUPS[name][1], min_date, max_date)
+            for name, frame in frames.items()}
+
+
+def load_or_build(sales: pd.DataFrame, version: str, path: str = DEFAULT_PATH) -> Dict[str, SketchRollup]:
+    """ROLLUPS for this warehouse version: read from path, or built from sales and saved there"""
+    rollups = load(path, version, sales['order_date'].min(), sales['order_date'].max())
+    if rollups is not None:
+        return rollups
+    rollups = {name: SketchRollup.build(sales, dimensions, columns) for name, (dimensions, columns) in ROLLUPS.items()}
+    try:
+        save(rollups, path, version)
+    except (OSError, dd.Error) as e:
+        logger.warning(f"Could not persist distinct-count sketches to {path}: {e}")
+    return rollups
@@ -0,0 +1,101 @@
+"""
+Warehouse helpers shared by the dashboard pages
+
+All reads go through DuckDB's Arrow export. Results stay in Arrow/Polars until a
+caller explicitly asks for pandas, and pandas frames get Arrow-backed string
+columns so no string column is ever expanded into a NumPy object array.
+"""
+
+
+import os
+import duckdb as dd
+import pandas as pd
+import polars as pl
+import pyarrow as pa
+from typing import Optional, Sequence
+
+
+def warehouse_version(db_path: str) -> str:
+    """
+    Return a token that changes every time the warehouse file is rewritten.
+
+    The ETL replaces every table on each load, so the file's modification time
+    and size are enough to tell two loads apart. Caches keyed on this token are
+    rebuilt once per load instead of once per rerun.
+
+    Args:
+        db_path: Path to the DuckDB database file
+    Returns:
+        Version token string
+    """
+    stat = os.stat(db_path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def fetch_arrow(conn: dd.DuckDBPyConnection, query: str, params: Optional[Sequence] = None) -> pa.Table:
+    """
+    Fetch a query result as an Arrow table.
+
+    DuckDB builds the table straight from its result chunks, so strings never
+    pass through Python objects on the way.
+
+    Args:
+        conn: DuckDB connection or cursor
+        query: SQL query
+        params: Optional prepared-statement parameters
+    Returns:
+        pyarrow Table
+    """
+    return conn.execute(query, params or []).fetch_arrow_table()
+
+
+def fetch_polars(conn: dd.DuckDBPyConnection, query: str, params: Optional[Sequence] = None) -> pl.DataFrame:
+    """
+    Fetch a query result as a Polars DataFrame (zero-copy from Arrow).
+
+    Args:
+        conn: DuckDB connection or cursor
+        query: SQL query
+        params: Optional prepared-statement parameters
+    Returns:
+        Polars DataFrame
+    """
+    return pl.from_arrow(fetch_arrow(conn, query, params))
+
+
+def _arrow_string_dtype(arrow_type: pa.DataType):
+    """types_mapper that keeps string columns Arrow-backed and leaves the rest to NumPy"""
+    is_string_view = getattr(pa.types, "is_string_view", lambda _: False)
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type) or is_string_view(arrow_type):
+        return pd.StringDtype("pyarrow")
+    return None
+
+
+def arrow_to_pandas(table: pa.Table, arrow_dtypes: bool = False) -> pd.DataFrame:
+    """
+    Convert an Arrow table to pandas without building object arrays for strings.
+
+    Args:
+        table: pyarrow Table
+        arrow_dtypes: True to make every column Arrow-backed (pd.ArrowDtype)
+    Returns:
+        pandas DataFrame
+    """
+    types_mapper = pd.ArrowDtype if arrow_dtypes else _arrow_string_dtype
+    return table.to_pandas(types_mapper=types_mapper, date_as_object=False)
+
+
+def fetch_pandas(conn: dd.DuckDBPyConnection, query: str, params: Optional[Sequence] = None,
+                 arrow_dtypes: bool = False) -> pd.DataFrame:
+    """
+    Fetch a query result as pandas through Arrow.
+
+    Args:
+        conn: DuckDB connection or cursor
+        query: SQL query
+        params: Optional prepared-statement parameters
+        arrow_dtypes: True to make every column Arrow-backed (pd.ArrowDtype)
+    Returns:
+        pandas DataFrame
+    """
+    return arrow_to_pandas(fetch_arrow(conn, query, params), arrow_dtypes=arrow_dtypes)
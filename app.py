@@ -1,12 +1,12 @@
 import streamlit as st
 import duckdb as dd
 import polars as pl
+from analytics.warehouse import fetch_polars
 
 conn = dd.connect('data_cube/bikestore.duckdb')
 
 def execute_query(conn, query):
-        result = conn.execute(query).fetchdf()
-        return pl.from_pandas(result)
+        return fetch_polars(conn, query)
 
 st.set_page_config(
     page_title="Dashboard Overview",
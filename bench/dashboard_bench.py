@@ -0,0 +1,393 @@
+"""
+Headless dashboard benchmark
+
+Drives the Streamlit pages with streamlit.testing.v1.AppTest against
+warehouses of increasing size and records, per page and dataset:
+
+    cold start   first run after every st.cache_* and every file the pages
+                 write themselves (PAGE_CACHES: pmei's cube cache, the
+                 distinct-count sketches, the query log) are cleared
+    warm start   first run of a fresh session once the caches are filled
+    reruns       one rerun per scripted interaction: date windows, each
+                 store/brand/category multiselect, each period/select box
+
+with p50/p90/p99/max rerun latency and peak RSS.
+
+The forecast, basket and segment tables are not built by the pages but by
+their batch jobs (python -m analytics.forecast / basket / segments). They
+are run once per dataset before the pages, timed and reported separately
+under "precompute", and are not part of any cold start; --skip-precompute
+leaves them out, so those sections show their "run the job" notice instead.
+
+Datasets:
+    sample  the warehouses shipped in data_cube/
+    sfN     bikestore.duckdb rebuilt by the ETL from bench.synthetic at scale N
+            and sales_dw.duckdb with fact_sales replicated N times
+
+Run from the project root, with the ETL package importable as `src` (its
+src.metrics is what both benchmarks measure memory with):
+    python -m bench.dashboard_bench --scales 1 10 --repeat 2
+    python -m bench.dashboard_bench --skip-sample --pages pmei
+"""
+
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+import duckdb as dd
+import numpy as np
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+from bench.report import environment, write_results
+from src.metrics import PeakRSS, current_rss
+
+
+logger = logging.getLogger(__name__)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PAGES = {
+    "Sale_Dashboard": "pages/Sale_Dashboard.py",
+    "Customer_Dashboard": "pages/Customer_Dashboard.py",
+    "Employee_Dashboard": "pages/Employee_Dashboard.py",
+    "pmei": "pmei.py",
+}
+
+# Pages open these relative to the working directory
+BIKESTORE_DB = "data_cube/bikestore.duckdb"
+SALES_DW_DB = "data_cube/sales_dw.duckdb"
+CUBE_CACHE_DIR = "data_cube/cache"
+# Everything the pages persist themselves; removed before every cold start
+PAGE_CACHES = (CUBE_CACHE_DIR, "data_cube/sketches.duckdb", "data_cube/query_log.duckdb")
+
+PERCENTILES = (50, 90, 99)
+
+# (widget kind, label, action name, apply(widget))
+Step = Tuple[str, str, str, Callable]
+
+
+# -----------------------------
+# 🗄️ Datasets
+# -----------------------------
+def scale_sales_dw(source: str, target: str, factor: int):
+    """Copy sales_dw with fact_sales repeated `factor` times under fresh sale_ids"""
+    conn = dd.connect(target)
+    try:
+        conn.execute(f"ATTACH '{source}' AS src (READ_ONLY)")
+        tables = conn.execute(
+            "SELECT table_name FROM duckdb_tables() WHERE database_name = 'src'"
+        ).fetchall()
+        for (table,) in tables:
+            if table == "fact_sales":
+                conn.execute(f"""
+                    CREATE TABLE fact_sales AS
+                    SELECT * REPLACE (sale_id + t.i * m.span AS sale_id)
+                    FROM src.fact_sales, range({int(factor)}) t(i),
+                         (SELECT max(sale_id) AS span FROM src.fact_sales) m
+                    ORDER BY t.i, sale_id
+                """)
+            else:
+                conn.execute(f"CREATE TABLE {table} AS SELECT * FROM src.{table}")
+        conn.execute("DETACH src")
+    finally:
+        conn.close()
+
+
+def build_bikestore(scale: float, target: str):
+    """Run the real ETL on synthetic sources at `scale` and move its database to target"""
+    # Imported here so the sample dataset works without the ETL package
+    from bench.etl_bench import run_scale
+
+    work_dir = tempfile.mkdtemp(prefix="bikestore-dash-etl-")
+    try:
+        run_scale(scale, work_dir)
+        shutil.move(os.path.join(work_dir, f"sf{scale:g}.duckdb"), target)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def prepare_dataset(name: str, scale: Optional[float], work_dir: str) -> str:
+    """
+    Lay out one dataset as <work_dir>/<name>/data_cube/*.duckdb.
+
+    Args:
+        name: Directory name of the dataset
+        scale: None for the shipped sample, otherwise the scale factor
+        work_dir: Parent directory
+    Returns:
+        Directory to run the pages from
+    """
+    root = os.path.join(work_dir, name)
+    os.makedirs(os.path.join(root, "data_cube"), exist_ok=True)
+    if scale is None:
+        for db in (BIKESTORE_DB, SALES_DW_DB):
+            shutil.copy(os.path.join(REPO_ROOT, db), os.path.join(root, db))
+    else:
+        build_bikestore(scale, os.path.join(root, BIKESTORE_DB))
+        scale_sales_dw(os.path.join(REPO_ROOT, SALES_DW_DB), os.path.join(root, SALES_DW_DB),
+                       max(1, round(scale)))
+    return root
+
+
+def precompute(db_path: str = BIKESTORE_DB) -> Dict[str, Dict]:
+    """
+    Run the batch jobs the pages read from, in the current directory.
+
+    Returns:
+        job -> {seconds, summary} (each job's own run summary)
+    """
+    from analytics import basket, forecast, segments
+
+    jobs = {
+        "forecast": lambda: forecast.run_batch(db_path, force=True),
+        "basket": lambda: basket.run_batch(db_path, force=True),
+        "segments": lambda: segments.run_job(db_path, refit=True),
+    }
+    timings = {}
+    for job, func in jobs.items():
+        started = time.perf_counter()
+        summary = func()
+        timings[job] = {"seconds": round(time.perf_counter() - started, 3), "summary": summary}
+    return timings
+
+
+def dataset_rows(root: str) -> Dict[str, int]:
+    rows = {}
+    for db in (BIKESTORE_DB, SALES_DW_DB):
+        conn = dd.connect(os.path.join(root, db), read_only=True)
+        try:
+            rows[os.path.basename(db)] = conn.execute("SELECT count(*) FROM fact_sales").fetchone()[0]
+        finally:
+            conn.close()
+    return rows
+
+
+# -----------------------------
+# 🎛️ Scripted interactions
+# -----------------------------
+def _find(at: AppTest, kind: str, label: str):
+    for widget in getattr(at, kind):
+        if widget.label == label:
+            return widget
+    return None
+
+
+def _date_steps(widget) -> List[Step]:
+    lo, hi = widget.min, widget.max
+    windows = [
+        ("last 90 days", (max(lo, hi - timedelta(days=89)), hi)),
+        ("first 6 months", (lo, min(hi, lo + timedelta(days=182)))),
+        ("full range", (lo, hi)),
+    ]
+    return [("date_input", widget.label, name, lambda w, v=value: w.set_value(v)) for name, value in windows]
+
+
+def _multiselect_steps(widget) -> List[Step]:
+    options = list(widget.options)
+    picks = [("first option", options[:1]), ("first two", options[:2]), ("cleared", [])]
+    return [("multiselect", widget.label, name, lambda w, v=value: w.set_value(v))
+            for name, value in picks if value or name == "cleared"]
+
+
+def _option_values(widget) -> Optional[List]:
+    """
+    Values behind a selectbox's displayed labels.
+
+    AppTest only sees the formatted labels, so select_index() breaks on widgets
+    with a format_func; labels are mapped back through a dict-based format_func
+    (e.g. format_func=LEVELS.get). None when the labels can't be inverted.
+    """
+    labels = list(widget.options)
+    fmt = widget.format_func
+    try:
+        if all(str(fmt(label)) == label for label in labels):
+            return labels
+    except Exception:
+        pass
+    mapping = getattr(fmt, "__self__", None)
+    if isinstance(mapping, dict):
+        inverse = {str(v): k for k, v in mapping.items()}
+        if all(label in inverse for label in labels):
+            return [inverse[label] for label in labels]
+    return None
+
+
+def _selectbox_steps(widget) -> List[Step]:
+    values = _option_values(widget)
+    if values is None:
+        logger.warning(f"Skipping selectbox {widget.label!r}: can't map its labels back to values")
+        return []
+    start = widget.index or 0
+    order = [i for i in range(len(values)) if i != start] + [start]
+    return [("selectbox", widget.label, f"-> {widget.options[i]}", lambda w, v=values[i]: w.set_value(v))
+            for i in order]
+
+
+def interaction_script(at: AppTest) -> List[Step]:
+    """
+    Filter changes for every date/multiselect/select widget found on the first run.
+
+    Each widget is walked through its changes and put back to where it started,
+    so later widgets are exercised from the default view.
+    """
+    steps = []
+    for widget in at.date_input:
+        steps += _date_steps(widget)
+    for widget in at.multiselect:
+        steps += _multiselect_steps(widget)
+    for widget in at.selectbox:
+        steps += _selectbox_steps(widget)
+    return steps
+
+
+# -----------------------------
+# ⏱️ Measurement
+# -----------------------------
+def clear_caches():
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    for path in PAGE_CACHES:
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+
+
+def _timed_run(at: AppTest) -> Tuple[float, List[str]]:
+    started = time.perf_counter()
+    at.run()
+    seconds = time.perf_counter() - started
+    return seconds, [str(e.value) for e in at.exception]
+
+
+def latency_summary(samples: List[float]) -> Dict:
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples) * 1000
+    summary = {f"p{p}_ms": round(float(np.percentile(values, p)), 1) for p in PERCENTILES}
+    summary.update(count=len(samples), mean_ms=round(float(values.mean()), 1), max_ms=round(float(values.max()), 1))
+    return summary
+
+
+def bench_page(page: str, repeat: int = 1, timeout: float = 300) -> Dict:
+    """
+    Cold start, warm start and scripted reruns of one page in the current directory.
+
+    Args:
+        page: Key of PAGES
+        repeat: Passes over the interaction script (later passes hit the caches)
+        timeout: Per-run AppTest timeout in seconds
+    """
+    script_path = os.path.join(REPO_ROOT, PAGES[page])
+    errors = []
+    clear_caches()
+    with PeakRSS() as rss:
+        at = AppTest.from_file(script_path, default_timeout=timeout)
+        cold, exc = _timed_run(at)
+        errors += exc
+        warm, exc = _timed_run(AppTest.from_file(script_path, default_timeout=timeout))
+        errors += exc
+
+        steps = interaction_script(at)
+        reruns, skipped = [], 0
+        for _ in range(repeat):
+            for kind, label, action, apply in steps:
+                widget = _find(at, kind, label)
+                if widget is None:
+                    skipped += 1
+                    continue
+                apply(widget)
+                seconds, exc = _timed_run(at)
+                errors += exc
+                reruns.append({"widget": kind, "label": label, "action": action,
+                               "ms": round(seconds * 1000, 1), "errors": len(exc)})
+
+    return {
+        "page": page,
+        "cold_start_ms": round(cold * 1000, 1),
+        "warm_start_ms": round(warm * 1000, 1),
+        "rerun": latency_summary([r["ms"] / 1000 for r in reruns]),
+        "interactions": reruns,
+        "skipped_steps": skipped,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "rss_start_mb": round(rss.start / 2**20, 1),
+        "peak_rss_mb": round(rss.peak / 2**20, 1),
+    }
+
+
+def run(scales: List[float], pages: List[str], repeat: int = 1, sample: bool = True,
+        out_path: Optional[str] = None, keep: bool = False, batch_jobs: bool = True) -> Dict:
+    """Benchmark every page on every dataset (after its batch jobs) and write one JSON result file"""
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    datasets = ([("sample", None)] if sample else []) + [(f"sf{s:g}", s) for s in scales]
+    work_dir = tempfile.mkdtemp(prefix="bikestore-dash-bench-")
+    cwd = os.getcwd()
+    results = {
+        "benchmark": "dashboard",
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "environment": environment(streamlit=st.__version__, duckdb=dd.__version__),
+        "repeat": repeat,
+        "runs": [],
+    }
+    try:
+        for name, scale in datasets:
+            logger.info(f"=== Dashboard benchmark on {name} ===")
+            root = prepare_dataset(name, scale, work_dir)
+            run_ = {"dataset": name, "scale": scale, "fact_rows": dataset_rows(root), "pages": []}
+            os.chdir(root)
+            try:
+                run_["precompute"] = precompute() if batch_jobs else None
+                for page in pages:
+                    logger.info(f"{name}: {page}")
+                    run_["pages"].append(bench_page(page, repeat))
+            finally:
+                os.chdir(cwd)
+            results["runs"].append(run_)
+    finally:
+        if keep:
+            logger.info(f"Kept benchmark data in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    results["final_rss_mb"] = round(current_rss() / 2**20, 1)
+    write_results(results, "dashboard", out_path)
+    return results
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Benchmark the dashboards headlessly with AppTest")
+    parser.add_argument("--scales", type=float, nargs="*", default=[1, 10],
+                        help="Synthetic scale factors to run after the shipped sample")
+    parser.add_argument("--pages", nargs="+", choices=list(PAGES), default=list(PAGES))
+    parser.add_argument("--repeat", type=int, default=1, help="Passes over the interaction script")
+    parser.add_argument("--skip-sample", action="store_true", help="Do not run the shipped sample warehouses")
+    parser.add_argument("--out", help="Result file (default: bench/results/dashboard-<time>-<commit>.json)")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated warehouses")
+    parser.add_argument("--skip-precompute", action="store_true",
+                        help="Do not run the forecast/basket/segment batch jobs before the pages")
+    args = parser.parse_args()
+
+    results = run(args.scales, args.pages, args.repeat, not args.skip_sample, args.out, args.keep,
+                  not args.skip_precompute)
+    for run_ in results["runs"]:
+        for job, t in (run_["precompute"] or {}).items():
+            print(f"{run_['dataset']:<7} {job:<19} precompute {t['seconds'] * 1000:>8.0f} ms")
+        for p in run_["pages"]:
+            r = p["rerun"]
+            print(f"{run_['dataset']:<7} {p['page']:<19} cold {p['cold_start_ms']:>8.0f} ms  "
+                  f"warm {p['warm_start_ms']:>7.0f} ms  rerun p50 {r.get('p50_ms', 0):>6.0f} "
+                  f"p90 {r.get('p90_ms', 0):>6.0f} p99 {r.get('p99_ms', 0):>6.0f} ms ({r['count']})  "
+                  f"peak RSS {p['peak_rss_mb']} MB  errors {p['errors']}")
+
+
+if __name__ == "__main__":
+    main()
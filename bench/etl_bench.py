@@ -0,0 +1,217 @@
+"""
+End-to-end ETL benchmark
+
+For each scale factor: generate synthetic source CSVs (bench.synthetic), then
+run the pipeline stages exactly as the nightly job does:
+
+    extract    DataExtractor.extract_data
+    transform  DataTransformer.transform_all_data
+    load       DataLoader.load_all_data
+
+and record wall time, rows, rows/sec and peak RSS per stage and per table
+(the ETL's own src.metrics.RunMetrics, the same numbers as the nightly run
+report), plus the output database size in total and per table (storage blocks).
+Results are written as JSON so runs from different commits can be compared
+(--compare).
+
+Run from the project root, where the ETL package is importable as `src`:
+    python -m bench.etl_bench --scales 1 10 100
+    python -m bench.etl_bench --compare bench/results/etl-old.json bench/results/etl-new.json
+"""
+
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+import duckdb as dd
+import polars as pl
+from bench.report import environment, write_results
+from bench.synthetic import SOURCE_TABLES, SyntheticConfig, generate
+from src.extract import DataExtractor
+from src.load_std import DataLoader
+from src.metrics import RunMetrics, lifetime_peak_rss
+from src.transform import DataTransformer
+
+
+logger = logging.getLogger(__name__)
+
+
+def _point_at(config, data_dir: str, db_path: str):
+    """Aim one stage's Config instance at the synthetic CSVs and a scratch database"""
+    csv_files = {table: f"{table}.csv" for table in SOURCE_TABLES}
+    config.DATA_DIR = data_dir
+    config.CSV_FILES = csv_files
+    config.DATABASE_PATH = db_path
+    config.get_csv_path = lambda table_name: os.path.join(data_dir, csv_files[table_name])
+
+
+def _stage_result(metrics: RunMetrics, name: str) -> Dict:
+    """One stage of a finished run in the benchmark's result format (MB instead of bytes)"""
+    stage = metrics.stages[name]
+    duckdb_bytes = stage["duckdb_memory_after_table_max_bytes"]
+    return {
+        "stage": name,
+        "seconds": stage["seconds"],
+        "rows": stage["rows"],
+        "rows_per_sec": stage["rows_per_sec"],
+        "rss_start_mb": round(stage["rss_start_bytes"] / 2**20, 1),
+        "peak_rss_mb": round(stage["peak_rss_bytes"] / 2**20, 1),
+        "duckdb_memory_after_table_max_mb": round(duckdb_bytes / 2**20, 1) if duckdb_bytes is not None else None,
+        "tables": [{k: v for k, v in t.items() if k != "stage"} for t in metrics.tables if t["stage"] == name],
+    }
+
+
+def table_sizes(db_path: str) -> Dict[str, Dict]:
+    """
+    Rows and on-disk storage per table of the output database.
+
+    storage_bytes is the table's persistent blocks (pragma_storage_info) times
+    the block size. Small segments of several tables can share one block, so
+    for small tables it is an upper bound; the per-table sum can exceed db_bytes.
+    """
+    conn = dd.connect(db_path, read_only=True)
+    try:
+        block_size = conn.execute("SELECT block_size FROM pragma_database_size()").fetchone()[0]
+        tables = conn.execute("SELECT table_name, column_count FROM duckdb_tables() ORDER BY table_name").fetchall()
+        sizes = {}
+        for name, columns in tables:
+            rows = conn.execute(f'SELECT count(*) FROM "{name}"').fetchone()[0]
+            blocks = conn.execute(f"""
+                SELECT count(DISTINCT block_id) FROM (
+                    SELECT block_id FROM pragma_storage_info('{name}') WHERE persistent AND block_id >= 0
+                    UNION ALL
+                    SELECT unnest(additional_block_ids) FROM pragma_storage_info('{name}') WHERE persistent
+                )
+            """).fetchone()[0]
+            sizes[name] = {"rows": rows, "columns": columns, "blocks": blocks, "storage_bytes": blocks * block_size}
+    finally:
+        conn.close()
+    return sizes
+
+
+def run_scale(scale: float, work_dir: str) -> Dict:
+    """Generate one dataset and benchmark the three ETL stages on it"""
+    config = SyntheticConfig.scaled(scale)
+    data_dir = os.path.join(work_dir, f"sf{scale:g}")
+    db_path = os.path.join(work_dir, f"sf{scale:g}.duckdb")
+
+    started = time.perf_counter()
+    source_rows = generate(data_dir, config)
+    generate_seconds = time.perf_counter() - started
+    source_bytes = sum(os.path.getsize(os.path.join(data_dir, f"{t}.csv")) for t in SOURCE_TABLES)
+
+    # The ETL's own RunMetrics times every stage and table, as in the nightly run report
+    metrics = RunMetrics(run_id=f"bench-sf{scale:g}")
+    extractor, transformer, loader = DataExtractor(metrics), DataTransformer(metrics), DataLoader(metrics)
+    for stage in (extractor, transformer, loader):
+        _point_at(stage.config, data_dir, db_path)
+    loader.db_path = db_path
+
+    ok = False
+    try:
+        raw = extractor.extract_data()
+        transformed = transformer.transform_all_data(raw)
+        del raw
+        ok = loader.load_all_data(transformed)
+    finally:
+        loader.disconnect()
+        metrics.finish(ok, db_path)
+
+    stages = [_stage_result(metrics, name) for name in ("extract", "transform", "load")]
+    stages[-1]["ok"] = bool(ok)
+
+    return {
+        "scale": scale,
+        "config": config.as_dict(),
+        "source_rows": source_rows,
+        "source_bytes": source_bytes,
+        "generate_seconds": round(generate_seconds, 3),
+        "stages": stages,
+        "total_seconds": round(sum(s["seconds"] for s in stages), 4),
+        "db_bytes": os.path.getsize(db_path),
+        "db_tables": table_sizes(db_path),
+        "lifetime_peak_rss_mb": round(lifetime_peak_rss() / 2**20, 1),
+    }
+
+
+def run(scales: List[float], out_path: Optional[str] = None, keep: bool = False) -> Dict:
+    """Benchmark every scale factor and write one JSON result file"""
+    work_dir = tempfile.mkdtemp(prefix="bikestore-etl-bench-")
+    try:
+        results = {
+            "benchmark": "etl",
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "environment": environment(polars=pl.__version__, duckdb=dd.__version__),
+            "runs": [],
+        }
+        for scale in scales:
+            logger.info(f"=== ETL benchmark at scale {scale:g} ===")
+            results["runs"].append(run_scale(scale, work_dir))
+    finally:
+        if keep:
+            logger.info(f"Kept benchmark data in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    write_results(results, "etl", out_path)
+    return results
+
+
+def compare(old_path: str, new_path: str) -> List[Dict]:
+    """
+    Per-scale, per-stage wall time and peak RSS change between two result files.
+
+    Returns:
+        Rows of {scale, stage, old_s, new_s, time_ratio, old_rss_mb, new_rss_mb}
+    """
+    with open(old_path) as fh:
+        old = json.load(fh)
+    with open(new_path) as fh:
+        new = json.load(fh)
+    old_stages = {(r["scale"], s["stage"]): s for r in old["runs"] for s in r["stages"]}
+    rows = []
+    for run_ in new["runs"]:
+        for s in run_["stages"]:
+            o = old_stages.get((run_["scale"], s["stage"]))
+            if o is None:
+                continue
+            rows.append({
+                "scale": run_["scale"], "stage": s["stage"],
+                "old_s": o["seconds"], "new_s": s["seconds"],
+                "time_ratio": round(s["seconds"] / o["seconds"], 3) if o["seconds"] else None,
+                "old_rss_mb": o["peak_rss_mb"], "new_rss_mb": s["peak_rss_mb"],
+            })
+    return rows
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Benchmark the ETL pipeline on synthetic data")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--out", help="Result file (default: bench/results/etl-<time>-<commit>.json)")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated CSVs and databases")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        for row in compare(*args.compare):
+            print(f"sf{row['scale']:g} {row['stage']:<10} {row['old_s']:>9.3f}s -> {row['new_s']:>9.3f}s "
+                  f"(x{row['time_ratio']})  peak RSS {row['old_rss_mb']} -> {row['new_rss_mb']} MB")
+        return
+
+    results = run(args.scales, args.out, args.keep)
+    for run_ in results["runs"]:
+        for s in run_["stages"]:
+            print(f"sf{run_['scale']:g} {s['stage']:<10} {s['seconds']:>9.3f}s "
+                  f"{s['rows_per_sec'] or 0:>14,.0f} rows/s  peak RSS {s['peak_rss_mb']} MB")
+        print(f"sf{run_['scale']:g} database   {run_['db_bytes'] / 2**20:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
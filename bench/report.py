@@ -0,0 +1,57 @@
+"""
+Result files shared by the benchmarks
+"""
+
+
+import json
+import logging
+import os
+import platform
+import subprocess
+from datetime import datetime
+from typing import Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+RESULTS_DIR = "bench/results"
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment(**versions) -> Dict:
+    """Commit, interpreter and machine facts stored with every result file"""
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        **versions,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def write_results(results: Dict, name: str, out_path: Optional[str] = None) -> str:
+    """
+    Write a result dict as JSON.
+
+    Args:
+        results: Must contain environment.commit
+        name: Benchmark name, used as the file prefix
+        out_path: Explicit path (default: bench/results/<name>-<time>-<commit>.json)
+    Returns:
+        The path written
+    """
+    if out_path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        out_path = os.path.join(RESULTS_DIR, f"{name}-{stamp}-{results['environment']['commit'] or 'nogit'}.json")
+    with open(out_path, "w") as fh:
+        json.dump(results, fh, indent=2, default=str)
+    logger.info(f"Results written to {out_path}")
+    return out_path
@@ -0,0 +1,387 @@
+"""
+Synthetic BikeStores source data for scale testing
+
+Writes the nine source CSVs (brands, categories, customers, orders,
+order_items, products, staffs, stocks, stores) in the schema
+DataExtractor/DataTransformer read, at any size. Everything is generated with
+vectorised NumPy and the order tables are streamed to disk in chunks, so
+memory stays bounded by the chunk size rather than by the output size.
+
+Skew mirrors the real sample: customer and product popularity follow a Zipf
+law, stores get unequal shares, orders have weekly and yearly seasonality and
+grow year over year, and most orders carry one or two items.
+
+Usage:
+    python -m bench.synthetic --out data/synthetic/sf10 --scale 10
+    python -m bench.synthetic --out data/synthetic/big --customers 5000000 --orders-per-day 30000 --years 5
+"""
+
+
+import argparse
+import logging
+import math
+import os
+import time
+import numpy as np
+import polars as pl
+from datetime import date
+from typing import Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+BRANDS = ["Electra", "Haro", "Heller", "Pure Cycles", "Ritchey", "Strider", "Sun Bicycles", "Surly", "Trek"]
+CATEGORIES = ["Children Bicycles", "Comfort Bicycles", "Cruisers Bicycles", "Cyclocross Bicycles",
+              "Electric Bikes", "Mountain Bikes", "Road Bikes"]
+# (city, state, zip) — the first three are the sample's stores
+CITIES = [
+    ("Santa Cruz", "CA", 95060), ("Baldwin", "NY", 11432), ("Rowlett", "TX", 75088),
+    ("San Jose", "CA", 95127), ("Sacramento", "CA", 95820), ("Fresno", "CA", 93722),
+    ("Buffalo", "NY", 14215), ("Rochester", "NY", 14606), ("Yonkers", "NY", 10701),
+    ("Houston", "TX", 77036), ("Austin", "TX", 78745), ("El Paso", "TX", 79936),
+    ("Portland", "OR", 97229), ("Seattle", "WA", 98103), ("Denver", "CO", 80219),
+    ("Phoenix", "AZ", 85032), ("Chicago", "IL", 60629), ("Miami", "FL", 33186),
+]
+FIRST_NAMES = ["Debra", "Kasha", "Tameka", "Daryl", "Charolette", "Lyndsey", "Latasha", "Jacquline",
+               "Genoveva", "Pamelia", "Deshawn", "Robby", "Lorrie", "Bernita", "Elinore", "Corrina",
+               "Fabiola", "Jayne", "Jenna", "Lennie", "Marcelene", "Erlinda", "Monika", "Carissa"]
+LAST_NAMES = ["Burks", "Todd", "Fisher", "Spence", "Rice", "Stevens", "Hart", "Duke", "Baldwin",
+              "Tucker", "Mccullough", "Martinez", "Ball", "Goodman", "Walton", "Hutchinson",
+              "Alvarez", "Bates", "Santos", "Lyons", "Ramirez", "Hayes", "Horton", "Kane"]
+STREETS = ["Oak", "Pine", "Maple", "Cedar", "Elm", "Lake", "Hill", "Park", "Church", "Market"]
+STREET_SUFFIXES = ["St.", "Ave.", "Rd.", "Ln.", "Dr.", "Court"]
+DISCOUNTS = np.array([0.05, 0.07, 0.10, 0.20])
+SOURCE_TABLES = ["brands", "categories", "customers", "orders", "order_items",
+                 "products", "staffs", "stocks", "stores"]
+
+
+class SyntheticConfig:
+    """
+    Size and shape of a synthetic dataset.
+
+    Defaults reproduce the shipped sample's size (3 stores, ~1.4k customers,
+    ~1.6k orders over three years).
+    """
+
+    def __init__(self, stores: int = 3, customers: int = 1445, products: int = 321,
+                 staff_per_store: int = 3, start_year: int = 2016, years: int = 3,
+                 orders_per_day: float = 1.5, zipf: float = 1.1, seed: int = 42,
+                 chunk_days: int = 30):
+        self.stores = stores
+        self.customers = customers
+        self.products = products
+        self.staff_per_store = staff_per_store
+        self.start_year = start_year
+        self.years = years
+        self.orders_per_day = orders_per_day
+        self.zipf = zipf
+        self.seed = seed
+        self.chunk_days = chunk_days
+
+    @classmethod
+    def scaled(cls, scale: float, **overrides) -> "SyntheticConfig":
+        """
+        Sample-shaped config at `scale` times the sample's order volume.
+
+        Customers grow linearly with scale, stores with its square root and
+        products with its cube root, so per-store and per-product volumes grow too.
+        """
+        params = dict(
+            stores=max(3, round(3 * math.sqrt(scale))),
+            customers=max(10, round(1445 * scale)),
+            products=max(10, round(321 * scale ** (1 / 3))),
+            orders_per_day=1.5 * scale,
+        )
+        params.update(overrides)
+        return cls(**params)
+
+    def as_dict(self) -> Dict:
+        return dict(vars(self))
+
+
+def _zipf_cdf(n: int, s: float, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """
+    Cumulative Zipf(s) weights over n items. With rng the weights are randomly
+    permuted so popularity is not tied to id; without, the first item is the most popular.
+    """
+    weights = 1.0 / np.arange(1, n + 1) ** s
+    if rng is not None:
+        weights = rng.permutation(weights)
+    cdf = np.cumsum(weights)
+    return cdf / cdf[-1]
+
+
+def _draw(cdf: np.ndarray, size: int, rng: np.random.Generator) -> np.ndarray:
+    """0-based indices drawn from a cumulative distribution"""
+    return np.minimum(np.searchsorted(cdf, rng.random(size)), len(cdf) - 1)
+
+
+def _pick(options, idx: np.ndarray) -> pl.Series:
+    return pl.Series(options).gather(idx)
+
+
+def _digits(values: np.ndarray, width: int = 0) -> pl.Series:
+    s = pl.Series(values).cast(pl.String)
+    return s.str.zfill(width) if width else s
+
+
+class SyntheticBikestore:
+    """
+    Generator for one dataset.
+
+    Args:
+        config: Dataset size and shape
+    """
+
+    def __init__(self, config: Optional[SyntheticConfig] = None):
+        self.config = config or SyntheticConfig()
+        self.rng = np.random.default_rng(self.config.seed)
+
+    # ----- dimensions -----
+
+    def brands(self) -> pl.DataFrame:
+        return pl.DataFrame({"brand_id": np.arange(1, len(BRANDS) + 1), "brand_name": BRANDS})
+
+    def categories(self) -> pl.DataFrame:
+        return pl.DataFrame({"category_id": np.arange(1, len(CATEGORIES) + 1), "category_name": CATEGORIES})
+
+    def stores(self) -> pl.DataFrame:
+        n = self.config.stores
+        city = np.arange(n) % len(CITIES)
+        ids = np.arange(1, n + 1)
+        names = [f"{CITIES[c][0]} Bikes" + (f" {i // len(CITIES) + 1}" if i >= len(CITIES) else "")
+                 for i, c in enumerate(city)]
+        return pl.DataFrame({
+            "store_id": ids,
+            "store_name": names,
+            "phone": [f"({100 + i % 900}) {200 + i % 800}-{1000 + i % 9000}" for i in ids],
+            "email": [name.lower().replace(" ", "") + "@bikes.shop" for name in names],
+            "street": [f"{100 + i * 7} {STREETS[i % len(STREETS)]} {STREET_SUFFIXES[i % len(STREET_SUFFIXES)]}" for i in ids],
+            "city": [CITIES[c][0] for c in city],
+            "state": [CITIES[c][1] for c in city],
+            "zip_code": [CITIES[c][2] for c in city],
+        })
+
+    def staffs(self) -> pl.DataFrame:
+        cfg = self.config
+        n = cfg.stores * cfg.staff_per_store
+        staff_id = np.arange(1, n + 1)
+        store_id = (staff_id - 1) // cfg.staff_per_store + 1
+        # The first staff member of each store is its manager; staff 1 manages the managers
+        first_of_store = (store_id - 1) * cfg.staff_per_store + 1
+        manager_id = np.where(staff_id == first_of_store, 1, first_of_store).astype(float)
+        manager_id[0] = np.nan
+        first = _pick(FIRST_NAMES, self.rng.integers(0, len(FIRST_NAMES), n))
+        last = _pick(LAST_NAMES, self.rng.integers(0, len(LAST_NAMES), n))
+        return pl.DataFrame({
+            "staff_id": staff_id,
+            "first_name": first,
+            "last_name": last,
+            "email": (first.str.to_lowercase() + "." + last.str.to_lowercase() + "@bikes.shop"),
+            "phone": [f"(831) 555-{5554 + i:04d}" for i in staff_id],
+            "active": np.ones(n, dtype=np.int64),
+            "store_id": store_id,
+            "manager_id": pl.Series(manager_id).cast(pl.Int64, strict=False),
+        })
+
+    def customers(self) -> pl.DataFrame:
+        n = self.config.customers
+        rng = self.rng
+        first = _pick(FIRST_NAMES, rng.integers(0, len(FIRST_NAMES), n))
+        last = _pick(LAST_NAMES, rng.integers(0, len(LAST_NAMES), n))
+        # Customers concentrate around the first cities (where the sample's stores are)
+        city = _draw(_zipf_cdf(len(CITIES), 1.0), n, rng)
+        customer_id = np.arange(1, n + 1)
+        # About a quarter of customers left a phone number, as in the sample
+        phone = ("(" + _digits(500 + customer_id % 400) + ") " + _digits(100 + customer_id % 900)
+                 + "-" + _digits(customer_id % 10000, 4))
+        return pl.DataFrame({
+            "customer_id": customer_id,
+            "first_name": first,
+            "last_name": last,
+            "phone": phone,
+            "email": first.str.to_lowercase() + "." + last.str.to_lowercase()
+                     + _digits(customer_id) + "@example.com",
+            "street": _digits(rng.integers(1, 9999, n)) + " "
+                      + _pick(STREETS, rng.integers(0, len(STREETS), n)) + " "
+                      + _pick(STREET_SUFFIXES, rng.integers(0, len(STREET_SUFFIXES), n)),
+            "city": _pick([c[0] for c in CITIES], city),
+            "state": _pick([c[1] for c in CITIES], city),
+            "zip_code": pl.Series([c[2] for c in CITIES]).gather(city),
+        }).with_columns(
+            pl.when(pl.Series(rng.random(n) < 0.25)).then(pl.col("phone")).otherwise(None).alias("phone")
+        )
+
+    def products(self) -> pl.DataFrame:
+        cfg = self.config
+        n = cfg.products
+        rng = self.rng
+        brand = rng.integers(0, len(BRANDS), n)
+        category = rng.integers(0, len(CATEGORIES), n)
+        model_year = rng.integers(cfg.start_year, cfg.start_year + cfg.years + 1, n)
+        # List prices are lognormal around ~$800 with a long tail, like the sample
+        price = np.round(np.clip(rng.lognormal(6.6, 0.9, n), 89.99, 11999.99), 0) - 0.01
+        product_id = np.arange(1, n + 1)
+        name = (_pick(BRANDS, brand) + " " + _pick(CATEGORIES, category).str.replace(" Bicycles| Bikes", "")
+                + " " + _digits(product_id) + " - " + _digits(model_year))
+        return pl.DataFrame({
+            "product_id": product_id,
+            "product_name": name,
+            "brand_id": brand + 1,
+            "category_id": category + 1,
+            "model_year": model_year,
+            "list_price": price,
+        })
+
+    def stocks(self) -> pl.DataFrame:
+        cfg = self.config
+        store_id = np.repeat(np.arange(1, cfg.stores + 1), cfg.products)
+        product_id = np.tile(np.arange(1, cfg.products + 1), cfg.stores)
+        return pl.DataFrame({
+            "store_id": store_id,
+            "product_id": product_id,
+            "quantity": self.rng.integers(0, 31, len(store_id)),
+        })
+
+    # ----- facts -----
+
+    def _daily_rate(self, days: np.ndarray, day0: np.datetime64) -> np.ndarray:
+        """Expected orders per day with weekly/yearly seasonality and yearly growth"""
+        cfg = self.config
+        t = (days - day0).astype(np.int64)
+        dates = days.astype("datetime64[D]")
+        weekday = (dates.astype(np.int64) + 3) % 7          # Monday = 0
+        day_of_year = (dates - dates.astype("datetime64[Y]")).astype(np.int64)
+        weekly = np.where(weekday >= 5, 1.3, 0.9)
+        yearly = 1 + 0.35 * np.sin(2 * np.pi * (day_of_year - 80) / 365.25)   # spring/summer peak
+        growth = 1.15 ** (t / 365.25)
+        rate = weekly * yearly * growth
+        return cfg.orders_per_day * rate / rate.mean()
+
+    def iter_orders(self, stores: pl.DataFrame, products: pl.DataFrame):
+        """
+        Yield (orders, order_items) chunks covering config.years, chunk_days at a time.
+        """
+        cfg = self.config
+        rng = self.rng
+        day0 = np.datetime64(date(cfg.start_year, 1, 1), "D")
+        day_end = np.datetime64(date(cfg.start_year + cfg.years, 1, 1), "D")
+        all_days = np.arange(day0, day_end, dtype="datetime64[D]")
+        rates = self._daily_rate(all_days, day0)
+
+        customer_cdf = _zipf_cdf(cfg.customers, cfg.zipf, rng)
+        product_cdf = _zipf_cdf(cfg.products, cfg.zipf, rng)
+        store_cdf = np.cumsum(rng.dirichlet(np.full(cfg.stores, 2.0)))
+        store_cdf /= store_cdf[-1]
+        list_price = products["list_price"].to_numpy()
+
+        next_order_id = 1
+        for start in range(0, len(all_days), cfg.chunk_days):
+            days = all_days[start:start + cfg.chunk_days]
+            per_day = rng.poisson(rates[start:start + cfg.chunk_days])
+            n = int(per_day.sum())
+            if n == 0:
+                continue
+            order_id = np.arange(next_order_id, next_order_id + n)
+            next_order_id += n
+
+            order_date = np.repeat(days, per_day)
+            store = _draw(store_cdf, n, rng)
+            staff_id = store * cfg.staff_per_store + 1 + rng.integers(0, cfg.staff_per_store, n)
+            # 1 = pending, 2 = processing, 3 = rejected, 4 = completed
+            status = np.searchsorted([0.04, 0.08, 0.11], rng.random(n)) + 1
+            required = order_date + rng.integers(1, 4, n).astype("timedelta64[D]")
+            shipped = order_date + rng.integers(1, 4, n).astype("timedelta64[D]")
+            orders = pl.DataFrame({
+                "order_id": order_id,
+                "customer_id": _draw(customer_cdf, n, rng) + 1,
+                "order_status": status,
+                "order_date": order_date,
+                "required_date": required,
+                "shipped_date": shipped,
+                "store_id": store + 1,
+                "staff_id": staff_id,
+            }).with_columns(
+                pl.when(pl.col("order_status") == 4).then(pl.col("shipped_date")).otherwise(None)
+            )
+
+            # Items per order: 1 + Poisson(1.5) capped at 5
+            n_items = np.minimum(1 + rng.poisson(1.5, n), 5)
+            m = int(n_items.sum())
+            item_order = np.repeat(order_id, n_items)
+            first_item = np.repeat(np.cumsum(n_items) - n_items, n_items)
+            product = _draw(product_cdf, m, rng)
+            order_items = pl.DataFrame({
+                "order_id": item_order,
+                "item_id": np.arange(m) - first_item + 1,
+                "product_id": product + 1,
+                "quantity": np.where(rng.random(m) < 0.5, 1, 2),
+                "list_price": list_price[product],
+                "discount": DISCOUNTS[rng.integers(0, len(DISCOUNTS), m)],
+            })
+            yield orders, order_items
+
+    # ----- output -----
+
+    def write(self, out_dir: str) -> Dict[str, int]:
+        """
+        Write all nine CSVs into out_dir.
+
+        Returns:
+            Rows written per table
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        counts = {}
+
+        def write_csv(df: pl.DataFrame, name: str, append: bool = False):
+            path = os.path.join(out_dir, f"{name}.csv")
+            with open(path, "ab" if append else "wb") as fh:
+                df.write_csv(fh, include_header=not append, null_value="NULL", float_precision=2)
+            counts[name] = counts.get(name, 0) + len(df)
+
+        stores, products = self.stores(), self.products()
+        for name, df in [("brands", self.brands()), ("categories", self.categories()),
+                         ("stores", stores), ("staffs", self.staffs()),
+                         ("customers", self.customers()), ("products", products),
+                         ("stocks", self.stocks())]:
+            write_csv(df, name)
+            logger.info(f"Wrote {len(df):,} rows to {name}.csv")
+
+        first = True
+        for orders, order_items in self.iter_orders(stores, products):
+            write_csv(orders, "orders", append=not first)
+            write_csv(order_items, "order_items", append=not first)
+            first = False
+        logger.info(f"Wrote {counts.get('orders', 0):,} orders and {counts.get('order_items', 0):,} order items")
+        return counts
+
+
+def generate(out_dir: str, config: Optional[SyntheticConfig] = None) -> Dict[str, int]:
+    """Generate one dataset into out_dir; returns rows written per table"""
+    return SyntheticBikestore(config).write(out_dir)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Generate synthetic BikeStores source CSVs")
+    parser.add_argument("--out", required=True, help="Output directory")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiple of the sample's order volume")
+    parser.add_argument("--stores", type=int)
+    parser.add_argument("--customers", type=int)
+    parser.add_argument("--products", type=int)
+    parser.add_argument("--years", type=int)
+    parser.add_argument("--start-year", type=int)
+    parser.add_argument("--orders-per-day", type=float)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    overrides = {k: v for k, v in vars(args).items() if k not in ("out", "scale") and v is not None}
+    config = SyntheticConfig.scaled(args.scale, **overrides)
+    started = time.perf_counter()
+    counts = generate(args.out, config)
+    logger.info(f"Generated {sum(counts.values()):,} rows in {time.perf_counter() - started:.1f}s -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
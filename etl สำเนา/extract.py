@@ -2,7 +2,9 @@ import polars as pl
 import os
 from typing import Dict , Optional
 from src.Config import Config
+from src.metrics import RunMetrics, frame_bytes, tracked_stage
 import logging
+import time
 
 # Setup logging
 logging.basicConfig(level=getattr(logging, Config.LOG_LEVEL),
@@ -60,11 +62,13 @@ class SrcChecker:
         return raw_data     
 class DataExtractor:
     
-    def __init__(self):
+    def __init__(self, metrics: Optional[RunMetrics] = None):
         self.config = Config()
+        self.metrics = metrics or RunMetrics()
     
     def extract_csv(self,file_path: str, table_name: str) -> pl.DataFrame:
 
+        started = time.perf_counter()
         try:
             logger.info("Starting ETL process...")
             df = pl.read_csv(file_path,encoding="utf-8",
@@ -72,11 +76,15 @@ class DataExtractor:
                     null_values=["", "NULL", "null", "N/A", "n/a"])
                 # try_parse_dates=True ช่วยให้ Polars พยายามแปลงคอลัมน์ที่เป็นวันที่ให้เป็นชนิดข้อมูล DateTime
             logging.info(f"Successfully extracted {len(df)} rows from {table_name}")
+            self.metrics.table("extract", table_name, len(df), time.perf_counter() - started,
+                               input_bytes=os.path.getsize(file_path), arrow_bytes=frame_bytes(df))
             return df
         except Exception as e:
             logging.error(f"Error reading {file_path}: {e}")
+            self.metrics.table("extract", table_name, None, time.perf_counter() - started)
             return None
 
+    @tracked_stage("extract")
     def extract_data(self) -> dict:
 
         logger.info("📁 Reading the data from file CSVs...")
@@ -4,18 +4,35 @@ from typing import Dict, List, Optional
 import logging
 from pathlib import Path
 from src.Config import Config
+from src.metrics import RunMetrics, duckdb_memory, tracked_stage
+import time
 
 # Setup logging
 logging.basicConfig(level=getattr(logging, Config.LOG_LEVEL))
 logger = logging.getLogger(__name__)
 
+# valid_to of the current version of an inventory row
+OPEN_VALID_TO = "9999-12-31"
+
+# Inventory coverage defaults (override with Config.COVERAGE_WINDOW_DAYS / LEAD_TIME_DAYS / TARGET_COVER_DAYS)
+COVERAGE_WINDOW_DAYS = 90   # trailing sales window for velocity
+LEAD_TIME_DAYS = 14         # cover below this = high stock-out risk
+TARGET_COVER_DAYS = 30      # reorder up to lead time + this much cover
+
+# Daily sales decomposition defaults (override with Config.ANOMALY_WINDOW_DAYS / ANOMALY_Z_THRESHOLD / MIN_ACTIVE_DAY_SHARE)
+SEASONAL_PERIOD_DAYS = 7    # weekly seasonality; the trend is a centred moving average over one period
+ANOMALY_WINDOW_DAYS = 91    # centred window of the rolling median / MAD of the residuals
+ANOMALY_Z_THRESHOLD = 3.5   # |robust z| at or above this is an anomaly (Iglewicz & Hoaglin)
+MIN_ACTIVE_DAY_SHARE = 0.5  # share of days with sales in that window needed to flag anything
+
 class DataLoader:
     """Class for loading data into DuckDB data warehouse"""
     
-    def __init__(self):
+    def __init__(self, metrics: Optional[RunMetrics] = None):
         self.config = Config()
         self.db_path = self.config.DATABASE_PATH
         self.connection = None
+        self.metrics = metrics or RunMetrics()
 
     def connect(self) -> dd.DuckDBPyConnection:
         """
@@ -208,20 +225,84 @@ class DataLoader:
             )
         """)
 
-        # Fact Inventory (current stock per store-product)
+        # Fact Orders (grain = order; rolled up from the order lines)
         self.connection.execute("""
-            CREATE OR REPLACE TABLE fact_inventory (
+            CREATE OR REPLACE TABLE fact_orders (
+                order_id INTEGER PRIMARY KEY,
+                customer_id INTEGER,
+                store_id INTEGER,
+                staff_id INTEGER,
+                order_status INTEGER,
+
+                order_date DATE,
+                required_date DATE,
+                shipped_date DATE,
+
+                line_count INTEGER,
+                units INTEGER,
+                gross_amount DECIMAL(18,2),
+                discount_amount DECIMAL(18,2),
+                net_amount DECIMAL(18,2),
+
+                order_to_ship_days INTEGER,
+                shipped_late BOOLEAN,
+
+                created_at TIMESTAMP
+            )
+        """)
+
+        # Fact Inventory (periodic snapshot date x store x product, stored as validity ranges)
+        # ไม่ใช้ CREATE OR REPLACE: ประวัติสต็อกต้องอยู่ข้ามการโหลดแต่ละรอบ
+        columns = [row[0] for row in self.connection.execute(
+            "SELECT column_name FROM information_schema.columns WHERE table_name = 'fact_inventory'"
+        ).fetchall()]
+        if columns and "valid_from" not in columns:
+            # ตารางรุ่นเก่า (store_id, product_id, quantity_on_hand) ไม่เคยมีข้อมูล
+            logger.info("Replacing the old fact_inventory layout with validity ranges")
+            self.connection.execute("DROP TABLE fact_inventory")
+        self.connection.execute(f"""
+            CREATE TABLE IF NOT EXISTS fact_inventory (
                 store_id INTEGER,
                 product_id INTEGER,
                 quantity_on_hand INTEGER,
-                PRIMARY KEY (store_id, product_id)
+                valid_from DATE NOT NULL,                               -- first snapshot with this quantity
+                valid_to DATE NOT NULL DEFAULT DATE '{OPEN_VALID_TO}',  -- exclusive; open = current
+                PRIMARY KEY (store_id, product_id, valid_from)
             )
         """)
+        # Stock on a given date: SELECT * FROM inventory_on(DATE '2018-06-30')
+        self.connection.execute("""
+            CREATE OR REPLACE MACRO inventory_on(d) AS TABLE
+            SELECT store_id, product_id, quantity_on_hand
+            FROM fact_inventory
+            WHERE valid_from <= d AND valid_to > d
+        """)
+        self.connection.execute(f"""
+            CREATE OR REPLACE VIEW fact_inventory_current AS
+            SELECT store_id, product_id, quantity_on_hand, valid_from AS as_of
+            FROM fact_inventory
+            WHERE valid_to = DATE '{OPEN_VALID_TO}'
+        """)
+        # One row per day for tools that expect the classic periodic-snapshot grain
+        self.connection.execute("""
+            CREATE OR REPLACE VIEW fact_inventory_daily AS
+            SELECT CAST(d.snapshot_date AS DATE) AS snapshot_date,
+                   f.store_id, f.product_id, f.quantity_on_hand
+            FROM fact_inventory f,
+                 LATERAL (
+                     SELECT unnest(generate_series(
+                         f.valid_from::TIMESTAMP,
+                         (least(f.valid_to, current_date + 1) - 1)::TIMESTAMP,
+                         INTERVAL 1 DAY
+                     )) AS snapshot_date
+                 ) d
+        """)
 
     def load_dataframe(self, df: pl.DataFrame, table_name: str) -> bool:
         """
         Load Polars DataFrame into DuckDB table (replace mode)
         """
+        started = time.perf_counter()
         try:
             if not self.connection:
                 self.connect()
@@ -237,18 +318,299 @@ class DataLoader:
 
             self.connection.unregister("temp_table")
             logger.info(f"Successfully loaded {len(df)} rows into {table_name}")
+            self.metrics.table("load", table_name, len(df), time.perf_counter() - started,
+                               arrow_bytes=arrow_table.nbytes,
+                               duckdb_memory_bytes=duckdb_memory(self.connection))
             return True
         except Exception as e:
             logger.error(f"Error loading data into {table_name}: {str(e)}")
+            self.metrics.table("load", table_name, None, time.perf_counter() - started)
             return False
 
+    def load_inventory_snapshot(self, df: pl.DataFrame, table_name: str = "fact_inventory") -> bool:
+        """
+        Merge one stock snapshot into fact_inventory as validity ranges.
+
+        Unchanged store-products keep their open row, so history grows only when
+        a quantity changes. Changed rows are closed at the snapshot date and get a
+        new open row; store-products missing from the snapshot are closed.
+        Re-running the same date corrects that day's rows in place.
+
+        Args:
+            df: Output of DataTransformer.transform_inventory_snapshot (one snapshot_date)
+            table_name: Target table
+        Returns:
+            True on success
+        """
+        started = time.perf_counter()
+        try:
+            if not self.connection:
+                self.connect()
+            dates = df["snapshot_date"].unique().to_list()
+            if len(dates) != 1:
+                raise ValueError(f"expected one snapshot_date, got {len(dates)}")
+            snapshot_date = dates[0]
+            latest = self.connection.execute(f"SELECT max(valid_from) FROM {table_name}").fetchone()[0]
+            if latest is not None and snapshot_date < latest:
+                raise ValueError(f"snapshot {snapshot_date} is older than the latest snapshot {latest}")
+
+            arrow_table = df.to_arrow()
+            self.connection.register("snapshot", arrow_table)
+            open_row = f"f.valid_to = DATE '{OPEN_VALID_TO}'"
+            same_key = "s.store_id = f.store_id AND s.product_id = f.product_id"
+            self.connection.execute("BEGIN TRANSACTION")
+            try:
+                # 1) snapshot เดิมของวันเดียวกัน (รันซ้ำ): แก้จำนวนในแถวเดิม / ลบแถวที่หายไป
+                self.connection.execute(f"""
+                    UPDATE {table_name} f SET quantity_on_hand = s.quantity_on_hand
+                    FROM snapshot s
+                    WHERE {same_key} AND {open_row} AND f.valid_from = ?
+                      AND f.quantity_on_hand IS DISTINCT FROM s.quantity_on_hand
+                """, [snapshot_date])
+                self.connection.execute(f"""
+                    DELETE FROM {table_name} f
+                    WHERE {open_row} AND f.valid_from = ?
+                      AND NOT EXISTS (SELECT 1 FROM snapshot s WHERE {same_key})
+                """, [snapshot_date])
+                # แก้แล้วจำนวนกลับไปเท่าช่วงก่อนหน้า: ต่อช่วงเดิมแทนการเก็บสองช่วงติดกัน
+                self.connection.execute(f"""
+                    UPDATE {table_name} f SET valid_to = DATE '{OPEN_VALID_TO}'
+                    WHERE f.valid_to = ? AND EXISTS (
+                        SELECT 1 FROM {table_name} g
+                        WHERE g.store_id = f.store_id AND g.product_id = f.product_id
+                          AND g.valid_from = ? AND g.quantity_on_hand IS NOT DISTINCT FROM f.quantity_on_hand
+                    )
+                """, [snapshot_date, snapshot_date])
+                self.connection.execute(f"""
+                    DELETE FROM {table_name} f
+                    WHERE {open_row} AND f.valid_from = ? AND EXISTS (
+                        SELECT 1 FROM {table_name} g
+                        WHERE g.store_id = f.store_id AND g.product_id = f.product_id
+                          AND g.valid_to = DATE '{OPEN_VALID_TO}' AND g.valid_from < f.valid_from
+                    )
+                """, [snapshot_date])
+                # 2) ปิดช่วงของแถวที่จำนวนเปลี่ยนหรือไม่อยู่ใน snapshot แล้ว
+                closed = self.connection.execute(f"""
+                    UPDATE {table_name} f SET valid_to = ?
+                    WHERE {open_row} AND f.valid_from < ?
+                      AND NOT EXISTS (
+                          SELECT 1 FROM snapshot s
+                          WHERE {same_key} AND s.quantity_on_hand IS NOT DISTINCT FROM f.quantity_on_hand
+                      )
+                """, [snapshot_date, snapshot_date]).fetchone()[0]
+                # 3) เปิดช่วงใหม่ให้ทุก store-product ที่ยังไม่มีแถวปัจจุบัน
+                opened = self.connection.execute(f"""
+                    INSERT INTO {table_name} (store_id, product_id, quantity_on_hand, valid_from, valid_to)
+                    SELECT s.store_id, s.product_id, s.quantity_on_hand, s.snapshot_date, DATE '{OPEN_VALID_TO}'
+                    FROM snapshot s
+                    WHERE NOT EXISTS (SELECT 1 FROM {table_name} f WHERE {same_key} AND {open_row})
+                """).fetchone()[0]
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+            finally:
+                self.connection.unregister("snapshot")
+
+            logger.info(f"Inventory snapshot {snapshot_date}: {len(df)} store-products, "
+                        f"{opened} new ranges, {closed} closed, {len(df) - opened} unchanged")
+            self.metrics.table("load", table_name, len(df), time.perf_counter() - started,
+                               arrow_bytes=arrow_table.nbytes, ranges_opened=opened, ranges_closed=closed,
+                               duckdb_memory_bytes=duckdb_memory(self.connection))
+            return True
+        except Exception as e:
+            logger.error(f"Error loading inventory snapshot into {table_name}: {str(e)}")
+            self.metrics.table("load", table_name, None, time.perf_counter() - started)
+            return False
+
+    def build_inventory_coverage(self, table_name: str = "inventory_coverage") -> bool:
+        """
+        Materialise days-of-cover, sell-through and stock-out risk per store x product.
+
+        One set-based pass: current stock (open fact_inventory rows) full-joined
+        with trailing-window sales velocity from fact_sales. The window ends at
+        the latest order date, so a historical warehouse still gets a meaningful
+        velocity.
+
+        Columns: as_of, window_days, store_id, product_id, quantity_on_hand,
+        units_sold, daily_velocity, days_of_cover (NULL without demand),
+        sell_through (sold / (sold + on hand)), stock_out_risk
+        ('out of stock' | 'high' | 'medium' | 'low' | 'no demand'), reorder_qty
+
+        Returns:
+            True on success
+        """
+        window = int(getattr(self.config, "COVERAGE_WINDOW_DAYS", COVERAGE_WINDOW_DAYS))
+        lead = int(getattr(self.config, "LEAD_TIME_DAYS", LEAD_TIME_DAYS))
+        target = int(getattr(self.config, "TARGET_COVER_DAYS", TARGET_COVER_DAYS))
+        started = time.perf_counter()
+        try:
+            if not self.connection:
+                self.connect()
+            rows = self.connection.execute(f"""
+                CREATE OR REPLACE TABLE {table_name} AS
+                WITH as_of AS (
+                    SELECT max(order_date)::DATE AS as_of FROM fact_sales
+                ),
+                sold AS (
+                    SELECT s.store_id, s.product_id, SUM(s.quantity)::BIGINT AS units_sold
+                    FROM fact_sales s, as_of a
+                    WHERE s.order_date::DATE >  a.as_of - {window}
+                      AND s.order_date::DATE <= a.as_of
+                    GROUP BY s.store_id, s.product_id
+                ),
+                stock AS (
+                    SELECT store_id, product_id, quantity_on_hand
+                    FROM fact_inventory
+                    WHERE valid_to = DATE '{OPEN_VALID_TO}'
+                ),
+                joined AS (
+                    SELECT
+                        COALESCE(st.store_id, sd.store_id)         AS store_id,
+                        COALESCE(st.product_id, sd.product_id)     AS product_id,
+                        COALESCE(st.quantity_on_hand, 0)           AS quantity_on_hand,
+                        COALESCE(sd.units_sold, 0)                 AS units_sold,
+                        COALESCE(sd.units_sold, 0) / {window}::DOUBLE AS daily_velocity
+                    FROM stock st
+                    FULL OUTER JOIN sold sd
+                      ON st.store_id = sd.store_id AND st.product_id = sd.product_id
+                )
+                SELECT
+                    a.as_of,
+                    {window} AS window_days,
+                    j.store_id, j.product_id, j.quantity_on_hand, j.units_sold, j.daily_velocity,
+                    CASE WHEN j.daily_velocity > 0 THEN j.quantity_on_hand / j.daily_velocity END AS days_of_cover,
+                    j.units_sold / NULLIF(j.units_sold + j.quantity_on_hand, 0)::DOUBLE AS sell_through,
+                    CASE
+                        WHEN j.daily_velocity = 0 THEN 'no demand'
+                        WHEN j.quantity_on_hand <= 0 THEN 'out of stock'
+                        WHEN j.quantity_on_hand / j.daily_velocity < {lead} THEN 'high'
+                        WHEN j.quantity_on_hand / j.daily_velocity < {2 * lead} THEN 'medium'
+                        ELSE 'low'
+                    END AS stock_out_risk,
+                    GREATEST(CEIL(j.daily_velocity * {lead + target}) - j.quantity_on_hand, 0)::INTEGER AS reorder_qty
+                FROM joined j, as_of a
+                ORDER BY j.store_id, j.product_id
+            """).fetchone()[0]
+            logger.info(f"Materialised {rows} rows into {table_name} ({window}-day velocity)")
+            self.metrics.table("load", table_name, rows, time.perf_counter() - started,
+                               duckdb_memory_bytes=duckdb_memory(self.connection))
+            return True
+        except Exception as e:
+            logger.error(f"Error building {table_name}: {str(e)}")
+            self.metrics.table("load", table_name, None, time.perf_counter() - started)
+            return False
+
+    def build_sales_decomposition(self, table_name: str = "sales_decomposition") -> bool:
+        """
+        Materialise a seasonal decomposition of daily net sales per store with anomaly flags.
+
+        Additive decomposition in window functions: every day from a store's
+        first to last sale (days without sales = 0), trend = centred 7-day
+        moving average, seasonal = mean detrended value per weekday (the seven
+        weekday means centred to sum to 0, whatever their day counts), residual
+        = the rest. robust_z scales each residual by a centred rolling median
+        and MAD (ANOMALY_WINDOW_DAYS), so the threshold follows the store's
+        volatility as it grows.
+
+        A store that sells on only a few days has mostly zero days, so the
+        median residual sits near zero and every sale looks extreme. Days are
+        only flagged where at least MIN_ACTIVE_DAY_SHARE of the rolling window
+        had sales; sparse stretches keep their robust_z but are never anomalies.
+
+        Columns: store_id, date, net_sales, trend, seasonal, residual,
+        robust_z (NULL where the MAD is 0), active_share (share of days with
+        sales in the window), is_anomaly, direction ('spike' | 'dip')
+
+        Returns:
+            True on success
+        """
+        window = int(getattr(self.config, "ANOMALY_WINDOW_DAYS", ANOMALY_WINDOW_DAYS))
+        threshold = float(getattr(self.config, "ANOMALY_Z_THRESHOLD", ANOMALY_Z_THRESHOLD))
+        min_active = float(getattr(self.config, "MIN_ACTIVE_DAY_SHARE", MIN_ACTIVE_DAY_SHARE))
+        half_period, half_window = SEASONAL_PERIOD_DAYS // 2, window // 2
+        started = time.perf_counter()
+        try:
+            if not self.connection:
+                self.connect()
+            rows = self.connection.execute(f"""
+                CREATE OR REPLACE TABLE {table_name} AS
+                WITH daily AS (
+                    SELECT store_id, order_date::DATE AS date,
+                           SUM(quantity * list_price * (1 - discount))::DOUBLE AS net_sales
+                    FROM fact_sales
+                    WHERE store_id IS NOT NULL AND order_date IS NOT NULL
+                    GROUP BY store_id, order_date::DATE
+                ),
+                days AS (
+                    SELECT store_id, unnest(generate_series(min(date), max(date), INTERVAL 1 DAY))::DATE AS date
+                    FROM daily
+                    GROUP BY store_id
+                ),
+                trended AS (
+                    SELECT d.store_id, d.date, COALESCE(s.net_sales, 0) AS net_sales,
+                           avg(COALESCE(s.net_sales, 0)) OVER (
+                               PARTITION BY d.store_id ORDER BY d.date
+                               ROWS BETWEEN {half_period} PRECEDING AND {half_period} FOLLOWING
+                           ) AS trend
+                    FROM days d
+                    LEFT JOIN daily s ON s.store_id = d.store_id AND s.date = d.date
+                ),
+                weekday AS (
+                    SELECT store_id, isodow(date) AS dow, avg(net_sales - trend) AS weekday_mean
+                    FROM trended
+                    GROUP BY store_id, isodow(date)
+                ),
+                seasonal AS (
+                    SELECT store_id, dow, weekday_mean - avg(weekday_mean) OVER (PARTITION BY store_id) AS seasonal
+                    FROM weekday
+                ),
+                decomposed AS (
+                    SELECT t.store_id, t.date, t.net_sales, t.trend, w.seasonal
+                    FROM trended t
+                    JOIN seasonal w ON w.store_id = t.store_id AND w.dow = isodow(t.date)
+                ),
+                centred AS (
+                    SELECT *, net_sales - trend - seasonal AS residual,
+                           median(net_sales - trend - seasonal) OVER rolling AS residual_median,
+                           avg((net_sales > 0)::DOUBLE) OVER rolling AS active_share
+                    FROM decomposed
+                    WINDOW rolling AS (PARTITION BY store_id ORDER BY date
+                                       ROWS BETWEEN {half_window} PRECEDING AND {half_window} FOLLOWING)
+                ),
+                scored AS (
+                    SELECT *,
+                           0.6745 * (residual - residual_median) / NULLIF(median(abs(residual - residual_median)) OVER (
+                               PARTITION BY store_id ORDER BY date
+                               ROWS BETWEEN {half_window} PRECEDING AND {half_window} FOLLOWING
+                           ), 0) AS robust_z
+                    FROM centred
+                )
+                SELECT store_id, date, net_sales, trend, seasonal, residual, robust_z, active_share,
+                       COALESCE(abs(robust_z) >= {threshold} AND active_share >= {min_active}, false) AS is_anomaly,
+                       CASE WHEN abs(robust_z) >= {threshold} AND active_share >= {min_active}
+                            THEN CASE WHEN robust_z > 0 THEN 'spike' ELSE 'dip' END END AS direction
+                FROM scored
+                ORDER BY store_id, date
+            """).fetchone()[0]
+            anomalies = self.connection.execute(f"SELECT count(*) FROM {table_name} WHERE is_anomaly").fetchone()[0]
+            logger.info(f"Materialised {rows} rows into {table_name} ({anomalies} anomalous store-days)")
+            self.metrics.table("load", table_name, rows, time.perf_counter() - started,
+                               duckdb_memory_bytes=duckdb_memory(self.connection))
+            return True
+        except Exception as e:
+            logger.error(f"Error building {table_name}: {str(e)}")
+            self.metrics.table("load", table_name, None, time.perf_counter() - started)
+            return False
+
+    @tracked_stage("load")
     def load_all_data(self, transformed_data: Dict[str, pl.DataFrame]) -> bool:
         """
         Load all transformed data into the data warehouse
         Expected keys:
         - dim_date, dim_customers, dim_brands, dim_categories, dim_products,
             dim_stores, dim_staffs, dim_order_status,
-            fact_sales, fact_inventory
+            fact_sales, fact_orders, fact_inventory
         """
         logger.info("Starting data loading process")
         if not self.connection:
@@ -284,10 +646,12 @@ class DataLoader:
                     success_count += 1
 
         # Load facts
-        fact_order = ["fact_sales", "fact_inventory"]
+        fact_order = ["fact_sales", "fact_orders", "fact_inventory"]
         for name in fact_order:
             if name in transformed_data:
-                if self.load_dataframe(transformed_data[name], name):
+                # fact_inventory สะสมประวัติ จึง merge แทนการแทนที่ทั้งตาราง
+                load = self.load_inventory_snapshot if name == "fact_inventory" else self.load_dataframe
+                if load(transformed_data[name], name):
                     success_count += 1
 
         # Load any remaining tables (ถ้ามี key อื่นๆ)
@@ -297,4 +661,11 @@ class DataLoader:
                     success_count += 1
 
         logger.info(f"Data loading complete: {success_count}/{total_tables} tables loaded successfully")
-        return success_count == total_tables
\ No newline at end of file
+
+        # ตารางสรุปที่คำนวณจาก fact หลังโหลดเสร็จ (materialised)
+        derived_ok = True
+        if "fact_sales" in transformed_data or "fact_inventory" in transformed_data:
+            derived_ok = self.build_inventory_coverage()
+        if "fact_sales" in transformed_data:
+            derived_ok = self.build_sales_decomposition() and derived_ok
+        return success_count == total_tables and derived_ok
\ No newline at end of file
@@ -0,0 +1,324 @@
+"""
+Run metrics for the ETL pipeline
+
+One RunMetrics collects, for every stage (extract, transform, load) and every
+table inside it: wall time, rows, input bytes, Arrow/Polars buffer sizes,
+throughput, peak process RSS (which is where Polars allocates) and DuckDB's
+own memory use after each table. At the end of a run it is written as a JSON
+run report and as a Prometheus textfile for node_exporter's textfile
+collector, so slow or bloated nightly runs can be alerted on and the
+bottleneck table found.
+
+PeakRSS, current_rss and lifetime_peak_rss are also what bench/ measures
+with, so benchmark and production numbers are comparable.
+
+Usage:
+    metrics = RunMetrics()
+    extractor = DataExtractor(metrics)
+    transformer = DataTransformer(metrics)
+    loader = DataLoader(metrics)
+    ...
+    metrics.finish(success=ok)
+    write_reports(metrics)
+"""
+
+
+import functools
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+import polars as pl
+
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = "bikestore_etl"
+DEFAULT_METRICS_DIR = "metrics"
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes (0 when it cannot be read)"""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def lifetime_peak_rss() -> int:
+    """Peak RSS of the whole process so far, in bytes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class PeakRSS:
+    """
+    Context manager sampling RSS on a background thread to find the peak of one stage.
+
+    ru_maxrss only reports the lifetime peak, so stages after the biggest one
+    would all report the same number; sampling gives a per-stage figure.
+
+    Args:
+        interval: Seconds between samples
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.start: int = 0
+        self.peak: int = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self) -> "PeakRSS":
+        self.start = self.peak = current_rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+        return False
+
+
+def frame_bytes(df) -> Optional[int]:
+    """In-memory size of a Polars frame's Arrow buffers"""
+    try:
+        return int(df.estimated_size())
+    except AttributeError:
+        return None
+
+
+def duckdb_memory(connection) -> Optional[int]:
+    """Bytes DuckDB's buffer manager currently holds for this database instance"""
+    try:
+        return int(connection.execute(
+            "SELECT COALESCE(SUM(memory_usage_bytes), 0) FROM duckdb_memory()"
+        ).fetchone()[0])
+    except Exception:
+        return None
+
+
+class RunMetrics:
+    """
+    Metrics of one ETL run, shared by DataExtractor, DataTransformer and DataLoader.
+
+    Args:
+        run_id: Identifier for the run (default: timestamp plus a short random suffix)
+    """
+
+    def __init__(self, run_id: Optional[str] = None):
+        self.started_at = datetime.now()
+        self.run_id = run_id or f"{self.started_at:%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+        self.stages: Dict[str, Dict] = {}
+        self.tables: List[Dict] = []
+        self.success: Optional[bool] = None
+        self.finished_at: Optional[datetime] = None
+        self.database_bytes: Optional[int] = None
+        self._started = time.perf_counter()
+        self._seconds: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time one stage and sample its peak RSS; table records made inside are attributed to it"""
+        rss = PeakRSS()
+        started = time.perf_counter()
+        try:
+            with rss:
+                yield self
+        finally:
+            seconds = time.perf_counter() - started
+            tables = [t for t in self.tables if t["stage"] == name]
+            rows = sum(t["rows"] or 0 for t in tables)
+            # duckdb_memory() is current usage, read after each table: the largest reading, not a true peak
+            duckdb_readings = [t["duckdb_memory_bytes"] for t in tables if t.get("duckdb_memory_bytes") is not None]
+            self.stages[name] = {
+                "stage": name,
+                "seconds": round(seconds, 4),
+                "tables": len(tables),
+                "rows": rows,
+                "rows_per_sec": round(rows / seconds, 1) if seconds > 0 else None,
+                "input_bytes": sum(t.get("input_bytes") or 0 for t in tables),
+                "arrow_bytes": sum(t.get("arrow_bytes") or 0 for t in tables),
+                "rss_start_bytes": rss.start,
+                "peak_rss_bytes": rss.peak,
+                "duckdb_memory_after_table_max_bytes": max(duckdb_readings) if duckdb_readings else None,
+            }
+            logger.info(f"Stage {name}: {rows} rows in {seconds:.2f}s, "
+                        f"peak RSS {rss.peak / 2**20:.1f} MB")
+
+    def table(self, stage: str, table: str, rows: Optional[int], seconds: float,
+              input_bytes: Optional[int] = None, arrow_bytes: Optional[int] = None, **extra):
+        """
+        Record one table handled by one stage.
+
+        Args:
+            stage: extract, transform or load
+            table: Source or target table name
+            rows: Rows produced (None when the step failed)
+            seconds: Wall time
+            input_bytes: Bytes read from the source (CSV size for extract)
+            arrow_bytes: Size of the resulting Arrow/Polars buffers
+            **extra: Other per-table numbers (e.g. duckdb_memory_bytes)
+        """
+        record = {
+            "stage": stage,
+            "table": table,
+            "rows": rows,
+            "seconds": round(seconds, 4),
+            "rows_per_sec": round(rows / seconds, 1) if rows and seconds > 0 else None,
+            "input_bytes": input_bytes,
+            "arrow_bytes": arrow_bytes,
+            **extra,
+        }
+        with self._lock:
+            self.tables.append(record)
+
+    def finish(self, success: bool, database_path: Optional[str] = None):
+        """Close the run; database_path adds the size of the loaded warehouse file"""
+        self.success = bool(success)
+        self.finished_at = datetime.now()
+        self._seconds = time.perf_counter() - self._started
+        if database_path and os.path.exists(database_path):
+            self.database_bytes = os.path.getsize(database_path)
+
+    def to_dict(self) -> Dict:
+        seconds = self._seconds if self._seconds is not None else time.perf_counter() - self._started
+        return {
+            "run_id": self.run_id,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "finished_at": self.finished_at.isoformat(timespec="seconds") if self.finished_at else None,
+            "success": self.success,
+            "seconds": round(seconds, 4),
+            "polars": pl.__version__,
+            "lifetime_peak_rss_bytes": lifetime_peak_rss(),
+            "database_bytes": self.database_bytes,
+            "stages": list(self.stages.values()),
+            "tables": list(self.tables),
+        }
+
+    def prometheus_text(self, prefix: str = METRIC_PREFIX) -> str:
+        """The run in the Prometheus text exposition format"""
+        report = self.to_dict()
+        lines = []
+
+        def gauge(name: str, help_text: str, samples: List):
+            samples = [(labels, value) for labels, value in samples if value is not None]
+            if not samples:
+                return
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{_label(v)}"' for k, v in labels.items())
+                lines.append(f"{prefix}_{name}{{{label_text}}} {value}" if label_text else f"{prefix}_{name} {value}")
+
+        finished = self.finished_at or datetime.now()
+        gauge("last_run_timestamp_seconds", "Unix time the last run finished", [({}, int(finished.timestamp()))])
+        gauge("last_run_success", "1 if the last run loaded every table", [({}, int(bool(self.success)))])
+        gauge("run_duration_seconds", "Wall time of the last run", [({}, report["seconds"])])
+        gauge("database_bytes", "Size of the warehouse file after the last run", [({}, report["database_bytes"])])
+        gauge("lifetime_peak_rss_bytes", "Peak RSS of the ETL process", [({}, report["lifetime_peak_rss_bytes"])])
+
+        stages = report["stages"]
+        gauge("stage_duration_seconds", "Wall time per stage",
+              [({"stage": s["stage"]}, s["seconds"]) for s in stages])
+        gauge("stage_rows", "Rows handled per stage", [({"stage": s["stage"]}, s["rows"]) for s in stages])
+        gauge("stage_rows_per_second", "Throughput per stage",
+              [({"stage": s["stage"]}, s["rows_per_sec"]) for s in stages])
+        gauge("stage_peak_rss_bytes", "Peak process RSS per stage (includes Polars buffers)",
+              [({"stage": s["stage"]}, s["peak_rss_bytes"]) for s in stages])
+        gauge("stage_duckdb_memory_after_table_max_bytes",
+              "Largest DuckDB buffer memory read after a table of the stage (not a true peak)",
+              [({"stage": s["stage"]}, s["duckdb_memory_after_table_max_bytes"]) for s in stages])
+
+        tables = report["tables"]
+        labels = [{"stage": t["stage"], "table": t["table"]} for t in tables]
+        gauge("table_duration_seconds", "Wall time per table and stage",
+              [(lab, t["seconds"]) for lab, t in zip(labels, tables)])
+        gauge("table_rows", "Rows per table and stage", [(lab, t["rows"]) for lab, t in zip(labels, tables)])
+        gauge("table_rows_per_second", "Throughput per table and stage",
+              [(lab, t["rows_per_sec"]) for lab, t in zip(labels, tables)])
+        gauge("table_input_bytes", "Source bytes read per table",
+              [(lab, t["input_bytes"]) for lab, t in zip(labels, tables)])
+        gauge("table_arrow_bytes", "Arrow/Polars buffer size per table and stage",
+              [(lab, t["arrow_bytes"]) for lab, t in zip(labels, tables)])
+        return "\n".join(lines) + "\n"
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def tracked_stage(name: str) -> Callable:
+    """Method decorator running the method inside self.metrics.stage(name)"""
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.metrics.stage(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def tracked_table(stage: str, table: str) -> Callable:
+    """
+    Method decorator recording one table per call: rows and buffer size of the
+    returned frame, plus the rows of the frames passed in.
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            started = time.perf_counter()
+            result = method(self, *args, **kwargs)
+            seconds = time.perf_counter() - started
+            input_rows = sum(len(a) for a in args if isinstance(a, pl.DataFrame))
+            self.metrics.table(stage, table, len(result) if result is not None else None, seconds,
+                               arrow_bytes=frame_bytes(result), input_rows=input_rows)
+            return result
+        return wrapper
+    return decorate
+
+
+def write_reports(metrics: RunMetrics, out_dir: Optional[str] = None) -> Dict[str, str]:
+    """
+    Write the JSON run report and the Prometheus textfile.
+
+    Args:
+        metrics: A finished run
+        out_dir: Directory (default: Config.METRICS_DIR, else ./metrics)
+    Returns:
+        {"json": report path, "prometheus": textfile path}
+    """
+    if out_dir is None:
+        from src.Config import Config
+        out_dir = getattr(Config, "METRICS_DIR", DEFAULT_METRICS_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+
+    json_path = os.path.join(out_dir, f"etl-run-{metrics.run_id}.json")
+    with open(json_path, "w") as fh:
+        json.dump(metrics.to_dict(), fh, indent=2)
+
+    # Write then rename so the textfile collector never reads a partial file
+    prom_path = os.path.join(out_dir, "etl.prom")
+    tmp = f"{prom_path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as fh:
+        fh.write(metrics.prometheus_text())
+    os.replace(tmp, prom_path)
+
+    logger.info(f"Run metrics written to {json_path} and {prom_path}")
+    return {"json": json_path, "prometheus": prom_path}
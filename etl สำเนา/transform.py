@@ -6,8 +6,9 @@ Data transformation module for creating dimensional model
 import polars as pl
 from typing import Dict, List, Optional
 import logging
-from datetime import datetime
+from datetime import date, datetime
 from src.Config import Config
+from src.metrics import RunMetrics, tracked_stage, tracked_table
 
 
 
@@ -20,8 +21,9 @@ logger = logging.getLogger(__name__)
 
 
 class DataTransformer:
-    def __init__(self):
+    def __init__(self, metrics: Optional[RunMetrics] = None):
         self.config = Config()
+        self.metrics = metrics or RunMetrics()
 
 
     def standardize_column_names(self, df: pl.DataFrame) -> pl.DataFrame:
@@ -36,6 +38,7 @@ class DataTransformer:
         new_columns = [col.lower().replace(' ', '_').replace('-', '_') for col in df.columns]
         return df.rename(dict(zip(df.columns, new_columns)))
    
+    @tracked_table("transform", "dim_brands")
     def transform_brands(self, df: pl.DataFrame) -> pl.DataFrame:
         """Transform brands data into dimension table"""
         logger.info("=== Transforming brands dimension ===")
@@ -49,6 +52,7 @@ class DataTransformer:
         return dim_brands
 
 
+    @tracked_table("transform", "dim_categories")
     def transform_categories(self, df: pl.DataFrame) -> pl.DataFrame:
         """Transform categories data into dimension table"""
         logger.info("=== Transforming categories dimension ===")
@@ -62,6 +66,7 @@ class DataTransformer:
         return dim_categories
 
 
+    @tracked_table("transform", "dim_stores")
     def transform_stores(self, df: pl.DataFrame) -> pl.DataFrame:
         """Transform stores data into dimension table"""
         logger.info("=== Transforming stores dimension ===")
@@ -81,6 +86,7 @@ class DataTransformer:
         return dim_stores
 
 
+    @tracked_table("transform", "dim_staffs")
     def transform_staffs(self, df: pl.DataFrame) -> pl.DataFrame:
         """Transform staffs data into dimension table"""
         logger.info("=== Transforming staffs dimension ===")
@@ -105,6 +111,7 @@ class DataTransformer:
         return dim_staffs
 
 
+    @tracked_table("transform", "dim_customers")
     def transform_customers(self,df: pl.DataFrame) -> pl.DataFrame:
         """Transform customers data into dimension table"""
         logger.info("=== Transforming customers dimension ===")
@@ -130,6 +137,7 @@ class DataTransformer:
         return dim_customers
 
 
+    @tracked_table("transform", "dim_products")
     def transform_products(self, df: pl.DataFrame) -> pl.DataFrame:
         """Transform products data into dimension table"""
         logger.info("Transforming products dimension")
@@ -157,6 +165,7 @@ class DataTransformer:
         ) + 1
 
 
+    @tracked_table("transform", "dim_date")
     def create_date_dimension(self) -> pl.DataFrame:
         """
         Create a date dimension table
@@ -190,6 +199,7 @@ class DataTransformer:
         return dim_date
 
 
+    @tracked_table("transform", "fact_sales")
     def transform_sales_fact(self, orders_df: pl.DataFrame, order_items_df: pl.DataFrame) -> pl.DataFrame:
         """Transform orders and order items into sales fact table"""
         logger.info("===Transforming sales fact table===")
@@ -228,6 +238,100 @@ class DataTransformer:
        
         return sales_fact
    
+    @tracked_table("transform", "fact_orders")
+    def transform_orders_fact(self, sales_fact: pl.DataFrame, orders_df: pl.DataFrame) -> pl.DataFrame:
+        """
+        Roll the sales fact up to one row per order.
+
+        Order-level metrics (orders, AOV, orders per store/staff) become plain
+        counts and sums over this table instead of distinct counts over lines.
+
+        Args:
+            sales_fact: Output of transform_sales_fact
+            orders_df: orders source (order_status and required_date are taken from it when present)
+        Returns:
+            DataFrame (order_id, customer_id, store_id, staff_id, order_status, order_date,
+            required_date, shipped_date, line_count, units, gross_amount, discount_amount,
+            net_amount, order_to_ship_days, shipped_late, created_at)
+        """
+        logger.info("=== Transforming orders fact table ===")
+        df_orders = self.standardize_column_names(orders_df)
+        header = ["order_id"] + [c for c in ("order_status", "required_date") if c in df_orders.columns]
+
+        orders_fact = (
+            sales_fact
+            .group_by("order_id")
+            .agg(
+                pl.col("customer_id").first(),
+                pl.col("store_id").first(),
+                pl.col("staff_id").first(),
+                pl.col("order_date").first(),
+                pl.col("shipped_date").first(),
+                pl.len().cast(pl.Int32).alias("line_count"),
+                pl.col("quantity").sum().alias("units"),
+                pl.col("gross_amount").sum(),
+                pl.col("net_amount").sum(),
+            )
+            .join(df_orders.select(header), on="order_id", how="left")
+        )
+        for column, dtype in (("order_status", pl.Int64), ("required_date", pl.Date)):
+            if column not in orders_fact.columns:
+                orders_fact = orders_fact.with_columns(pl.lit(None, dtype=dtype).alias(column))
+
+        return orders_fact.select([
+            pl.col("order_id"),
+            pl.col("customer_id"),
+            pl.col("store_id"),
+            pl.col("staff_id"),
+            pl.col("order_status"),
+            pl.col("order_date"),
+            pl.col("required_date"),
+            pl.col("shipped_date"),
+            pl.col("line_count"),
+            pl.col("units"),
+            pl.col("gross_amount"),
+            (pl.col("gross_amount") - pl.col("net_amount")).alias("discount_amount"),
+            pl.col("net_amount"),
+            # ยังไม่จัดส่ง = null
+            (pl.col("shipped_date") - pl.col("order_date")).dt.total_days().cast(pl.Int32).alias("order_to_ship_days"),
+            (pl.col("shipped_date") > pl.col("required_date")).alias("shipped_late"),
+            pl.lit(datetime.now()).alias("created_at"),
+        ]).sort("order_id")
+
+    @tracked_table("transform", "fact_inventory")
+    def transform_inventory_snapshot(self, df: pl.DataFrame, snapshot_date: Optional[date] = None) -> pl.DataFrame:
+        """
+        Transform current stock levels into one inventory snapshot.
+
+        The loader merges each snapshot into fact_inventory as validity ranges
+        (see DataLoader.load_inventory_snapshot), so this only produces the
+        stock levels as of snapshot_date.
+
+        Args:
+            df: stocks source (store_id, product_id, quantity)
+            snapshot_date: Date the stock levels were taken (default: Config.SNAPSHOT_DATE, else today)
+        Returns:
+            DataFrame (snapshot_date, store_id, product_id, quantity_on_hand), one row per store-product
+        """
+        logger.info("=== Transforming inventory snapshot ===")
+        snapshot_date = snapshot_date or getattr(self.config, "SNAPSHOT_DATE", None) or date.today()
+        df_clean = self.standardize_column_names(df)
+        inventory = (
+            df_clean
+            .filter(pl.col("store_id").is_not_null() & pl.col("product_id").is_not_null())
+            .group_by(["store_id", "product_id"])
+            .agg(pl.col("quantity").fill_null(0).sum().cast(pl.Int32).alias("quantity_on_hand"))
+            .select(
+                pl.lit(snapshot_date).cast(pl.Date).alias("snapshot_date"),
+                pl.col("store_id").cast(pl.Int32),
+                pl.col("product_id").cast(pl.Int32),
+                pl.col("quantity_on_hand"),
+            )
+            .sort(["store_id", "product_id"])
+        )
+        return inventory
+
+    @tracked_stage("transform")
     def transform_all_data(self, raw_data: Dict[str, pl.DataFrame]) -> Dict[str, pl.DataFrame]:
         """
         Transform all raw data into dimensional model
@@ -266,6 +370,10 @@ class DataTransformer:
                 raw_data["orders"],
                 raw_data["order_items"]
             )
+            transformed["fact_orders"] = self.transform_orders_fact(transformed["fact_sales"], raw_data["orders"])
+
+        if "stocks" in raw_data:
+            transformed["fact_inventory"] = self.transform_inventory_snapshot(raw_data["stocks"])
 
 
         logger.info(f"Transformation complete. Created {len(transformed)} tables")
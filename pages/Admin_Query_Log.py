@@ -0,0 +1,86 @@
+import json
+import os
+import pandas as pd
+import streamlit as st
+from analytics import profiling
+from analytics.dashboard import DB_PATH, cached_figure, dev_panel, get_executor, plotly_chart
+# -----------------------------
+# ✅ Page Config
+# -----------------------------
+st.set_page_config(
+    page_title="Query Profiler",
+    layout="wide",
+    page_icon="🩺"
+)
+
+st.title("Bikestore Business Dashboard")
+st.header("🩺 Query Profiler (admin)")
+
+# -----------------------------
+# 🎛️ Sidebar – สถานะการเก็บโปรไฟล์
+# -----------------------------
+st.sidebar.title("⚙️ การตั้งค่า")
+log_path = os.environ.get(profiling.LOG_PATH_ENV_VAR, profiling.DEFAULT_LOG_PATH)
+threshold = float(os.environ.get(profiling.SLOW_QUERY_MS_ENV_VAR, profiling.DEFAULT_SLOW_QUERY_MS))
+st.sidebar.markdown(
+    f"- Profiling: **{'เปิด' if profiling.profiling_enabled() else 'ปิด'}** (`{profiling.ENV_VAR}=1`)\n"
+    f"- Slow query ≥ **{threshold:.0f} ms** (`{profiling.SLOW_QUERY_MS_ENV_VAR}`)\n"
+    f"- Log: `{log_path}`"
+)
+top_slow = st.sidebar.slider("จำนวน slow query ที่แสดง", 5, 200, 50, step=5)
+
+# เขียน record ที่ค้างอยู่ในหน่วยความจำลง log ก่อนอ่าน
+executor = get_executor(DB_PATH)
+if executor.profiler is not None:
+    executor.profiler.flush()
+
+if st.sidebar.button("🗑️ ล้าง query log"):
+    profiling.clear_log(log_path)
+
+if not profiling.profiling_enabled():
+    st.info(f"ยังไม่ได้เปิด profiling — ตั้งค่า `{profiling.ENV_VAR}=1` แล้วรีสตาร์ต Streamlit "
+            "เพื่อเก็บโปรไฟล์ของทุก query บน dashboard")
+
+# -----------------------------
+# 📊 สถิติราย query
+# -----------------------------
+stats = profiling.query_stats(log_path)
+st.subheader("📊 สถิติราย query (p50 / p95 / rows scanned)")
+if stats.empty:
+    st.warning("ยังไม่มีข้อมูลใน query log")
+else:
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Queries ที่บันทึก", f"{int(stats['runs'].sum()):,}")
+    c2.metric("Slow queries", f"{int(stats['slow_runs'].sum()):,}")
+    c3.metric("p95 สูงสุด", f"{stats['p95_ms'].max():,.0f} ms")
+
+    st.dataframe(stats.round(1), use_container_width=True, hide_index=True)
+
+    p95 = stats.groupby('name', as_index=False)['p95_ms'].max().sort_values('p95_ms')
+    fig_p95 = cached_figure(
+        'bar', p95, x='p95_ms', y='name', orientation='h',
+        labels={'p95_ms': 'p95 (ms)', 'name': 'Query'},
+        layout={'height': max(260, 28 * len(p95)), 'margin': {'l': 10, 'r': 10, 't': 30, 'b': 10}},
+    )
+    plotly_chart(fig_p95, use_container_width=True, key="query_p95")
+
+# -----------------------------
+# 🐢 Slow queries พร้อม plan
+# -----------------------------
+st.subheader(f"🐢 Slow queries ล่าสุด (≥ {threshold:.0f} ms)")
+slow = profiling.slow_queries(log_path, limit=top_slow)
+if slow.empty:
+    st.caption("ไม่มี slow query")
+for row in slow.itertuples(index=False):
+    with st.expander(f"{row.logged_at:%Y-%m-%d %H:%M:%S} · {row.name} · {row.wall_ms:,.0f} ms · "
+                     f"{0 if pd.isna(row.rows_scanned) else int(row.rows_scanned):,} rows scanned"):
+        st.markdown("**Parameters**")
+        st.code(row.params, language="json")
+        st.markdown("**SQL**")
+        st.code(row.sql or "", language="sql")
+        if row.plan:
+            st.markdown("**Plan (EXPLAIN ANALYZE)**")
+            st.code(profiling.plan_text(json.loads(row.plan)), language="text")
+
+# เครื่องมือนักพัฒนา: เวลาแต่ละส่วน/อัตรา cache hit (เปิดด้วย BIKESTORE_INSTRUMENT=1)
+dev_panel()
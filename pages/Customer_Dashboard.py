@@ -1,11 +1,13 @@
 import streamlit as st
-import duckdb as dd
 import pandas as pd
 import numpy as np
 import plotly.express as px
 from datetime import datetime
+from analytics.dashboard import DB_PATH, customer_segments, dev_panel, distinct_sketches, get_warehouse, plotly_chart
+from analytics.sales import freeze_filters
+from analytics.segments import segment_profiles
+from analytics.charts import MAX_TREEMAP_LEAVES, top_n_other
 import plotly.graph_objects as go
-import duckdb as dd
 # -----------------------------
 # ✅ Page Config & Theming
 # -----------------------------
@@ -31,67 +33,6 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
-# -----------------------------
-# 🔧 Utils
-# -----------------------------
-@st.cache_data(show_spinner=False)
-def load_tables(db_path: str):
-    conn = dd.connect(db_path)
-    try:
-        dim_customers = conn.execute("SELECT * FROM dim_customers").fetchdf()
-        dim_date      = conn.execute("SELECT * FROM dim_date").fetchdf()
-        dim_staffs    = conn.execute("SELECT * FROM dim_staffs").fetchdf()
-        dim_products  = conn.execute("SELECT * FROM dim_products").fetchdf()
-        dim_brands    = conn.execute("SELECT * FROM dim_brands").fetchdf()
-        dim_categories= conn.execute("SELECT * FROM dim_categories").fetchdf()
-        dim_stores    = conn.execute("SELECT * FROM dim_stores").fetchdf()
-        fact_sales    = conn.execute("SELECT * FROM fact_sales").fetchdf()
-    finally:
-        conn.close()
-    return (
-        dim_customers, dim_date, dim_staffs, dim_products,
-        dim_brands, dim_categories, dim_stores, fact_sales
-    )
-
-
-def baht(x):
-    try:
-        return f"฿{x:,.0f}"
-    except Exception:
-        return "-"
-
-def pct(x):
-    try:
-        return f"{x*100:.1f}%"
-    except Exception:
-        return "-"
-
-
-def add_period_cols(df):
-    df = df.copy()
-    df['order_date'] = pd.to_datetime(df['order_date'])
-    df['year']   = df['order_date'].dt.year
-    df['quarter']= df['order_date'].dt.to_period('Q').astype(str)
-    df['month']  = df['order_date'].dt.to_period('M').astype(str)
-    df['date']   = df['order_date'].dt.date
-    return df
-
-
-def compute_net_sales(df):
-    df = df.copy()
-    # net_sales = quantity * list_price * (1 - discount)
-    df['net_sales'] = df['quantity'] * df['list_price'] * (1 - df['discount'])
-    return df
-
-
-def growth_rate(series: pd.Series):
-    if len(series) < 2:
-        return 0.0
-    prev, curr = series.iloc[-2], series.iloc[-1]
-    if prev == 0:
-        return np.nan
-    return (curr - prev) / prev
-
 # ...existing code...
 
 # -----------------------------
@@ -99,34 +40,20 @@ def growth_rate(series: pd.Series):
 # -----------------------------
 st.sidebar.title("⚙️ ตัวกรองข้อมูล")
 
-DB_PATH = "data_cube/bikestore.duckdb"
-
-(
-    dim_customers, dim_date, dim_staffs, dim_products,
-    dim_brands, dim_categories, dim_stores, fact_sales
-) = load_tables(DB_PATH)
-
-# เตรียมข้อมูลหลัก
-customers = dim_customers.copy()
-products  = dim_products.copy()
-brands    = dim_brands.copy()
-categories= dim_categories.copy()
-stores    = dim_stores.copy()
-staffs    = dim_staffs.copy()
-sales     = fact_sales.copy()
+# โหลดครั้งเดียวต่อเวอร์ชันของ warehouse และแชร์ทุกหน้า/ทุก session (อ่านอย่างเดียว)
+wh = get_warehouse(DB_PATH)
 
-sales = compute_net_sales(sales)
-sales = add_period_cols(sales)
+customers = wh.customers
+products  = wh.products
+brands    = wh.brands
+categories= wh.categories
+stores    = wh.stores
+staffs    = wh.staffs
+sales     = wh.sales
 
-products_lite = products[['product_id','product_name','category_id','brand_id']]
-sales = sales.merge(products_lite, on='product_id', how='left')
-sales = sales.merge(categories[['category_id','category_name']], on='category_id', how='left')
-sales = sales.merge(brands[['brand_id','brand_name']], on='brand_id', how='left')
-sales = sales.merge(stores[['store_id','store_name']], on='store_id', how='left')
-sales = sales.merge(customers[['customer_id','customer_city','customer_state']], on='customer_id', how='left')
-
-min_date = pd.to_datetime(sales['order_date']).min()
-max_date = pd.to_datetime(sales['order_date']).max()
+# วันที่ min-max สำหรับฟิลเตอร์
+min_date = wh.min_date
+max_date = wh.max_date
 
 # ---- Controls ----
 # ...existing code...
@@ -167,24 +94,33 @@ f_date = st.sidebar.date_input(
     key="date_filter"
 )
 
+# กลุ่มลูกค้าตามพฤติกรรม (python -m analytics.segments) ใช้เป็นตัวกรองได้เหมือนมิติอื่น
+segments = customer_segments(DB_PATH)
+f_segment = []
+if not segments.empty:
+    f_segment = st.sidebar.multiselect(
+        "กลุ่มลูกค้า",
+        options=segments.sort_values('segment')['segment_name'].unique().tolist(),
+        key="segment_filter"
+    )
+
+exact_counts = st.sidebar.toggle(
+    "นับลูกค้าแบบแม่นยำ",
+    value=True,
+    key="exact_counts",
+    help="หน้านี้มีแถวที่กรองแล้วอยู่ในหน่วยความจำ นับตรง ๆ เร็วกว่า; ปิด = ประมาณจาก HyperLogLog sketch "
+         "(คลาดเคลื่อน ~2%) เมื่อช่วงวันที่ครอบคลุมทั้งเดือนและไม่ได้กรองกลุ่มลูกค้า"
+)
+
 # if st.sidebar.button("รีเซ็ตตัวกรอง"):
 #     st.rerun()
 
 # ...existing code...
 
 # Apply Filters
-mask = (
-    (sales['order_date'].dt.date >= f_date[0]) &
-    (sales['order_date'].dt.date <= f_date[1])
-)
-if f_store:
-    mask &= sales['store_name'].isin(f_store)
-if f_brand:
-    mask &= sales['brand_name'].isin(f_brand)
-if f_category:
-    mask &= sales['category_name'].isin(f_category)
-
-f = sales.loc[mask].copy()
+f = wh.filter(f_date, f_store, f_brand, f_category)
+if f_segment:
+    f = f[f['customer_id'].isin(segments.loc[segments['segment_name'].isin(f_segment), 'customer_id'])]
 
 # ...existing code...
 # ...existing code...
@@ -194,9 +130,15 @@ f = sales.loc[mask].copy()
 # 🧭 Header & KPI
 # -----------------------------
 # Calculate KPI values
-total_customers = f['customer_id'].nunique()
+# ค่าเริ่มต้นนับจาก f ที่กรองไว้แล้ว; sketch ใช้เมื่อผู้ใช้ปิดโหมดแม่นยำ (กลุ่มลูกค้าไม่ใช่มิติของ rollup)
+filters = freeze_filters(f_date, f_store, f_brand, f_category)
+use_sketches = not exact_counts and not f_segment
+sketch = distinct_sketches(DB_PATH) if use_sketches else None
+approx_counts = sketch is not None and sketch.answers(filters)
+buyers = f['customer_id'].nunique()
+total_customers = sketch.distinct('customers', filters) if approx_counts else buyers
 repeat_customers = f.groupby('customer_id').filter(lambda x: len(x) > 1)['customer_id'].nunique()
-repeat_rate = repeat_customers / total_customers if total_customers > 0 else 0
+repeat_rate = repeat_customers / buyers if buyers > 0 else 0
 
 st.title("Bikestore Business Dashboard")
 st.header("🚴🏻 Customer Dashboard")
@@ -257,7 +199,7 @@ st.markdown(
     <div class="kpi-row">
         <div class="metric-card">
             <div class="metric-title">จำนวนลูกค้าทั้งหมด</div>
-            <div class="metric-value">{total_customers:,}</div>
+            <div class="metric-value">{'≈' if approx_counts else ''}{total_customers:,}</div>
         </div>
         <div class="metric-card">
             <div class="metric-title">ลูกค้าซื้อซ้ำ</div>
@@ -278,7 +220,12 @@ st.markdown(
 # กราฟ 3 อันใน 1 แถว (กระจายเต็มหน้าจอ)
 # -----------------------------
 # เตรียมข้อมูล ts สำหรับ Treemap
-ts = f.groupby('customer_state').agg(count=('customer_id', 'nunique')).reset_index()
+state_sketch = distinct_sketches(DB_PATH, 'state') if use_sketches else None
+if state_sketch is not None and state_sketch.answers(filters):
+    ts = state_sketch.distinct('customers', filters, by='customer_state').rename(columns={'customers': 'count'})
+else:
+    ts = f.groupby('customer_state').agg(count=('customer_id', 'nunique')).reset_index()
+ts = top_n_other(ts, 'customer_state', 'count', n=MAX_TREEMAP_LEAVES)
 
 # กราฟหลัก (Treemap + Repeat Rate + เมือง)
 # เตรียมข้อมูล
@@ -330,7 +277,7 @@ with left_col:
         title=''
     )
     fig_treemap.update_layout(margin=dict(t=30, l=0, r=0, b=0), height=700)
-    st.plotly_chart(fig_treemap, use_container_width=True, key="treemap_state")
+    plotly_chart(fig_treemap, use_container_width=True, key="treemap_state")
 
 # ---------- ฝั่งขว ----------
 with right_col:
@@ -362,7 +309,7 @@ with right_col:
             height=340,  # ครึ่งบนของคอลัมน์ขวา
             legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
         )
-        st.plotly_chart(fig_stacked, use_container_width=True, key="stacked_repeat_state")
+        plotly_chart(fig_stacked, use_container_width=True, key="stacked_repeat_state")
 
     with st.container():
         st.markdown("#### อัตราลูกค้าซื้อซ้ำตามรัฐ")
@@ -382,4 +329,45 @@ with right_col:
             height=340  # ครึ่งล่างของคอลัมน์ขวา
         )
         fig_repeat_state.update_traces(textposition="outside", cliponaxis=False)
-        st.plotly_chart(fig_repeat_state, use_container_width=True, key="repeat_rate_state")
+        plotly_chart(fig_repeat_state, use_container_width=True, key="repeat_rate_state")
+
+# -----------------------------
+# 🧬 กลุ่มลูกค้าตามพฤติกรรม (k-means บน RFM, สัดส่วนหมวดหมู่ และความไวต่อส่วนลด)
+# -----------------------------
+st.markdown("---")
+st.markdown("#### กลุ่มลูกค้าตามพฤติกรรม")
+if segments.empty:
+    st.info("ยังไม่มีการแบ่งกลุ่มลูกค้า — รัน `python -m analytics.segments` (เพิ่ม `--refit` เพื่อคำนวณกลุ่มใหม่ทั้งหมด)")
+else:
+    seg_left, seg_right = st.columns([1, 2])
+    in_view = segments[segments['customer_id'].isin(f['customer_id'])]
+    with seg_left:
+        seg_counts = in_view.groupby(['segment', 'segment_name']).size().reset_index(name='customers')
+        fig_segments = px.bar(
+            seg_counts,
+            x='customers',
+            y='segment_name',
+            orientation='h',
+            color='segment_name',
+            labels={'customers': 'จำนวนลูกค้า', 'segment_name': 'กลุ่ม'},
+            text='customers'
+        )
+        fig_segments.update_layout(margin=dict(l=0, r=0, t=30, b=0), height=320, showlegend=False,
+                                   yaxis=dict(categoryorder='array', categoryarray=seg_counts['segment_name'][::-1]))
+        fig_segments.update_traces(textposition="outside", cliponaxis=False)
+        plotly_chart(fig_segments, use_container_width=True, key="segment_sizes")
+    with seg_right:
+        profiles = segment_profiles(segments, categories).rename(columns={
+            'segment_name': 'กลุ่ม', 'customers': 'ลูกค้า', 'recency_days': 'ซื้อล่าสุด (วันก่อน)',
+            'frequency': 'ออเดอร์/คน', 'monetary': 'ยอดซื้อ/คน', 'avg_order_value': 'ยอดต่อออเดอร์',
+            'discount_rate': 'ส่วนลดเฉลี่ย', 'top_category': 'หมวดหมู่หลัก',
+        }).drop(columns='segment')
+        st.dataframe(
+            profiles.style.format({'ซื้อล่าสุด (วันก่อน)': '{:,.0f}', 'ออเดอร์/คน': '{:.2f}', 'ยอดซื้อ/คน': '{:,.0f}',
+                                   'ยอดต่อออเดอร์': '{:,.0f}', 'ส่วนลดเฉลี่ย': '{:.1%}'}, na_rep='-'),
+            hide_index=True, use_container_width=True
+        )
+        st.caption("ค่าเฉลี่ยของลูกค้าทั้งหมดในแต่ละกลุ่ม (ไม่ขึ้นกับตัวกรอง); กลุ่ม 1 = ยอดซื้อเฉลี่ยสูงสุด")
+
+# เครื่องมือนักพัฒนา: เวลาแต่ละส่วน/อัตรา cache hit (เปิดด้วย BIKESTORE_INSTRUMENT=1)
+dev_panel()
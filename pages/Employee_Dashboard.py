@@ -1,9 +1,8 @@
 import streamlit as st
-import duckdb as dd
 import pandas as pd
 import numpy as np
-import plotly.express as px
 from datetime import datetime
+from analytics.dashboard import DB_PATH, cached_figure, dev_panel, get_warehouse, plotly_chart
 import statsmodels.api as sm
 
 # -----------------------------
@@ -31,103 +30,26 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
-# -----------------------------
-# 🔧 Utils
-# -----------------------------
-@st.cache_data(show_spinner=False)
-def load_tables(db_path: str):
-    conn = dd.connect(db_path)
-    try:
-        dim_customers = conn.execute("SELECT * FROM dim_customers").fetchdf()
-        dim_date      = conn.execute("SELECT * FROM dim_date").fetchdf()
-        dim_staffs    = conn.execute("SELECT * FROM dim_staffs").fetchdf()
-        dim_products  = conn.execute("SELECT * FROM dim_products").fetchdf()
-        dim_brands    = conn.execute("SELECT * FROM dim_brands").fetchdf()
-        dim_categories= conn.execute("SELECT * FROM dim_categories").fetchdf()
-        dim_stores    = conn.execute("SELECT * FROM dim_stores").fetchdf()
-        fact_sales    = conn.execute("SELECT * FROM fact_sales").fetchdf()
-    finally:
-        conn.close()
-    return (
-        dim_customers, dim_date, dim_staffs, dim_products,
-        dim_brands, dim_categories, dim_stores, fact_sales
-    )
-
-
-def baht(x):
-    try:
-        return f"฿{x:,.0f}"
-    except Exception:
-        return "-"
-
-def pct(x):
-    try:
-        return f"{x*100:.1f}%"
-    except Exception:
-        return "-"
-
-
-def add_period_cols(df):
-    df = df.copy()
-    df['order_date'] = pd.to_datetime(df['order_date'])
-    df['year']   = df['order_date'].dt.year
-    df['quarter']= df['order_date'].dt.to_period('Q').astype(str)
-    df['month']  = df['order_date'].dt.to_period('M').astype(str)
-    df['date']   = df['order_date'].dt.date
-    return df
-
-def compute_net_sales(df):
-    df = df.copy()
-    # net_sales = quantity * list_price * (1 - discount)
-    df['net_sales'] = df['quantity'] * df['list_price'] * (1 - df['discount'])
-    return df
-
-
-def growth_rate(series: pd.Series):
-    if len(series) < 2:
-        return 0.0
-    prev, curr = series.iloc[-2], series.iloc[-1]
-    if prev == 0:
-        return np.nan
-    return (curr - prev) / prev
-
 # -----------------------------
 # 🎛️ Sidebar – ฟิลเตอร์
 # -----------------------------
 st.sidebar.title("⚙️ ตัวกรองข้อมูล")
 
 
-DB_PATH = "data_cube/bikestore.duckdb"
-
-(
-    dim_customers, dim_date, dim_staffs, dim_products,
-    dim_brands, dim_categories, dim_stores, fact_sales
-) = load_tables(DB_PATH)
+# โหลดครั้งเดียวต่อเวอร์ชันของ warehouse และแชร์ทุกหน้า/ทุก session (อ่านอย่างเดียว)
+wh = get_warehouse(DB_PATH)
 
-# ทำงานด้วย pandas ทั้งหมดเพื่อความสม่ำเสมอ
-customers = dim_customers.copy()
-products  = dim_products.copy()
-brands    = dim_brands.copy()
-categories= dim_categories.copy()
-stores    = dim_stores.copy()
-staffs    = dim_staffs.copy()
-sales     = fact_sales.copy()
-
-# เตรียมข้อมูลหลัก
-sales = compute_net_sales(sales)
-sales = add_period_cols(sales)
-
-# Join dims ที่จำเป็น
-products_lite = products[['product_id','product_name','category_id','brand_id']]
-sales = sales.merge(products_lite, on='product_id', how='left')
-sales = sales.merge(categories[['category_id','category_name']], on='category_id', how='left')
-sales = sales.merge(brands[['brand_id','brand_name']], on='brand_id', how='left')
-sales = sales.merge(stores[['store_id','store_name']], on='store_id', how='left')
-sales = sales.merge(customers[['customer_id','customer_city','customer_state']], on='customer_id', how='left')
+customers = wh.customers
+products  = wh.products
+brands    = wh.brands
+categories= wh.categories
+stores    = wh.stores
+staffs    = wh.staffs
+sales     = wh.sales
 
 # วันที่ min-max สำหรับฟิลเตอร์
-min_date = pd.to_datetime(sales['order_date']).min()
-max_date = pd.to_datetime(sales['order_date']).max()
+min_date = wh.min_date
+max_date = wh.max_date
 
 # ---- Controls ----
 period = st.sidebar.selectbox("หน่วยเวลา (สำหรับกราฟแนวโน้ม)", ["month","quarter","year"], index=0)
@@ -151,18 +73,9 @@ f_date = st.sidebar.date_input(
 #     st.experimental_rerun()
 
 # Apply Filters
-mask = (
-    (sales['order_date'].dt.date >= f_date[0]) &
-    (sales['order_date'].dt.date <= f_date[1])
-)
-if f_store:
-    mask &= sales['store_name'].isin(f_store)
-if f_brand:
-    mask &= sales['brand_name'].isin(f_brand)
-if f_category:
-    mask &= sales['category_name'].isin(f_category)
-
-f = sales.loc[mask].copy()
+f = wh.filter(f_date, f_store, f_brand, f_category)
+# ระดับออเดอร์ (fact_orders): None ถ้าไม่มีตารางหรือกรองแบรนด์/หมวดหมู่อยู่
+orders_f = wh.filter_orders(f_date, f_store, f_brand, f_category)
 # ...existing code...
 
 # -----------------------------
@@ -269,34 +182,44 @@ st.markdown(
 # 🏬 ยอดขายและจำนวนออเดอร์ของแต่ละสาขา (2 กราฟใน 1 แถว)
 # -----------------------------
 st.markdown("### 🏬 ยอดขายและจำนวนออเดอร์ของแต่ละสาขา")
-store_perf = (
-    f.groupby('store_name', as_index=False)
-     .agg(net_sales=('net_sales','sum'), orders=('order_id','nunique'))
-     .sort_values('net_sales', ascending=False)
-)
+if orders_f is not None:
+    # หนึ่งแถวต่อออเดอร์: นับด้วย size แทน nunique บนบรรทัดสินค้า
+    store_perf = (
+        orders_f.groupby('store_name', as_index=False)
+                .agg(net_sales=('net_sales','sum'), orders=('order_id','size'))
+                .sort_values('net_sales', ascending=False)
+    )
+else:
+    store_perf = (
+        f.groupby('store_name', as_index=False)
+         .agg(net_sales=('net_sales','sum'), orders=('order_id','nunique'))
+         .sort_values('net_sales', ascending=False)
+    )
 
 colS1, colS2 = st.columns([1, 1])
 with colS1:
     # ใช้โทนสีฟ้าทั้งหมดสำหรับ Pie Chart สาขา
     blue_palette = ["#174a7c", "#4f8bc9", "#90caf9", "#b3d8fd", "#e3f2fd", "#e0f7fa", "#b2ebf2", "#81d4fa", "#0288d1", "#01579b"]
-    fig_store_pie = px.pie(
+    fig_store_pie = cached_figure(
+        'pie',
         store_perf,
         names='store_name',
         values='net_sales',
         title='สัดส่วนยอดขายสุทธิแต่ละสาขา',
         color='store_name',
-        color_discrete_sequence=blue_palette[:len(store_perf)]  # ใช้แต่สีฟ้า
-    )
-    fig_store_pie.update_traces(textinfo='percent+label', pull=[0.05]*len(store_perf), textfont_size=13)
-    fig_store_pie.update_layout(
-        template="plotly_white",
-        height=365,
-        margin=dict(t=50, b=20, l=20, r=20)
+        color_discrete_sequence=blue_palette[:len(store_perf)],  # ใช้แต่สีฟ้า
+        traces=dict(textinfo='percent+label', pull=[0.05]*len(store_perf), textfont_size=13),
+        layout=dict(
+            template="plotly_white",
+            height=365,
+            margin=dict(t=50, b=20, l=20, r=20)
+        )
     )
-    st.plotly_chart(fig_store_pie, use_container_width=True, key="store_sales_pie")
+    plotly_chart(fig_store_pie, use_container_width=True, key="store_sales_pie")
 
 with colS2:
-    fig_store_bar_orders = px.bar(
+    fig_store_bar_orders = cached_figure(
+        'bar',
         store_perf,
         x='store_name',
         y='orders',
@@ -304,27 +227,28 @@ with colS2:
         title="จำนวนออเดอร์ต่อสาขา",
         color='orders',
         color_continuous_scale='Blues',  # สีฟ้า
-        labels={'store_name': 'สาขา', 'orders': 'จำนวนออเดอร์'}
-    )
-    fig_store_bar_orders.update_traces(texttemplate='%{text:,}', textposition='outside', cliponaxis=False)
-    fig_store_bar_orders.update_layout(
-        template="plotly_white",
-        xaxis_title="สาขา",
-        yaxis_title="จำนวนออเดอร์",
-        height=380,
-        margin=dict(t=50, b=40, l=20, r=20),
-        showlegend=False
+        labels={'store_name': 'สาขา', 'orders': 'จำนวนออเดอร์'},
+        traces=dict(texttemplate='%{text:,}', textposition='outside', cliponaxis=False),
+        layout=dict(
+            template="plotly_white",
+            xaxis_title="สาขา",
+            yaxis_title="จำนวนออเดอร์",
+            height=380,
+            margin=dict(t=50, b=40, l=20, r=20),
+            showlegend=False
+        )
     )
-    st.plotly_chart(fig_store_bar_orders, use_container_width=True, key="store_orders_bar")
+    plotly_chart(fig_store_bar_orders, use_container_width=True, key="store_orders_bar")
 
 # -----------------------------
 # 👤 ประสิทธิภาพพนักงานขาย (2 กราฟใน 1 แถว)
 # -----------------------------
 st.markdown("### 👤 ยอดขายและจำนวนออเดอร์ของพนักงาน ")
 staff_perf = (
-    f.merge(staffs[['staff_id','staff_fullname']], on='staff_id', how='left')
+    (orders_f if orders_f is not None else f)
+     .merge(staffs[['staff_id','staff_fullname']], on='staff_id', how='left')
      .groupby('staff_fullname', as_index=False)
-     .agg(net_sales=('net_sales','sum'), orders=('order_id','nunique'))
+     .agg(net_sales=('net_sales','sum'), orders=('order_id','size' if orders_f is not None else 'nunique'))
      .sort_values('net_sales', ascending=False)
      .head(10)
 )
@@ -337,24 +261,26 @@ margin_settings = dict(t=50, b=50, l=20, r=20)
 with col3:
     # ใช้โทนสีฟ้าทั้งหมดสำหรับ Pie Chart พนักงาน
     blue_palette_staff = ["#174a7c", "#4f8bc9", "#90caf9", "#b3d8fd", "#e3f2fd", "#e0f7fa", "#b2ebf2", "#81d4fa", "#0288d1", "#01579b"]
-    fig_staff_pie = px.pie(
+    fig_staff_pie = cached_figure(
+        'pie',
         staff_perf,
         names='staff_fullname',
         values='net_sales',
         title='สัดส่วนยอดขายสุทธิของพนักงาน',
         color='staff_fullname',
-        color_discrete_sequence=blue_palette_staff[:len(staff_perf)]  # ใช้แต่สีฟ้า
+        color_discrete_sequence=blue_palette_staff[:len(staff_perf)],  # ใช้แต่สีฟ้า
+        traces=dict(textinfo='percent+label', pull=[0.05]*len(staff_perf), textfont_size=13),
+        layout=dict(
+            template="plotly_white",
+            height=380,
+            margin=dict(t=50, b=20, l=20, r=20)
+        )
     )
-    fig_staff_pie.update_traces(textinfo='percent+label', pull=[0.05]*len(staff_perf), textfont_size=13)
-    fig_staff_pie.update_layout(
-        template="plotly_white",
-        height=380,
-        margin=dict(t=50, b=20, l=20, r=20)
-    )
-    st.plotly_chart(fig_staff_pie, use_container_width=True, key="staff_sales_pie")
+    plotly_chart(fig_staff_pie, use_container_width=True, key="staff_sales_pie")
 
 with col4:
-    fig_staff_orders = px.bar(
+    fig_staff_orders = cached_figure(
+        'bar',
         staff_perf,
         x='staff_fullname',
         y='orders',
@@ -362,16 +288,19 @@ with col4:
         title="จำนวนออเดอร์ของพนักงาน",
         color='orders',
         color_continuous_scale='Blues',  # สีฟ้า
-        labels={'staff_fullname': 'ชื่อพนักงาน', 'orders': 'จำนวนออเดอร์'}
-    )
-    fig_staff_orders.update_traces(texttemplate='%{text:,}', textposition='outside', cliponaxis=False)
-    fig_staff_orders.update_layout(
-        template="plotly_white",
-        xaxis_tickangle=-20,
-        xaxis_title="ชื่อพนักงาน",
-        yaxis_title="จำนวนออเดอร์",
-        height=graph_height,
-        margin=margin_settings,
-        showlegend=False
+        labels={'staff_fullname': 'ชื่อพนักงาน', 'orders': 'จำนวนออเดอร์'},
+        traces=dict(texttemplate='%{text:,}', textposition='outside', cliponaxis=False),
+        layout=dict(
+            template="plotly_white",
+            xaxis_tickangle=-20,
+            xaxis_title="ชื่อพนักงาน",
+            yaxis_title="จำนวนออเดอร์",
+            height=graph_height,
+            margin=margin_settings,
+            showlegend=False
+        )
     )
-    st.plotly_chart(fig_staff_orders, use_container_width=True, key="staff_orders_bar")
\ No newline at end of file
+    plotly_chart(fig_staff_orders, use_container_width=True, key="staff_orders_bar")
+
+# เครื่องมือนักพัฒนา: เวลาแต่ละส่วน/อัตรา cache hit (เปิดด้วย BIKESTORE_INSTRUMENT=1)
+dev_panel()
\ No newline at end of file
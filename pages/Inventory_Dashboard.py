@@ -0,0 +1,114 @@
+import streamlit as st
+import pandas as pd
+from analytics.dashboard import DB_PATH, cached_figure, dev_panel, inventory_coverage, plotly_chart
+from analytics.inventory import RISK_COLORS, RISK_LEVELS, reorder_list, risk_by_store, sell_through_by
+# -----------------------------
+# ✅ Page Config
+# -----------------------------
+st.set_page_config(
+    page_title="Inventory Dashboard",
+    layout="wide",
+    page_icon="📦"
+)
+
+st.title("Bikestore Business Dashboard")
+st.header("📦 Inventory Dashboard")
+
+# โหลดตาราง inventory_coverage ที่ ETL คำนวณไว้แล้ว (ครั้งเดียวต่อเวอร์ชันของ warehouse)
+cov = inventory_coverage(DB_PATH)
+if cov.empty:
+    st.warning("ยังไม่มีข้อมูลสต็อก — รัน ETL ที่มีไฟล์ stocks เพื่อสร้าง fact_inventory และ inventory_coverage")
+    dev_panel()
+    st.stop()
+
+as_of = pd.Timestamp(cov['as_of'].iloc[0])
+window_days = int(cov['window_days'].iloc[0])
+st.caption(f"สต็อกปัจจุบันเทียบกับยอดขาย {window_days} วันล่าสุด (ถึง {as_of:%d %b %Y})")
+
+# -----------------------------
+# 🎛️ Sidebar – ฟิลเตอร์
+# -----------------------------
+st.sidebar.title("⚙️ ตัวกรองข้อมูล")
+f_store = st.sidebar.multiselect("สาขา", sorted(cov['store_name'].dropna().unique()))
+f_brand = st.sidebar.multiselect("แบรนด์", sorted(cov['brand_name'].dropna().unique()))
+f_category = st.sidebar.multiselect("หมวดหมู่สินค้า", sorted(cov['category_name'].dropna().unique()))
+f_risk = st.sidebar.multiselect("ความเสี่ยงสินค้าขาด", list(RISK_LEVELS))
+
+# กรองแบบ vectorised (ว่าง = ทั้งหมด)
+mask = pd.Series(True, index=cov.index)
+for column, values in (('store_name', f_store), ('brand_name', f_brand),
+                       ('category_name', f_category), ('stock_out_risk', f_risk)):
+    if values:
+        mask &= cov[column].isin(values)
+f = cov[mask]
+
+# -----------------------------
+# 📊 KPI
+# -----------------------------
+c1, c2, c3, c4, c5 = st.columns(5)
+c1.metric("สินค้า × สาขา", f"{len(f):,}")
+c2.metric("สินค้าหมด (มีความต้องการ)", f"{int((f['stock_out_risk'] == 'out of stock').sum()):,}")
+c3.metric("เสี่ยงสูง", f"{int((f['stock_out_risk'] == 'high').sum()):,}")
+median_cover = f['days_of_cover'].median()
+c4.metric("Days of cover (มัธยฐาน)", "-" if pd.isna(median_cover) else f"{median_cover:,.0f} วัน")
+c5.metric("จำนวนที่ควรสั่งเพิ่ม", f"{int(f['reorder_qty'].sum()):,} ชิ้น")
+
+# -----------------------------
+# 🚦 ความเสี่ยงสินค้าขาดรายสาขา & Sell-through
+# -----------------------------
+left, right = st.columns(2)
+with left:
+    st.subheader("🚦 ความเสี่ยงสินค้าขาดรายสาขา")
+    risk = risk_by_store(f)
+    risk['stock_out_risk'] = risk['stock_out_risk'].astype(str)
+    fig_risk = cached_figure(
+        'bar', risk, x='store_name', y='items', color='stock_out_risk',
+        color_discrete_map=RISK_COLORS, category_orders={'stock_out_risk': list(RISK_LEVELS)},
+        labels={'store_name': 'สาขา', 'items': 'สินค้า × สาขา', 'stock_out_risk': 'ความเสี่ยง'},
+        layout={'barmode': 'stack', 'height': 380, 'margin': {'l': 10, 'r': 10, 't': 30, 'b': 10}},
+    )
+    plotly_chart(fig_risk, use_container_width=True, key="risk_by_store")
+
+with right:
+    st.subheader("🔄 Sell-through รายหมวดหมู่")
+    st_cat = sell_through_by(f, 'category_name')
+    fig_st = cached_figure(
+        'bar', st_cat, x='sell_through', y='category_name', orientation='h',
+        labels={'sell_through': 'Sell-through', 'category_name': 'หมวดหมู่'},
+        layout={'height': 380, 'xaxis': {'tickformat': '.0%'}, 'yaxis': {'categoryorder': 'total ascending'},
+                'margin': {'l': 10, 'r': 10, 't': 30, 'b': 10}},
+    )
+    plotly_chart(fig_st, use_container_width=True, key="sell_through_category")
+
+# -----------------------------
+# ⏳ การกระจายของ Days of cover
+# -----------------------------
+st.subheader("⏳ Days of cover (สินค้าที่มียอดขาย)")
+max_days = st.slider("แสดงสูงสุด (วัน)", 30, 720, 180, step=30)
+cover = f.loc[f['days_of_cover'].notna(), ['days_of_cover', 'stock_out_risk']].copy()
+cover['days_of_cover'] = cover['days_of_cover'].clip(upper=max_days)
+cover['stock_out_risk'] = cover['stock_out_risk'].astype(str)
+fig_cover = cached_figure(
+    'histogram', cover, x='days_of_cover', color='stock_out_risk', nbins=36,
+    color_discrete_map=RISK_COLORS, category_orders={'stock_out_risk': list(RISK_LEVELS)},
+    labels={'days_of_cover': f'Days of cover (ตัดที่ {max_days} วัน)', 'stock_out_risk': 'ความเสี่ยง'},
+    layout={'height': 340, 'bargap': 0.05, 'margin': {'l': 10, 'r': 10, 't': 30, 'b': 10}},
+)
+plotly_chart(fig_cover, use_container_width=True, key="cover_hist")
+
+# -----------------------------
+# 🛒 รายการที่ควรสั่งเพิ่ม
+# -----------------------------
+st.subheader("🛒 รายการที่ควรสั่งเพิ่ม (เรียงตามความเร่งด่วน)")
+top_n = st.slider("จำนวนรายการ", 10, 200, 50, step=10)
+reorder = reorder_list(f, top_n)[[
+    'store_name', 'product_name', 'brand_name', 'category_name', 'quantity_on_hand',
+    'units_sold', 'daily_velocity', 'days_of_cover', 'sell_through', 'stock_out_risk', 'reorder_qty',
+]]
+st.dataframe(
+    reorder.round({'daily_velocity': 2, 'days_of_cover': 1, 'sell_through': 3}),
+    use_container_width=True, hide_index=True,
+)
+
+# เครื่องมือนักพัฒนา: เวลาแต่ละส่วน/อัตรา cache hit (เปิดด้วย BIKESTORE_INSTRUMENT=1)
+dev_panel()
@@ -1,9 +1,13 @@
 import streamlit as st
-import duckdb as dd
 import pandas as pd
 import numpy as np
-import plotly.express as px
 from datetime import datetime
+from analytics import queries
+from analytics.charts import MAX_TREEMAP_LEAVES, top_n_other
+from analytics.dashboard import (
+    DB_PATH, basket_items, bought_together, cached_figure, dev_panel, distinct_sketches, forecasts, freeze_filters,
+    get_warehouse, plotly_chart, run_queries, warehouse_tables,
+)
 
 # -----------------------------
 # ✅ Page Config & Theming
@@ -30,109 +34,28 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
-# -----------------------------
-# 🔧 Utils
-# -----------------------------
-@st.cache_data(show_spinner=False)
-def load_tables(db_path: str):
-    conn = dd.connect(db_path)
-    try:
-        dim_customers = conn.execute("SELECT * FROM dim_customers").fetchdf()
-        dim_date      = conn.execute("SELECT * FROM dim_date").fetchdf()
-        dim_staffs    = conn.execute("SELECT * FROM dim_staffs").fetchdf()
-        dim_products  = conn.execute("SELECT * FROM dim_products").fetchdf()
-        dim_brands    = conn.execute("SELECT * FROM dim_brands").fetchdf()
-        dim_categories= conn.execute("SELECT * FROM dim_categories").fetchdf()
-        dim_stores    = conn.execute("SELECT * FROM dim_stores").fetchdf()
-        fact_sales    = conn.execute("SELECT * FROM fact_sales").fetchdf()
-    finally:
-        conn.close()
-    return (
-        dim_customers, dim_date, dim_staffs, dim_products,
-        dim_brands, dim_categories, dim_stores, fact_sales
-    )
-
-
-def baht(x):
-    try:
-        return f"฿{x:,.0f}"
-    except Exception:
-        return "-"
-
-def pct(x):
-    try:
-        return f"{x*100:.1f}%"
-    except Exception:
-        return "-"
-
-
-def add_period_cols(df):
-    df = df.copy()
-    df['order_date'] = pd.to_datetime(df['order_date'])
-    df['year']   = df['order_date'].dt.year
-    df['quarter']= df['order_date'].dt.to_period('Q').astype(str)
-    df['month']  = df['order_date'].dt.to_period('M').astype(str)
-    df['date']   = df['order_date'].dt.date
-    return df
-
-
-def compute_net_sales(df):
-    df = df.copy()
-    # net_sales = quantity * list_price * (1 - discount)
-    df['net_sales'] = df['quantity'] * df['list_price'] * (1 - df['discount'])
-    return df
-
-
-def growth_rate(series: pd.Series):
-    if len(series) < 2:
-        return 0.0
-    prev, curr = series.iloc[-2], series.iloc[-1]
-    if prev == 0:
-        return np.nan
-    return (curr - prev) / prev
-
 # -----------------------------
 # 🎛️ Sidebar – ฟิลเตอร์
 # -----------------------------
 st.sidebar.title("⚙️ ตัวกรองข้อมูล")
 
 
-DB_PATH = "data_cube/bikestore.duckdb"
-
-
-(
-    dim_customers, dim_date, dim_staffs, dim_products,
-    dim_brands, dim_categories, dim_stores, fact_sales
-) = load_tables(DB_PATH)
-
-# ทำงานด้วย pandas ทั้งหมดเพื่อความสม่ำเสมอ
-customers = dim_customers.copy()
-products  = dim_products.copy()
-brands    = dim_brands.copy()
-categories= dim_categories.copy()
-stores    = dim_stores.copy()
-staffs    = dim_staffs.copy()
-sales     = fact_sales.copy()
-
-# เตรียมข้อมูลหลัก
-sales = compute_net_sales(sales)
-sales = add_period_cols(sales)
+# โหลดครั้งเดียวต่อเวอร์ชันของ warehouse และแชร์ทุกหน้า/ทุก session (อ่านอย่างเดียว)
+wh = get_warehouse(DB_PATH)
 
-# Join dims ที่จำเป็น
-products_lite = products[['product_id','product_name','category_id','brand_id']]
-sales = sales.merge(products_lite, on='product_id', how='left')
-sales = sales.merge(categories[['category_id','category_name']], on='category_id', how='left')
-sales = sales.merge(brands[['brand_id','brand_name']], on='brand_id', how='left')
-sales = sales.merge(stores[['store_id','store_name']], on='store_id', how='left')
-sales = sales.merge(customers[['customer_id','customer_city','customer_state']], on='customer_id', how='left')
+customers = wh.customers
+products  = wh.products
+brands    = wh.brands
+categories= wh.categories
+stores    = wh.stores
+staffs    = wh.staffs
+sales     = wh.sales
 
 # วันที่ min-max สำหรับฟิลเตอร์
-min_date = pd.to_datetime(sales['order_date']).min()
-max_date = pd.to_datetime(sales['order_date']).max()
+min_date = wh.min_date
+max_date = wh.max_date
 
 # ---- Controls ----
-period = st.sidebar.selectbox("หน่วยเวลา (สำหรับกราฟแนวโน้ม)", ["month","quarter","year"], index=0)
-
 col_a, col_b = st.sidebar.columns(2)
 with col_a:
     f_store = st.multiselect("สาขา", options=sorted(stores['store_name'].unique()))
@@ -147,22 +70,26 @@ f_date = st.sidebar.date_input(
     min_value=min_date.date(),
     max_value=max_date.date()
 )
+exact_counts = st.sidebar.toggle(
+    "นับลูกค้า/ออเดอร์แบบแม่นยำ",
+    value=False,
+    help="ปิด = ประมาณจาก HyperLogLog sketch (คลาดเคลื่อน ~2%) เมื่อช่วงวันที่ครอบคลุมทั้งเดือน"
+)
 # if st.sidebar.button("รีเซ็ตตัวกรอง"):
 #     st.experimental_rerun()
 
-# Apply Filters
-mask = (
-    (sales['order_date'].dt.date >= f_date[0]) &
-    (sales['order_date'].dt.date <= f_date[1])
-)
-if f_store:
-    mask &= sales['store_name'].isin(f_store)
-if f_brand:
-    mask &= sales['brand_name'].isin(f_brand)
-if f_category:
-    mask &= sales['category_name'].isin(f_category)
+# Apply Filters: แต่ละ section คำนวณและแคชเองจาก filters ชุดนี้
+filters = freeze_filters(f_date, f_store, f_brand, f_category)
 
-f = sales.loc[mask].copy()
+# distinct count จาก sketch ที่ merge ได้ แทนการสแกน (ต้องเป็นเดือนเต็ม)
+sketch = None if exact_counts else distinct_sketches(DB_PATH)
+approx_counts = sketch is not None and sketch.answers(filters)
+
+# ทุก aggregate ของหน้านี้เป็นอิสระต่อกัน: ยิงเข้า DuckDB พร้อมกันทีเดียว (คนละ cursor)
+batch_period = st.session_state.get('trend_period', 'month')
+# มี fact_orders: นับออเดอร์จากตารางระดับออเดอร์ (เมื่อไม่ได้กรองแบรนด์/หมวดหมู่)
+orders_table = 'fact_orders' in warehouse_tables()
+page_data = run_queries(queries.sale_page(filters, batch_period, orders_table, distinct=not approx_counts))
 
 # -----------------------------
 # 🧭 Header
@@ -175,22 +102,12 @@ st.caption(f"ช่วงวันที่ {f_date[0].strftime('%d %b %Y')} –
 # 📊 KPI Cards
 # -----------------------------
 # KPI หลัก
-total_sales   = f['net_sales'].sum()
-orders        = f['order_id'].nunique()
-customers_cnt = f['customer_id'].nunique()
+kpi = page_data['kpis'].iloc[0]
+total_sales   = kpi['total_sales']
+orders        = int(kpi['orders']) if pd.notna(kpi['orders']) else sketch.distinct('orders', filters)
+customers_cnt = sketch.distinct('customers', filters) if approx_counts else int(kpi['customers'])
 AOV           = total_sales / orders if orders else 0
 
-# Growth เทียบกับงวดก่อน (ตาม period)
-trend_df = (
-    f.groupby(period)
-     .agg(net_sales=('net_sales','sum'), orders=('order_id','nunique'))
-     .reset_index()
-     .sort_values(by=period)
-)
-
-sales_growth = growth_rate(trend_df['net_sales']) if len(trend_df) >= 2 else np.nan
-orders_growth = growth_rate(trend_df['orders']) if len(trend_df) >= 2 else np.nan
-
 # ...existing code...
 
 st.markdown("""
@@ -300,11 +217,11 @@ st.markdown(
        </div>
        <div class="metric-card">
            <div class="metric-title">จำนวนออเดอร์</div>
-           <div class="metric-value">{orders:,}</div>
+           <div class="metric-value">{'≈' if pd.isna(kpi['orders']) else ''}{orders:,}</div>
        </div>
        <div class="metric-card">
            <div class="metric-title">จำนวนลูกค้า</div>
-           <div class="metric-value">{customers_cnt:,}</div>
+           <div class="metric-value">{'≈' if approx_counts else ''}{customers_cnt:,}</div>
        </div>
        <div class="metric-card">
            <div class="metric-title">ค่าเฉลี่ยต่อออเดอร์</div>
@@ -322,31 +239,60 @@ st.markdown("---")
 # -----------------------------
 # 📈 แนวโน้มยอดขาย & จำนวนออเดอร์ (2 กราฟใน 1 แถว)
 # -----------------------------
+# เป็น fragment: เปลี่ยนหน่วยเวลาแล้ว rerun เฉพาะส่วนนี้ ไม่คำนวณ KPI/กราฟอื่นใหม่
+@st.fragment
+def trend_section(filters, trend_df, batch_period):
+    st.markdown("### แนวโน้มยอดขายและออเดอร์ตามช่วงเวลา")
+    period = st.selectbox("หน่วยเวลา (สำหรับกราฟแนวโน้ม)", ["month","quarter","year"], index=0, key='trend_period')
+    if period != batch_period:
+        trend_df = run_queries({'trend': queries.trend(filters, period, orders_table)})['trend']
+
+    col1, col2 = st.columns([1,1])
+    with col1:
+        fig_sales = cached_figure(
+            'line', trend_df, x=period, y='net_sales',
+            markers=True,
+            title=f"แนวโน้มยอดขาย ($) by {period}",
+            labels={period: "ช่วงเวลา", "net_sales": "ยอดขายสุทธิ ($)"},
+            color_discrete_sequence=["#4f8bc9"],
+            layout=dict(template="plotly_white", legend_title_text="ยอดขายสุทธิ", height=320, margin=dict(t=40, b=40, l=10, r=10))
+        )
+        plotly_chart(fig_sales, use_container_width=True, key="sales_trend")
+    with col2:
+        fig_orders = cached_figure(
+            'line', trend_df, x=period, y='orders',
+            markers=True,
+            title=f"แนวโน้มจำนวนออเดอร์ by {period}",
+            labels={period: "ช่วงเวลา", "orders": "จำนวนออเดอร์"},
+            color_discrete_sequence=["#4f8bc9"],
+            layout=dict(template="plotly_white", legend_title_text="จำนวนออเดอร์", height=320, margin=dict(t=40, b=40, l=10, r=10))
+        )
+        plotly_chart(fig_orders, use_container_width=True, key="orders_trend")
+
+    # ยอดขายรายวันกับค่าที่คาด (trend + seasonal) และวันผิดปกติ: อ่านจาก sales_decomposition ที่ ETL คำนวณไว้
+    if 'sales_decomposition' not in warehouse_tables():
+        return
+    daily = run_queries({'daily': queries.daily_anomalies(filters)})['daily']
+    anomalies = daily[daily['is_anomaly']]
+    long = pd.concat([
+        daily.assign(series='ยอดขายรายวัน', value=daily['net_sales']),
+        daily.assign(series='ค่าที่คาด (แนวโน้ม + ฤดูกาล)', value=daily['expected']),
+        anomalies.assign(series='ผิดปกติ', value=anomalies['net_sales']),
+    ])[['date', 'series', 'value', 'anomaly_stores']]
+    fig_daily = cached_figure(
+        'line', long, x='date', y='value', color='series',
+        hover_data={'anomaly_stores': True},
+        title=f"ยอดขายรายวันและวันที่ผิดปกติ ({len(anomalies)} วัน)",
+        labels={'date': 'วันที่', 'value': 'ยอดขายสุทธิ ($)', 'series': '', 'anomaly_stores': 'สาขาที่ผิดปกติ'},
+        color_discrete_map={'ยอดขายรายวัน': '#9ecae1', 'ค่าที่คาด (แนวโน้ม + ฤดูกาล)': '#4f8bc9', 'ผิดปกติ': '#e4572e'},
+        traces=dict(mode='markers', marker=dict(size=9, symbol='x'), selector=dict(name='ผิดปกติ')),
+        layout=dict(template="plotly_white", height=340, margin=dict(t=40, b=40, l=10, r=10))
+    )
+    plotly_chart(fig_daily, use_container_width=True, key="daily_anomalies")
+    st.caption("ตามตัวกรองสาขาและช่วงวันที่เท่านั้น; วันผิดปกติ = |robust z| ของส่วนเหลือ ≥ 3.5 ในสาขาใดสาขาหนึ่ง")
 
-# แนวโน้มยอดขาย & จำนวนออเดอร์ (2 กราฟใน 1 แถว)
-st.markdown("### แนวโน้มยอดขายและออเดอร์ตามช่วงเวลา")
-col1, col2 = st.columns([1,1])
-with col1:
-   fig_sales = px.line(
-       trend_df, x=period, y='net_sales',
-       markers=True,
-       title=f"แนวโน้มยอดขาย ($) by {period}",
-       labels={period: "ช่วงเวลา", "net_sales": "ยอดขายสุทธิ ($)"},
-       color_discrete_sequence=["#4f8bc9"]
-   )
-   fig_sales.update_layout(template="plotly_white", legend_title_text="ยอดขายสุทธิ", height=320, margin=dict(t=40, b=40, l=10, r=10))
-   st.plotly_chart(fig_sales, use_container_width=True, key="sales_trend")
-with col2:
-   fig_orders = px.line(
-       trend_df, x=period, y='orders',
-       markers=True,
-       title=f"แนวโน้มจำนวนออเดอร์ by {period}",
-       labels={period: "ช่วงเวลา", "orders": "จำนวนออเดอร์"},
-       color_discrete_sequence=["#4f8bc9"]
-   )
-   fig_orders.update_layout(template="plotly_white", legend_title_text="จำนวนออเดอร์", height=320, margin=dict(t=40, b=40, l=10, r=10))
-   st.plotly_chart(fig_orders, use_container_width=True, key="orders_trend")
 
+trend_section(filters, page_data['trend'], batch_period)
 
 
 st.markdown("---")
@@ -355,134 +301,203 @@ st.markdown("---")
 # -----------------------------
 # 🧱 Top10 สินค้าขายดี (2 กราฟใน 1 แถว)
 # -----------------------------
+def top_products_section(prod_rev, prod_qty):
+    st.markdown("### Top10 สินค้าขายดี")
+    col3, col4 = st.columns([1,1])
+    with col3:
+        fig_rev = cached_figure(
+            'bar',
+            prod_rev,
+            x='product_name',
+            y='net_sales',
+            text='net_sales',
+            title='Top 10 สินค้าขายดีตามรายได้',
+            labels={'product_name': 'ชื่อสินค้า', 'net_sales': 'รายได้สุทธิ ($)'},
+            color='net_sales',
+            color_continuous_scale='Blues',  # เปลี่ยนเป็นโทนฟ้า
+            traces=dict(texttemplate='%{text:,.0f}', textposition='outside', cliponaxis=False),
+            layout=dict(template="plotly_white", xaxis_tickangle=-35, yaxis_title='รายได้สุทธิ ($)', showlegend=False, height=320, margin=dict(t=40, b=60, l=10, r=10))
+        )
+        plotly_chart(fig_rev, use_container_width=True, key="top10_revenue")
+    with col4:
+        fig_qty = cached_figure(
+            'bar',
+            prod_qty,
+            x='product_name',
+            y='quantity',
+            text='quantity',
+            title='Top 10 สินค้าขายดีตามจำนวนชิ้น',
+            labels={'product_name': 'ชื่อสินค้า', 'quantity': 'จำนวนชิ้น'},
+            color='quantity',
+            color_continuous_scale='Blues',  # เปลี่ยนเป็นโทนฟ้า
+            traces=dict(texttemplate='%{text}', textposition='outside', cliponaxis=False),
+            layout=dict(template="plotly_white", xaxis_tickangle=-35, yaxis_title='จำนวนชิ้น', showlegend=False, height=320, margin=dict(t=40, b=60, l=10, r=10))
+        )
+        plotly_chart(fig_qty, use_container_width=True, key="top10_qty")
+
+
+# Top 10 products by net sales and quantity
+top_products_section(page_data['top_revenue'], page_data['top_quantity'])
 
 
-# Aggregate top 10 products by net sales and quantity
-prod_rev = (
-   f.groupby('product_name')
-   .agg(net_sales=('net_sales', 'sum'))
-   .reset_index()
-   .sort_values(by='net_sales', ascending=False)
-   .head(10)
-)
+st.markdown("---")
 
 
-prod_qty = (
-   f.groupby('product_name')
-   .agg(quantity=('quantity', 'sum'))
-   .reset_index()
-   .sort_values(by='quantity', ascending=False)
-   .head(10)
-)
+# -----------------------------
+# 🧩 แบรนด์ × หมวดหมู่ (Treemap)
+# -----------------------------
+def brand_category_section(brand_cat):
+    st.markdown("### สัดส่วนยอดขายตามแบรนด์และหมวดหมู่สินค้า")
+    fig_tree = cached_figure(
+        'treemap',
+        brand_cat,
+        path=['brand_name','category_name'],
+        values='net_sales',
+        title="Treemap: แบรนด์ × หมวดหมู่",
+        color='net_sales',
+        color_continuous_scale='Blues',  # เปลี่ยนเป็นโทนฟ้า
+        layout=dict(margin=dict(t=50,l=0,r=0,b=0), height=400)
+    )
+    plotly_chart(fig_tree, use_container_width=True, key="brand_cat_treemap")
 
 
-# Top10 สินค้าขายดี (2 กราฟใน 1 แถว)
-st.markdown("### Top10 สินค้าขายดี")
-col3, col4 = st.columns([1,1])
-with col3:
-   fig_rev = px.bar(
-       prod_rev,
-       x='product_name',
-       y='net_sales',
-       text='net_sales',
-       title='Top 10 สินค้าขายดีตามรายได้',
-       labels={'product_name': 'ชื่อสินค้า', 'net_sales': 'รายได้สุทธิ ($)'},
-       color='net_sales',
-       color_continuous_scale='Blues'  # เปลี่ยนเป็นโทนฟ้า
-   )
-   fig_rev.update_traces(texttemplate='%{text:,.0f}', textposition='outside', cliponaxis=False)
-   fig_rev.update_layout(template="plotly_white", xaxis_tickangle=-35, yaxis_title='รายได้สุทธิ ($)', showlegend=False, height=320, margin=dict(t=40, b=60, l=10, r=10))
-   st.plotly_chart(fig_rev, use_container_width=True, key="top10_revenue")
-with col4:
-   fig_qty = px.bar(
-       prod_qty,
-       x='product_name',
-       y='quantity',
-       text='quantity',
-       title='Top 10 สินค้าขายดีตามจำนวนชิ้น',
-       labels={'product_name': 'ชื่อสินค้า', 'quantity': 'จำนวนชิ้น'},
-       color='quantity',
-       color_continuous_scale='Blues'  # เปลี่ยนเป็นโทนฟ้า
-   )
-   fig_qty.update_traces(texttemplate='%{text}', textposition='outside', cliponaxis=False)
-   fig_qty.update_layout(template="plotly_white", xaxis_tickangle=-35, yaxis_title='จำนวนชิ้น', showlegend=False, height=320, margin=dict(t=40, b=60, l=10, r=10))
-   st.plotly_chart(fig_qty, use_container_width=True, key="top10_qty")
+# Net sales by brand and category for treemap
+brand_category_section(top_n_other(page_data['brand_category'], 'category_name', 'net_sales', n=MAX_TREEMAP_LEAVES, by='brand_name'))
 
 
 st.markdown("---")
 
 
 # -----------------------------
-# 🧩 แบรนด์ × หมวดหมู่ (Treemap)
+# 💸 ผลของส่วนลดต่อปริมาณ/รายได้ (2 กราฟใน 1 แถว)
 # -----------------------------
-# Aggregate net sales by brand and category for treemap
-brand_cat = (
-   f.groupby(['brand_name', 'category_name'])
-   .agg(net_sales=('net_sales', 'sum'))
-   .reset_index()
-)
+def discount_section(disc):
+    st.markdown("### ผลของส่วนลดต่อปริมาณ & รายได้")
+    col5, col6 = st.columns([1,1])
+    with col5:
+        fig_dq = cached_figure(
+            'bar',
+            disc,
+            x='discount_range',
+            y='total_qty',
+            text='total_qty',
+            title='ปริมาณที่ขายได้ตามช่วงส่วนลด',
+            labels={'discount_range': 'ช่วงส่วนลด (%)', 'total_qty': 'ปริมาณที่ขายได้ (ชิ้น)'},
+            color='total_qty',
+            color_continuous_scale='Blues',  # เปลี่ยนเป็นโทนฟ้า
+            traces=dict(textposition='outside', cliponaxis=False),
+            layout=dict(template="plotly_white", xaxis_title="ช่วงส่วนลด (%)", yaxis_title="ปริมาณที่ขายได้ (ชิ้น)", height=320, margin=dict(t=40, b=40, l=10, r=10))
+        )
+        plotly_chart(fig_dq, use_container_width=True, key="discount_qty")
+    with col6:
+        fig_ds = cached_figure(
+            'bar',
+            disc,
+            x='discount_range',
+            y='total_sales',
+            text='total_sales',
+            title='รายได้ที่ขายได้ตามช่วงส่วนลด',
+            labels={'discount_range': 'ช่วงส่วนลด (%)', 'total_sales': 'รายได้ที่ขายได้ ($)'},
+            color='total_sales',
+            color_continuous_scale='Blues',  # เปลี่ยนเป็นโทนฟ้า
+            traces=dict(texttemplate='%{text:,.0f}', textposition='outside', cliponaxis=False),
+            layout=dict(template="plotly_white", xaxis_title="ช่วงส่วนลด (%)", yaxis_title="รายได้ที่ขายได้ ($)", height=320, margin=dict(t=40, b=40, l=10, r=10))
+        )
+        plotly_chart(fig_ds, use_container_width=True, key="discount_sales")
+
+
+# discount range 0-5%, 5-10%, ..., 25%+ (ดู analytics.aggregates.DISCOUNT_BINS)
+discount_section(page_data['discount'])
 
 
-# Treemap แบรนด์ × หมวดหมู่
-st.markdown("### สัดส่วนยอดขายตามแบรนด์และหมวดหมู่สินค้า")
-fig_tree = px.treemap(
-   brand_cat,
-   path=['brand_name','category_name'],
-   values='net_sales',
-   title="Treemap: แบรนด์ × หมวดหมู่",
-   color='net_sales',
-   color_continuous_scale='Blues'  # เปลี่ยนเป็นโทนฟ้า
-)
-fig_tree.update_layout(margin=dict(t=50,l=0,r=0,b=0), height=400)
-st.plotly_chart(fig_tree, use_container_width=True, key="brand_cat_treemap")
+st.markdown("---")
 
 
+# -----------------------------
+# 🛍️ สินค้าที่มักซื้อคู่กัน (คำนวณล่วงหน้ารายเดือนด้วย analytics.basket)
+# -----------------------------
+@st.fragment
+def basket_section(f_date, top_revenue):
+    st.markdown("### สินค้าที่มักซื้อคู่กัน")
+    items = basket_items()
+    if items.empty:
+        st.info("ยังไม่มีข้อมูลตะกร้าสินค้า — รัน `python -m analytics.basket` หลังโหลดข้อมูลเข้า warehouse")
+        return
+    names = items['product_name'].tolist()
+    # ค่าเริ่มต้น = สินค้าขายดีอันดับ 1 ตามตัวกรอง
+    best = top_revenue['product_name'].iloc[0] if len(top_revenue) else None
+    name = st.selectbox("สินค้า", names, index=names.index(best) if best in names else 0, key='basket_product')
+    product_id = int(items.loc[items['product_name'] == name, 'product_id'].iloc[0])
+    pairs = bought_together(product_id, f_date[0], f_date[1])
+    if pairs.empty:
+        st.caption("ไม่มีสินค้าที่ถูกซื้อคู่กันอย่างน้อย 2 ออเดอร์ในช่วงนี้")
+        return
+    col9, col10 = st.columns([1,1])
+    with col9:
+        fig_basket = cached_figure(
+            'bar', pairs.iloc[::-1], x='lift', y='product_name', orientation='h',
+            text='orders',
+            title=f"ซื้อคู่กับ {name} (เรียงตาม lift)",
+            labels={'lift': 'Lift', 'product_name': '', 'orders': 'ออเดอร์ที่ซื้อคู่กัน'},
+            color_discrete_sequence=["#4f8bc9"],
+            traces=dict(texttemplate='%{text} ออเดอร์', textposition='outside', cliponaxis=False),
+            layout=dict(template="plotly_white", height=360, margin=dict(t=40, b=40, l=10, r=10))
+        )
+        plotly_chart(fig_basket, use_container_width=True, key="bought_together")
+    with col10:
+        st.dataframe(
+            pairs[['product_name', 'orders', 'support', 'confidence', 'lift']].style.format(
+                {'support': '{:.2%}', 'confidence': '{:.1%}', 'lift': '{:.1f}'}),
+            hide_index=True, use_container_width=True,
+        )
+    st.caption("support = สัดส่วนออเดอร์ที่มีทั้งคู่, confidence = P(ซื้อสินค้าคู่ | ซื้อสินค้าที่เลือก); นับเป็นเดือนเต็มตามช่วงวันที่ ไม่ขึ้นกับตัวกรองอื่น")
+
+
+basket_section(f_date, page_data['top_revenue'])
+
 st.markdown("---")
 
 
 # -----------------------------
-# 💸 ผลของส่วนลดต่อปริมาณ/รายได้ (2 กราฟใน 1 แถว)
+# 🔮 พยากรณ์ยอดขายรายเดือน (คำนวณล่วงหน้าด้วย analytics.forecast)
 # -----------------------------
+FORECAST_LEVELS = {'total': 'ทั้งบริษัท', 'store': 'สาขา', 'category': 'หมวดหมู่'}
+FORECAST_SERIES = {'actual': 'ยอดขายจริง', 'yhat': 'พยากรณ์', 'yhat_lower': 'ขอบล่าง (80%)', 'yhat_upper': 'ขอบบน (80%)'}
+
+
+@st.fragment
+def forecast_section(fc):
+    st.markdown("### พยากรณ์ยอดขายรายเดือน")
+    if fc.empty:
+        st.info("ยังไม่มีผลพยากรณ์ — รัน `python -m analytics.forecast` หลังโหลดข้อมูลเข้า warehouse")
+        return
+    col7, col8 = st.columns([1,1])
+    level = col7.selectbox("ระดับ", [lv for lv in FORECAST_LEVELS if lv in set(fc['level'])],
+                           format_func=FORECAST_LEVELS.get, key='forecast_level')
+    key = col8.selectbox(FORECAST_LEVELS[level], sorted(fc.loc[fc['level'] == level, 'key'].unique()), key='forecast_key')
+    s = fc[(fc['level'] == level) & (fc['key'] == key)].copy()
+    # ต่อเส้นพยากรณ์จากเดือนจริงเดือนสุดท้าย
+    last = s['actual'].last_valid_index()
+    if last is not None:
+        s.loc[last, ['yhat', 'yhat_lower', 'yhat_upper']] = s.loc[last, 'actual']
+    long = (
+        s.melt(id_vars='month', value_vars=list(FORECAST_SERIES), var_name='series', value_name='net_sales')
+         .dropna(subset=['net_sales'])
+         .replace({'series': FORECAST_SERIES})
+    )
+    fig_fc = cached_figure(
+        'line', long, x='month', y='net_sales', color='series', line_dash='series',
+        title=f"พยากรณ์ยอดขาย {key} ({s['model'].iloc[0]}, อัปเดต {s['fitted_at'].iloc[0]:%Y-%m-%d %H:%M})",
+        labels={'month': 'เดือน', 'net_sales': 'ยอดขายสุทธิ ($)', 'series': ''},
+        color_discrete_map={'ยอดขายจริง': '#4f8bc9', 'พยากรณ์': '#f97316', 'ขอบล่าง (80%)': '#fdba74', 'ขอบบน (80%)': '#fdba74'},
+        line_dash_map={'ยอดขายจริง': 'solid', 'พยากรณ์': 'solid', 'ขอบล่าง (80%)': 'dot', 'ขอบบน (80%)': 'dot'},
+        layout=dict(template="plotly_white", height=360, margin=dict(t=40, b=40, l=10, r=10))
+    )
+    plotly_chart(fig_fc, use_container_width=True, key="sales_forecast")
+    st.caption("พยากรณ์จากประวัติทั้งหมดของแต่ละซีรีส์ (ไม่ขึ้นกับตัวกรองด้านข้าง)")
+
 
+forecast_section(forecasts())
 
-# สร้าง discount range และ aggregate ข้อมูล
-discount_bins = [0, 0.05, 0.10, 0.15, 0.20, 0.25, 1.0]
-discount_labels = ["0-5%", "5-10%", "10-15%", "15-20%", "20-25%", "25%+"]
-f['discount_range'] = pd.cut(f['discount'], bins=discount_bins, labels=discount_labels, include_lowest=True, right=False)
-disc = f.groupby('discount_range').agg(
-   total_qty=('quantity', 'sum'),
-   total_sales=('net_sales', 'sum')
-).reset_index()
-
-
-# ผลของส่วนลดต่อปริมาณ/รายได้ (2 กราฟใน 1 แถว)
-st.markdown("### ผลของส่วนลดต่อปริมาณ & รายได้")
-col5, col6 = st.columns([1,1])
-with col5:
-   fig_dq = px.bar(
-       disc,
-       x='discount_range',
-       y='total_qty',
-       text='total_qty',
-       title='ปริมาณที่ขายได้ตามช่วงส่วนลด',
-       labels={'discount_range': 'ช่วงส่วนลด (%)', 'total_qty': 'ปริมาณที่ขายได้ (ชิ้น)'},
-       color='total_qty',
-       color_continuous_scale='Blues'  # เปลี่ยนเป็นโทนฟ้า
-   )
-   fig_dq.update_traces(textposition='outside', cliponaxis=False)
-   fig_dq.update_layout(template="plotly_white", xaxis_title="ช่วงส่วนลด (%)", yaxis_title="ปริมาณที่ขายได้ (ชิ้น)", height=320, margin=dict(t=40, b=40, l=10, r=10))
-   st.plotly_chart(fig_dq, use_container_width=True, key="discount_qty")
-with col6:
-   fig_ds = px.bar(
-       disc,
-       x='discount_range',
-       y='total_sales',
-       text='total_sales',
-       title='รายได้ที่ขายได้ตามช่วงส่วนลด',
-       labels={'discount_range': 'ช่วงส่วนลด (%)', 'total_sales': 'รายได้ที่ขายได้ ($)'},
-       color='total_sales',
-       color_continuous_scale='Blues'  # เปลี่ยนเป็นโทนฟ้า
-   )
-   fig_ds.update_traces(texttemplate='%{text:,.0f}', textposition='outside', cliponaxis=False)
-   fig_ds.update_layout(template="plotly_white", xaxis_title="ช่วงส่วนลด (%)", yaxis_title="รายได้ที่ขายได้ ($)", height=320, margin=dict(t=40, b=40, l=10, r=10))
-   st.plotly_chart(fig_ds, use_container_width=True, key="discount_sales")
+# เครื่องมือนักพัฒนา: เวลาแต่ละส่วน/อัตรา cache hit (เปิดด้วย BIKESTORE_INSTRUMENT=1)
+dev_panel()
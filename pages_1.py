@@ -1,9 +1,9 @@
 import streamlit as st
-import duckdb as dd
 import pandas as pd
 import numpy as np
 import plotly.express as px
 from datetime import datetime
+from analytics.dashboard import DB_PATH, get_warehouse, plotly_chart
 import statsmodels.api as sm
 
 # -----------------------------
@@ -31,103 +31,26 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
-# -----------------------------
-# 🔧 Utils
-# -----------------------------
-@st.cache_data(show_spinner=False)
-def load_tables(db_path: str):
-    conn = dd.connect(db_path)
-    try:
-        dim_customers = conn.execute("SELECT * FROM dim_customers").fetchdf()
-        dim_date      = conn.execute("SELECT * FROM dim_date").fetchdf()
-        dim_staffs    = conn.execute("SELECT * FROM dim_staffs").fetchdf()
-        dim_products  = conn.execute("SELECT * FROM dim_products").fetchdf()
-        dim_brands    = conn.execute("SELECT * FROM dim_brands").fetchdf()
-        dim_categories= conn.execute("SELECT * FROM dim_categories").fetchdf()
-        dim_stores    = conn.execute("SELECT * FROM dim_stores").fetchdf()
-        fact_sales    = conn.execute("SELECT * FROM fact_sales").fetchdf()
-    finally:
-        conn.close()
-    return (
-        dim_customers, dim_date, dim_staffs, dim_products,
-        dim_brands, dim_categories, dim_stores, fact_sales
-    )
-
-
-def baht(x):
-    try:
-        return f"฿{x:,.0f}"
-    except Exception:
-        return "-"
-
-def pct(x):
-    try:
-        return f"{x*100:.1f}%"
-    except Exception:
-        return "-"
-
-
-def add_period_cols(df):
-    df = df.copy()
-    df['order_date'] = pd.to_datetime(df['order_date'])
-    df['year']   = df['order_date'].dt.year
-    df['quarter']= df['order_date'].dt.to_period('Q').astype(str)
-    df['month']  = df['order_date'].dt.to_period('M').astype(str)
-    df['date']   = df['order_date'].dt.date
-    return df
-
-def compute_net_sales(df):
-    df = df.copy()
-    # net_sales = quantity * list_price * (1 - discount)
-    df['net_sales'] = df['quantity'] * df['list_price'] * (1 - df['discount'])
-    return df
-
-
-def growth_rate(series: pd.Series):
-    if len(series) < 2:
-        return 0.0
-    prev, curr = series.iloc[-2], series.iloc[-1]
-    if prev == 0:
-        return np.nan
-    return (curr - prev) / prev
-
 # -----------------------------
 # 🎛️ Sidebar – ฟิลเตอร์
 # -----------------------------
 st.sidebar.title("⚙️ ตัวกรองข้อมูล")
 
 
-DB_PATH = r"/Users/mac/Downloads/Web/data_cube/bikestore.duckdb"
-
-(
-    dim_customers, dim_date, dim_staffs, dim_products,
-    dim_brands, dim_categories, dim_stores, fact_sales
-) = load_tables(DB_PATH)
+# โหลดครั้งเดียวต่อเวอร์ชันของ warehouse และแชร์ทุกหน้า/ทุก session (อ่านอย่างเดียว)
+wh = get_warehouse(DB_PATH)
 
-# ทำงานด้วย pandas ทั้งหมดเพื่อความสม่ำเสมอ
-customers = dim_customers.copy()
-products  = dim_products.copy()
-brands    = dim_brands.copy()
-categories= dim_categories.copy()
-stores    = dim_stores.copy()
-staffs    = dim_staffs.copy()
-sales     = fact_sales.copy()
-
-# เตรียมข้อมูลหลัก
-sales = compute_net_sales(sales)
-sales = add_period_cols(sales)
-
-# Join dims ที่จำเป็น
-products_lite = products[['product_id','product_name','category_id','brand_id']]
-sales = sales.merge(products_lite, on='product_id', how='left')
-sales = sales.merge(categories[['category_id','category_name']], on='category_id', how='left')
-sales = sales.merge(brands[['brand_id','brand_name']], on='brand_id', how='left')
-sales = sales.merge(stores[['store_id','store_name']], on='store_id', how='left')
-sales = sales.merge(customers[['customer_id','customer_city','customer_state']], on='customer_id', how='left')
+customers = wh.customers
+products  = wh.products
+brands    = wh.brands
+categories= wh.categories
+stores    = wh.stores
+staffs    = wh.staffs
+sales     = wh.sales
 
 # วันที่ min-max สำหรับฟิลเตอร์
-min_date = pd.to_datetime(sales['order_date']).min()
-max_date = pd.to_datetime(sales['order_date']).max()
+min_date = wh.min_date
+max_date = wh.max_date
 
 # ---- Controls ----
 period = st.sidebar.selectbox("หน่วยเวลา (สำหรับกราฟแนวโน้ม)", ["month","quarter","year"], index=0)
@@ -151,18 +74,7 @@ if st.sidebar.button("รีเซ็ตตัวกรอง"):
     st.experimental_rerun()
 
 # Apply Filters
-mask = (
-    (sales['order_date'].dt.date >= f_date[0]) &
-    (sales['order_date'].dt.date <= f_date[1])
-)
-if f_store:
-    mask &= sales['store_name'].isin(f_store)
-if f_brand:
-    mask &= sales['brand_name'].isin(f_brand)
-if f_category:
-    mask &= sales['category_name'].isin(f_category)
-
-f = sales.loc[mask].copy()
+f = wh.filter(f_date, f_store, f_brand, f_category)
 # ...existing code...
 
 # -----------------------------
@@ -189,13 +101,13 @@ with colS1:
     fig_store_bar = px.bar(store_perf, x='store_name', y='net_sales', text='net_sales', title="ยอดขายสุทธิต่อสาขา")
     fig_store_bar.update_traces(texttemplate='%{text:,.0f}', textposition='outside', cliponaxis=False)
     fig_store_bar.update_layout(template="plotly_white", xaxis_title="สาขา", yaxis_title="ยอดขาย ($)")
-    st.plotly_chart(fig_store_bar, use_container_width=True)
+    plotly_chart(fig_store_bar, use_container_width=True)
 
 with colS2:
     fig_store_pie = px.pie(store_perf, names='store_name', values='net_sales', title="สัดส่วนยอดขายแยกตามสาขา", hole=0.35)
     fig_store_pie.update_traces(textinfo='percent+label')
     fig_store_pie.update_layout(template="plotly_white")
-    st.plotly_chart(fig_store_pie, use_container_width=True)
+    plotly_chart(fig_store_pie, use_container_width=True)
     
 
 st.markdown("### จำนวนออเดอร์ของแต่ละสาขา ")
@@ -211,13 +123,13 @@ with colS1:
     fig_store_bar = px.bar(store_perf, x='store_name', y='orders', text='orders', title="จำนวนออเดอร์ต่อสาขา")
     fig_store_bar.update_traces(texttemplate='%{text:,}', textposition='outside', cliponaxis=False)
     fig_store_bar.update_layout(template="plotly_white", xaxis_title="สาขา", yaxis_title="จำนวนออเดอร์")
-    st.plotly_chart(fig_store_bar, use_container_width=True)
+    plotly_chart(fig_store_bar, use_container_width=True)
 
 with colS2:
     fig_store_pie = px.pie(store_perf, names='store_name', values='orders', title="สัดส่วนจำนวนออเดอร์แยกตามสาขา", hole=0.35)
     fig_store_pie.update_traces(textinfo='percent+label')
     fig_store_pie.update_layout(template="plotly_white")
-    st.plotly_chart(fig_store_pie, use_container_width=True)
+    plotly_chart(fig_store_pie, use_container_width=True)
     
 # -----------------------------
 # 👤 ประสิทธิภาพพนักงานขาย
@@ -251,7 +163,7 @@ fig_staff.update_layout(
     yaxis_title="ยอดขายสุทธิ"
 )
 
-st.plotly_chart(fig_staff, use_container_width=True)
+plotly_chart(fig_staff, use_container_width=True)
 
 
 st.markdown("### จำนวนออเดอร์ของพนักงาน ")
@@ -283,7 +195,7 @@ fig_staff.update_layout(
     yaxis_title="จำนวนออเดอร์"
 )
 
-st.plotly_chart(fig_staff, use_container_width=True)
+plotly_chart(fig_staff, use_container_width=True)
 
 
 # -----------------------------
@@ -306,7 +218,7 @@ with colT2:
     fig_ship = px.scatter(ship_perf, x='avg_days', y='on_time_rate', text='store_name', trendline='ols', title='เฉลี่ยวันจัดส่ง vs อัตราส่งตรงเวลา')
     fig_ship.update_traces(textposition='top center')
     fig_ship.update_layout(template="plotly_white", xaxis_title='เฉลี่ยวันจัดส่ง (วัน)', yaxis_title='อัตราส่งตรงเวลา')
-    st.plotly_chart(fig_ship, use_container_width=True)
+    plotly_chart(fig_ship, use_container_width=True)
     
     
     
\ No newline at end of file
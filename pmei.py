@@ -7,6 +7,12 @@ import pandas as pd
 from streamlit_plotly_events import plotly_events
 from datetime import datetime
 import numpy as np
+import glob
+import os
+from analytics.bitmap import BitmapIndex
+from analytics.charts import MAX_TREEMAP_LEAVES, top_n_other
+from analytics.dashboard import dev_panel, plotly_chart
+from analytics.warehouse import fetch_polars, warehouse_version
 
 st.set_page_config(
     page_title="Interactive Sales Dashboard",
@@ -14,87 +20,167 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# --- Filtered view over the cube ---
+class CubeView:
+    """Filtered view over a SalesDataCube: a row mask plus a lazy Polars plan, never a copy"""
+
+    def __init__(self, cube, mask):
+        self.cube = cube
+        self.mask = mask  # None when nothing is filtered
+
+    def __len__(self):
+        if self.mask is None:
+            return self.cube.cube.height
+        return int(self.mask.sum())
+
+    @property
+    def empty(self):
+        return len(self) == 0
+
+    def lazy(self):
+        """LazyFrame over the selected rows; Polars prunes the columns a query doesn't use"""
+        lf = self.cube.cube.lazy()
+        if self.mask is None:
+            return lf
+        return lf.filter(pl.Series(self.mask))
+
+    def aggregate(self, by, sums=(), nunique=None):
+        """
+        Group the selected rows with Polars' multithreaded group_by.
+
+        Equivalent to ``groupby(by).agg(...).reset_index()``; only the few
+        aggregated rows are converted to pandas for plotting.
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        aggs = [pl.col(col).sum() for col in sums]
+        if nunique is not None:
+            aggs.append(pl.col(nunique).drop_nulls().n_unique())
+        return (
+            self.lazy()
+            .filter(pl.all_horizontal([pl.col(col).is_not_null() for col in by]))
+            .group_by(by)
+            .agg(aggs)
+            .sort(by)
+            .collect()
+            .to_pandas()
+        )
+
+    def to_frame(self, columns=None):
+        """Materialise the selected rows (only for exports)"""
+        lf = self.lazy() if columns is None else self.lazy().select(columns)
+        return lf.collect().to_pandas()
+
+
 # --- Sales Data Cube Class ---
 class SalesDataCube:
     def __init__(self, fact_sales, dim_customers, dim_date, dim_employees, dim_products):
-        self.fact_sales = fact_sales.to_pandas()
-        self.dim_customers = dim_customers.to_pandas()
-        self.dim_date = dim_date.to_pandas()
-        self.dim_employees = dim_employees.to_pandas()
-        self.dim_products = dim_products.to_pandas()
+        self.fact_sales = fact_sales
+        self.dim_customers = dim_customers
+        self.dim_date = dim_date
+        self.dim_employees = dim_employees
+        self.dim_products = dim_products
         self.cube = None
-        
+        self.index = None
+
+    @classmethod
+    def from_parquet(cls, path):
+        """Restore a cube written by save() without re-running the joins"""
+        sales_cube = cls.__new__(cls)
+        sales_cube.fact_sales = sales_cube.dim_customers = sales_cube.dim_date = None
+        sales_cube.dim_employees = sales_cube.dim_products = None
+        sales_cube._set_cube(pl.read_parquet(path))
+        return sales_cube
+
+    def save(self, path):
+        """Persist the built cube to Parquet (written to a temp file, then swapped in)"""
+        tmp_path = f"{path}.tmp"
+        self.cube.write_parquet(tmp_path)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _suffixed(df, columns, suffix):
+        return df.lazy().select([pl.col(col).alias(f"{col}{suffix}") for col in columns])
+
     def create_cube(self):
         """Create comprehensive data cube"""
-        cube = self.fact_sales.copy()
-        
-        cube = cube.merge(
-            self.dim_date.add_suffix('_date'), 
-            left_on='order_date_key', 
-            right_on='date_key_date', 
-            how='left'
-        )
-        
-        cube = cube.merge(
-            self.dim_customers[['customer_id', 'company_name', 'city', 'country_region', 'state_province']].add_suffix('_customer'),
+        fact = self.fact_sales.lazy()
+        date_key_dtype = self.fact_sales.schema['order_date_key']
+
+        dim_date = self._suffixed(self.dim_date, self.dim_date.columns, '_date') \
+            .with_columns(pl.col('date_key_date').cast(date_key_dtype))
+        cube = fact.join(dim_date, left_on='order_date_key', right_on='date_key_date', how='left')
+
+        cube = cube.join(
+            self._suffixed(self.dim_customers, ['customer_id', 'company_name', 'city', 'country_region', 'state_province'], '_customer'),
             left_on='customer_key',
             right_on='customer_id_customer',
             how='left'
         )
-        
-        cube = cube.merge(
-            self.dim_employees[['employee_key', 'full_name', 'job_title', 'city', 'country_region']].add_suffix('_employee'),
+
+        cube = cube.join(
+            self._suffixed(self.dim_employees, ['employee_key', 'full_name', 'job_title', 'city', 'country_region'], '_employee'),
             left_on='employee_key',
             right_on='employee_key_employee',
             how='left'
         )
-        
-        cube = cube.merge(
-            self.dim_products[['product_key', 'product_name', 'category', 'standard_cost', 'list_price']].add_suffix('_product'),
+
+        cube = cube.join(
+            self._suffixed(self.dim_products, ['product_key', 'product_name', 'category', 'standard_cost', 'list_price'], '_product'),
             left_on='product_key',
             right_on='product_key_product',
             how='left'
         )
-        
+
         # Calculated measures
-        cube['revenue'] = cube['net_amount']
-        cube['gross_revenue'] = cube['gross_amount']
-        cube['discount_amount'] = cube['gross_amount'] - cube['net_amount']
-        cube['total_cost'] = cube['quantity'] * cube['standard_cost_product'].fillna(0)
-        cube['profit'] = cube['net_amount'] - cube['total_cost']
-        cube['profit_margin'] = (cube['profit'] / cube['net_amount'] * 100).fillna(0)
-        cube['order_value'] = cube['net_amount'] + cube['shipping_fee'].fillna(0) + cube['taxes'].fillna(0)
-        
+        cube = cube.with_columns(
+            pl.col('net_amount').alias('revenue'),
+            pl.col('gross_amount').alias('gross_revenue'),
+            (pl.col('gross_amount') - pl.col('net_amount')).alias('discount_amount'),
+            (pl.col('quantity') * pl.col('standard_cost_product').fill_null(0)).alias('total_cost'),
+        ).with_columns(
+            (pl.col('net_amount') - pl.col('total_cost')).alias('profit'),
+        ).with_columns(
+            (pl.col('profit') / pl.col('net_amount') * 100).fill_nan(0).fill_null(0).alias('profit_margin'),
+            (pl.col('net_amount') + pl.col('shipping_fee').fill_null(0) + pl.col('taxes').fill_null(0)).alias('order_value'),
+        )
+
         # Time hierarchies
-        cube['year_date'] = cube['year_date'].astype('Int64')
-        cube['quarter_date'] = cube['quarter_date'].astype('Int64')
-        cube['month_date'] = cube['month_date'].astype('Int64')
-        cube['year_month'] = cube['year_date'].astype(str) + '-' + cube['month_date'].astype(str).str.zfill(2)
-        cube['year_quarter'] = cube['year_date'].astype(str) + '-Q' + cube['quarter_date'].astype(str)
-        
+        cube = cube.with_columns(
+            pl.col('year_date').cast(pl.Int64),
+            pl.col('quarter_date').cast(pl.Int64),
+            pl.col('month_date').cast(pl.Int64),
+        ).with_columns(
+            pl.format('{}-{}', pl.col('year_date'), pl.col('month_date').cast(pl.Utf8).str.zfill(2)).alias('year_month'),
+            pl.format('{}-Q{}', pl.col('year_date'), pl.col('quarter_date')).alias('year_quarter'),
+        )
+
+        self._set_cube(cube.collect())
+        return self.cube
+
+    def _set_cube(self, cube):
+        """Attach a built cube and precompute its attribute indexes"""
         self.cube = cube
-        return cube
-    
+        self.index = BitmapIndex(cube, ['year_date', 'quarter_date', 'month_date', 'city_customer', 'category_product'])
+
     def get_filtered_data(self, year=None, quarter=None, month=None, city=None, category=None):
         if self.cube is None:
-            return pd.DataFrame()
+            return None
         
-        filtered = self.cube.copy()
-        if year is not None:
-            filtered = filtered[filtered['year_date'] == year]
-        if quarter is not None:
-            filtered = filtered[filtered['quarter_date'] == quarter]
-        if month is not None:
-            filtered = filtered[filtered['month_date'] == month]
-        if city is not None:
-            filtered = filtered[filtered['city_customer'] == city]
-        if category is not None:
-            filtered = filtered[filtered['category_product'] == category]
-            
-        return filtered
+        # Resolve all selectboxes through the bitmap index into one row mask
+        selected = {
+            'year_date': year,
+            'quarter_date': quarter,
+            'month_date': month,
+            'city_customer': city,
+            'category_product': category
+        }
+        filters = {col: [value] for col, value in selected.items() if value is not None}
+        if not filters:
+            return CubeView(self, None)
+        return CubeView(self, self.index.select(filters))
     
     def get_kpi_summary(self, filtered_data):
-        if filtered_data.empty:
+        if filtered_data is None or filtered_data.empty:
             return {
                 'total_revenue': 0,
                 'total_profit': 0,
@@ -104,23 +190,26 @@ class SalesDataCube:
                 'total_quantity': 0
             }
         
-        return {
-            'total_revenue': filtered_data['revenue'].sum(),
-            'total_profit': filtered_data['profit'].sum(),
-            'total_orders': filtered_data['sale_id'].nunique(),
-            'avg_order_value': filtered_data['order_value'].mean(),
-            'profit_margin': filtered_data['profit_margin'].mean(),
-            'total_quantity': filtered_data['quantity'].sum()
-        }
+        return filtered_data.lazy().select(
+            pl.col('revenue').sum().alias('total_revenue'),
+            pl.col('profit').sum().alias('total_profit'),
+            pl.col('sale_id').drop_nulls().n_unique().alias('total_orders'),
+            pl.col('order_value').mean().alias('avg_order_value'),
+            pl.col('profit_margin').mean().alias('profit_margin'),
+            pl.col('quantity').sum().alias('total_quantity')
+        ).collect().row(0, named=True)
 
 # --- Load data ---
-@st.cache_data
-def load_data():
-    conn = dd.connect(r'data_cube/sales_dw.duckdb')
+DB_PATH = r'data_cube/sales_dw.duckdb'
+CUBE_CACHE_DIR = r'data_cube/cache'  # None = keep the cube in memory only
+
+# Not cached on its own: get_sales_cube is the shared, per-version cache
+def load_data(db_path=DB_PATH):
+    conn = dd.connect(db_path)
     
     def execute_query(conn, query):
-        result = conn.execute(query).fetchdf()
-        return pl.from_pandas(result)
+        # DuckDB -> Arrow -> Polars, no pandas round trip
+        return fetch_polars(conn, query)
     
     dim_customers = execute_query(conn,"SELECT * FROM dim_customers")
     dim_date = execute_query(conn,"SELECT * FROM dim_date")
@@ -131,9 +220,32 @@ def load_data():
     
     return dim_customers, dim_date, dim_employees, dim_products, fact_sales
 
-dim_customers, dim_date, dim_employees, dim_products, fact_sales = load_data()
-sales_cube = SalesDataCube(fact_sales, dim_customers, dim_date, dim_employees, dim_products)
-cube_data = sales_cube.create_cube()
+@st.cache_resource(show_spinner="กำลังสร้าง data cube...")
+def get_sales_cube(db_path, version):
+    """
+    Build the cube once per warehouse version and share it read-only across sessions.
+    A Parquet copy lets a server restart skip the joins for an unchanged warehouse.
+    """
+    cache_path = None
+    if CUBE_CACHE_DIR is not None:
+        os.makedirs(CUBE_CACHE_DIR, exist_ok=True)
+        cache_path = os.path.join(CUBE_CACHE_DIR, f"sales_cube-{version}.parquet")
+        if os.path.exists(cache_path):
+            return SalesDataCube.from_parquet(cache_path)
+
+    dim_customers, dim_date, dim_employees, dim_products, fact_sales = load_data(db_path)
+    sales_cube = SalesDataCube(fact_sales, dim_customers, dim_date, dim_employees, dim_products)
+    sales_cube.create_cube()
+
+    if cache_path is not None:
+        # Drop cubes of older warehouse loads before writing the new one
+        for stale in glob.glob(os.path.join(CUBE_CACHE_DIR, "sales_cube-*.parquet")):
+            os.remove(stale)
+        sales_cube.save(cache_path)
+    return sales_cube
+
+sales_cube = get_sales_cube(DB_PATH, warehouse_version(DB_PATH))
+cube_data = sales_cube.cube
 
 # CSS Styling
 st.markdown("""
@@ -198,11 +310,11 @@ with st.sidebar:
     st.header("🎯 ตัวกรองข้อมูล")
     
     # แปลงเป็น int เพื่อไม่ให้ทศนิยม
-    year_options = [None] + sorted(list({int(y) for y in cube_data["year_date"].dropna().unique()}))
-    quarter_options = [None] + sorted(list({int(q) for q in cube_data["quarter_date"].dropna().unique()}))
-    month_options = [None] + sorted(list({int(m) for m in cube_data["month_date"].dropna().unique()}))
-    city_options = [None] + sorted(cube_data["city_customer"].dropna().unique().tolist())
-    category_options = [None] + sorted(cube_data["category_product"].dropna().unique().tolist())
+    year_options = [None] + [int(y) for y in sales_cube.index.values("year_date")]
+    quarter_options = [None] + [int(q) for q in sales_cube.index.values("quarter_date")]
+    month_options = [None] + [int(m) for m in sales_cube.index.values("month_date")]
+    city_options = [None] + sales_cube.index.values("city_customer")
+    category_options = [None] + sales_cube.index.values("category_product")
     
     year_filter = st.selectbox("📅 เลือกปี", options=year_options, index=0)
     quarter_filter = st.selectbox("📊 เลือกไตรมาส", options=quarter_options, index=0)
@@ -259,11 +371,9 @@ if not filtered_data.empty:
     with col1:
         # Top 10 Products
         top_products = (
-            filtered_data.groupby('product_name_product')['revenue']
-            .sum()
-            .sort_values(ascending=False)
+            filtered_data.aggregate('product_name_product', sums=['revenue'])
+            .sort_values('revenue', ascending=False)
             .head(10)
-            .reset_index()
         )
         
         fig_products = px.bar(
@@ -281,16 +391,14 @@ if not filtered_data.empty:
             xaxis_tickangle=-45,
             showlegend=False
         )
-        st.plotly_chart(fig_products, use_container_width=True)
+        plotly_chart(fig_products, use_container_width=True)
     
     with col2:
         # Sales by City
         city_sales = (
-            filtered_data.groupby('city_customer')['revenue']
-            .sum()
-            .sort_values(ascending=False)
+            filtered_data.aggregate('city_customer', sums=['revenue'])
+            .sort_values('revenue', ascending=False)
             .head(10)
-            .reset_index()
         )
         
         fig_city = px.bar(
@@ -308,7 +416,7 @@ if not filtered_data.empty:
             xaxis_tickangle=-45,
             showlegend=False
         )
-        st.plotly_chart(fig_city, use_container_width=True)
+        plotly_chart(fig_city, use_container_width=True)
 
     
 
@@ -318,11 +426,7 @@ if not filtered_data.empty:
 
     with col3:
         # Category Treemap
-        category_sales = (
-            filtered_data.groupby('category_product')['revenue']
-            .sum()
-            .reset_index()
-        )
+        category_sales = top_n_other(filtered_data.aggregate('category_product', sums=['revenue']), 'category_product', 'revenue', n=MAX_TREEMAP_LEAVES)
         
         fig_category = px.treemap(
             category_sales,
@@ -333,18 +437,11 @@ if not filtered_data.empty:
             color_continuous_scale='RdYlBu_r'
         )
         fig_category.update_layout(height=400, margin=dict(t=60, b=20, l=10, r=10))
-        st.plotly_chart(fig_category, use_container_width=True)
+        plotly_chart(fig_category, use_container_width=True)
   
     with col4:
         # Monthly Revenue vs Profit
-        monthly_financial = (
-            filtered_data.groupby('month_name_date')
-            .agg({
-                'revenue': 'sum',
-                'profit': 'sum'
-            })
-            .reset_index()
-        )
+        monthly_financial = filtered_data.aggregate('month_name_date', sums=['revenue', 'profit'])
         
         fig_financial = go.Figure()
         fig_financial.add_trace(go.Scatter(
@@ -370,7 +467,7 @@ if not filtered_data.empty:
             margin=dict(t=40, b=20, l=10, r=10),
             legend=dict(x=0.7, y=1)
         )
-        st.plotly_chart(fig_financial, use_container_width=True)
+        plotly_chart(fig_financial, use_container_width=True)
     
     # Additional Interactive Summary Table
     st.markdown("---")
@@ -380,15 +477,12 @@ if not filtered_data.empty:
         if len(filtered_data) > 0:
             # Create summary table
             summary_table = (
-                filtered_data.groupby(['category_product', 'city_customer'])
-                .agg({
-                    'revenue': 'sum',
-                    'profit': 'sum',
-                    'quantity': 'sum',
-                    'sale_id': 'nunique'
-                })
+                filtered_data.aggregate(
+                    ['category_product', 'city_customer'],
+                    sums=['revenue', 'profit', 'quantity'],
+                    nunique='sale_id'
+                )
                 .round(2)
-                .reset_index()
             )
             summary_table.columns = ['หมวดหมู่', 'เมือง', 'รายได้', 'กำไร', 'จำนวนสินค้า', 'คำสั่งซื้อ']
             
@@ -415,4 +509,7 @@ if not filtered_data.empty:
     
 else:
     st.warning("⚠️ ไม่มีข้อมูลที่ตรงกับเงื่อนไขการกรองที่เลือก")
-    st.info("💡 ลองปรับเงื่อนไขการกรองหรือรีเซ็ตตัวกรองเพื่อดูข้อมูลทั้งหมด")
\ No newline at end of file
+    st.info("💡 ลองปรับเงื่อนไขการกรองหรือรีเซ็ตตัวกรองเพื่อดูข้อมูลทั้งหมด")
+
+# เครื่องมือนักพัฒนา: เวลาแต่ละส่วน/อัตรา cache hit (เปิดด้วย BIKESTORE_INSTRUMENT=1)
+dev_panel()
\ No newline at end of file
@@ -1,9 +1,11 @@
 import streamlit as st
-import duckdb as dd
 import pandas as pd
 import numpy as np
 import plotly.express as px
 from datetime import datetime
+from analytics.dashboard import DB_PATH, get_warehouse, plotly_chart
+from analytics.sales import growth_rate
+from analytics.charts import MAX_TREEMAP_LEAVES, top_n_other
 
 # -----------------------------
 # ✅ Page Config & Theming
@@ -30,105 +32,26 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
-# -----------------------------
-# 🔧 Utils
-# -----------------------------
-@st.cache_data(show_spinner=False)
-def load_tables(db_path: str):
-    conn = dd.connect(db_path)
-    try:
-        dim_customers = conn.execute("SELECT * FROM dim_customers").fetchdf()
-        dim_date      = conn.execute("SELECT * FROM dim_date").fetchdf()
-        dim_staffs    = conn.execute("SELECT * FROM dim_staffs").fetchdf()
-        dim_products  = conn.execute("SELECT * FROM dim_products").fetchdf()
-        dim_brands    = conn.execute("SELECT * FROM dim_brands").fetchdf()
-        dim_categories= conn.execute("SELECT * FROM dim_categories").fetchdf()
-        dim_stores    = conn.execute("SELECT * FROM dim_stores").fetchdf()
-        fact_sales    = conn.execute("SELECT * FROM fact_sales").fetchdf()
-    finally:
-        conn.close()
-    return (
-        dim_customers, dim_date, dim_staffs, dim_products,
-        dim_brands, dim_categories, dim_stores, fact_sales
-    )
-
-
-def baht(x):
-    try:
-        return f"฿{x:,.0f}"
-    except Exception:
-        return "-"
-
-def pct(x):
-    try:
-        return f"{x*100:.1f}%"
-    except Exception:
-        return "-"
-
-
-def add_period_cols(df):
-    df = df.copy()
-    df['order_date'] = pd.to_datetime(df['order_date'])
-    df['year']   = df['order_date'].dt.year
-    df['quarter']= df['order_date'].dt.to_period('Q').astype(str)
-    df['month']  = df['order_date'].dt.to_period('M').astype(str)
-    df['date']   = df['order_date'].dt.date
-    return df
-
-
-def compute_net_sales(df):
-    df = df.copy()
-    # net_sales = quantity * list_price * (1 - discount)
-    df['net_sales'] = df['quantity'] * df['list_price'] * (1 - df['discount'])
-    return df
-
-
-def growth_rate(series: pd.Series):
-    if len(series) < 2:
-        return 0.0
-    prev, curr = series.iloc[-2], series.iloc[-1]
-    if prev == 0:
-        return np.nan
-    return (curr - prev) / prev
-
 # -----------------------------
 # 🎛️ Sidebar – ฟิลเตอร์
 # -----------------------------
 st.sidebar.title("⚙️ ตัวกรองข้อมูล")
 
 
-DB_PATH = r"/Users/mac/Downloads/Web/data_cube/bikestore.duckdb"
-
-
-(
-    dim_customers, dim_date, dim_staffs, dim_products,
-    dim_brands, dim_categories, dim_stores, fact_sales
-) = load_tables(DB_PATH)
+# โหลดครั้งเดียวต่อเวอร์ชันของ warehouse และแชร์ทุกหน้า/ทุก session (อ่านอย่างเดียว)
+wh = get_warehouse(DB_PATH)
 
-# ทำงานด้วย pandas ทั้งหมดเพื่อความสม่ำเสมอ
-customers = dim_customers.copy()
-products  = dim_products.copy()
-brands    = dim_brands.copy()
-categories= dim_categories.copy()
-stores    = dim_stores.copy()
-staffs    = dim_staffs.copy()
-sales     = fact_sales.copy()
-
-# เตรียมข้อมูลหลัก
-sales = compute_net_sales(sales)
-sales = add_period_cols(sales)
-
-# Join dims ที่จำเป็น
-products_lite = products[['product_id','product_name','category_id','brand_id']]
-sales = sales.merge(products_lite, on='product_id', how='left')
-sales = sales.merge(categories[['category_id','category_name']], on='category_id', how='left')
-sales = sales.merge(brands[['brand_id','brand_name']], on='brand_id', how='left')
-sales = sales.merge(stores[['store_id','store_name']], on='store_id', how='left')
-sales = sales.merge(customers[['customer_id','customer_city','customer_state']], on='customer_id', how='left')
+customers = wh.customers
+products  = wh.products
+brands    = wh.brands
+categories= wh.categories
+stores    = wh.stores
+staffs    = wh.staffs
+sales     = wh.sales
 
 # วันที่ min-max สำหรับฟิลเตอร์
-min_date = pd.to_datetime(sales['order_date']).min()
-max_date = pd.to_datetime(sales['order_date']).max()
+min_date = wh.min_date
+max_date = wh.max_date
 
 # ---- Controls ----
 period = st.sidebar.selectbox("หน่วยเวลา (สำหรับกราฟแนวโน้ม)", ["month","quarter","year"], index=0)
@@ -152,18 +75,7 @@ if st.sidebar.button("รีเซ็ตตัวกรอง"):
     st.experimental_rerun()
 
 # Apply Filters
-mask = (
-    (sales['order_date'].dt.date >= f_date[0]) &
-    (sales['order_date'].dt.date <= f_date[1])
-)
-if f_store:
-    mask &= sales['store_name'].isin(f_store)
-if f_brand:
-    mask &= sales['brand_name'].isin(f_brand)
-if f_category:
-    mask &= sales['category_name'].isin(f_category)
-
-f = sales.loc[mask].copy()
+f = wh.filter(f_date, f_store, f_brand, f_category)
 
 # -----------------------------
 # 🧭 Header
@@ -346,7 +258,7 @@ st.markdown("### แนวโน้มยอดขายและออเดอ
 #     )
 #     fig_trend.update_layout(template="plotly_white", legend_title_text="จำนวนออเดอร์")
 
-# st.plotly_chart(fig_trend, use_container_width=True)
+# plotly_chart(fig_trend, use_container_width=True)
 
 col1, col2 = st.columns(2)
 
@@ -358,7 +270,7 @@ with col1:
         labels={period: "ช่วงเวลา", "net_sales": "ยอดขายสุทธิ ($)"}
     )
     fig_sales.update_layout(template="plotly_white", legend_title_text="ยอดขายสุทธิ")
-    st.plotly_chart(fig_sales, use_container_width=True, key="sales_trend")
+    plotly_chart(fig_sales, use_container_width=True, key="sales_trend")
 
 with col2:
     fig_orders = px.line(
@@ -368,7 +280,7 @@ with col2:
         labels={period: "ช่วงเวลา", "orders": "จำนวนออเดอร์"}
     )
     fig_orders.update_layout(template="plotly_white", legend_title_text="จำนวนออเดอร์")
-    st.plotly_chart(fig_orders, use_container_width=True, key="orders_trend")
+    plotly_chart(fig_orders, use_container_width=True, key="orders_trend")
 
 
 # -----------------------------
@@ -408,7 +320,7 @@ with col1:
         showlegend=False,
         margin=dict(t=60, b=80)
     )
-    st.plotly_chart(fig_rev, use_container_width=True, key="top10_revenue")
+    plotly_chart(fig_rev, use_container_width=True, key="top10_revenue")
 
 with col2:
     fig_qty = px.bar(
@@ -431,7 +343,7 @@ with col2:
         showlegend=False,
         margin=dict(t=60, b=80)
     )
-    st.plotly_chart(fig_qty, use_container_width=True, key="top10_qty")
+    plotly_chart(fig_qty, use_container_width=True, key="top10_qty")
 
 tabs = st.tabs(["ตามรายได้", "ตามจำนวนชิ้น"])
 with tabs[0]:
@@ -455,7 +367,7 @@ with tabs[0]:
         showlegend=False,
         margin=dict(t=60, b=80)
     )
-    st.plotly_chart(fig_rev, use_container_width=True)
+    plotly_chart(fig_rev, use_container_width=True)
 with tabs[1]:
     fig_qty = px.bar(
         prod_qty,
@@ -477,7 +389,7 @@ with tabs[1]:
         showlegend=False,
         margin=dict(t=60, b=80)
     )
-    st.plotly_chart(fig_qty, use_container_width=True)
+    plotly_chart(fig_qty, use_container_width=True)
 # -----------------------------
 # 🧩 แบรนด์ × หมวดหมู่ (Treemap)
 # -----------------------------
@@ -486,9 +398,10 @@ st.markdown("### สัดส่วนยอดขายตามแบรนด
 brand_cat = (
     f.groupby(['brand_name','category_name'], as_index=False)['net_sales'].sum()
 )
+brand_cat = top_n_other(brand_cat, 'category_name', 'net_sales', n=MAX_TREEMAP_LEAVES, by='brand_name')
 fig_tree = px.treemap(brand_cat, path=['brand_name','category_name'], values='net_sales', title="Treemap: แบรนด์ × หมวดหมู่")
 fig_tree.update_layout(margin=dict(t=50,l=0,r=0,b=0))
-st.plotly_chart(fig_tree, use_container_width=True)
+plotly_chart(fig_tree, use_container_width=True)
 
 # -----------------------------
 # 💸 ผลของส่วนลดต่อปริมาณ/รายได้
@@ -518,7 +431,7 @@ with tabD1:
     )
     fig_dq.update_traces(textposition='auto', cliponaxis=True)
     fig_dq.update_layout(template="plotly_white", xaxis_title="ช่วงส่วนลด (%)", yaxis_title="ปริมาณที่ขายได้ (ชิ้น)")
-    st.plotly_chart(fig_dq, use_container_width=True)
+    plotly_chart(fig_dq, use_container_width=True)
 with tabD2:
     fig_ds = px.bar(
         disc,
@@ -530,4 +443,4 @@ with tabD2:
     )
     fig_ds.update_traces(texttemplate='%{text:,.0f}', textposition='auto', cliponaxis=True)
     fig_ds.update_layout(template="plotly_white", xaxis_title="ช่วงส่วนลด (%)", yaxis_title="รายได้ที่ขายได้ ($)")
-    st.plotly_chart(fig_ds, use_container_width=True)
\ No newline at end of file
+    plotly_chart(fig_ds, use_container_width=True)
\ No newline at end of file